@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-19 06:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+        ('api', '0006_tenant_shard'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='businessuser',
+            name='business',
+            field=models.OneToOneField(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='account', to='api.business'),
+        ),
+    ]
@@ -9,6 +9,8 @@ class BusinessUser(AbstractUser):
         null=True,
         blank=True,
         on_delete = models.CASCADE,
-        related_name = 'account'
-
+        related_name = 'account',
+        # The business may live on another tenant shard (see api.sharding),
+        # so the link cannot be a database-level foreign key.
+        db_constraint = False
     )
\ No newline at end of file
@@ -1,5 +1,6 @@
 from decimal import Decimal
 
+from django.test import override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
@@ -8,6 +9,7 @@ from accounts.models import BusinessUser
 from api.models import Business
 
 
+@override_settings(QUERY_BUDGET_MODE="raise")
 class BusinessSignupViewTests(APITestCase):
     def setUp(self):
         self.url = reverse("business-signup")
@@ -50,6 +52,7 @@ class BusinessSignupViewTests(APITestCase):
         self.assertIn("business_name", response.data)
 
 
+@override_settings(QUERY_BUDGET_MODE="raise")
 class BusinessAuthViewTests(APITestCase):
     def setUp(self):
         self.business = Business.objects.create(
@@ -95,6 +98,7 @@ class BusinessAuthViewTests(APITestCase):
         self.assertIn("detail", response.data)
 
 
+@override_settings(QUERY_BUDGET_MODE="raise")
 class CurrentUserViewTests(APITestCase):
     def setUp(self):
         self.business = Business.objects.create(
@@ -123,6 +127,7 @@ class CurrentUserViewTests(APITestCase):
         self.assertEqual(response.data["business"]["name"], self.business.name)
 
 
+@override_settings(QUERY_BUDGET_MODE="raise")
 class LogoutViewTests(APITestCase):
     def setUp(self):
         self.business = Business.objects.create(
@@ -148,6 +153,7 @@ class LogoutViewTests(APITestCase):
         self.assertEqual(me_response.status_code, status.HTTP_403_FORBIDDEN)
 
 
+@override_settings(QUERY_BUDGET_MODE="raise")
 class PasswordUpdateTests(APITestCase):
     def setUp(self):
         self.business = Business.objects.create(
@@ -28,6 +28,7 @@ def serialize_user(user: BusinessUser):
 class BusinessSignupView(APIView):
     authentication_class = []
     permission_classes = []
+    query_budget = 6
 
     def post(self, request):
         ser = BusinessSignupSerializer(data=request.data)
@@ -68,6 +69,7 @@ class LoginSerializer(serializers.Serializer):
 class BusinessLoginView(APIView):
     authentication_classes = []
     permission_classes = [AllowAny]
+    query_budget = 12
 
     def post(self, request):
         serializer = LoginSerializer(data=request.data)
@@ -93,6 +95,7 @@ class BusinessLoginView(APIView):
 
 class CurrentUserView(APIView):
     permission_classes = [IsAuthenticated]
+    query_budget = 3
 
     def get(self, request):
         return Response(serialize_user(request.user))
@@ -100,6 +103,7 @@ class CurrentUserView(APIView):
 
 class BusinessLogoutView(APIView):
     permission_classes = [IsAuthenticated]
+    query_budget = 4
 
     def post(self, request):
         logout(request)
@@ -113,6 +117,7 @@ class PasswordUpdateSerializer(serializers.Serializer):
 
 class PasswordUpdateView(APIView):
     permission_classes = [IsAuthenticated]
+    query_budget = 4
 
     def post(self, request):
         serializer = PasswordUpdateSerializer(data=request.data)
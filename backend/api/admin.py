@@ -1,5 +1,15 @@
 from django.contrib import admin
-from .models import Business, Customer, BusinessCustomer, LoyaltyCard, Station, Transaction, PassRegistration
+from .models import (
+    Business,
+    BusinessCustomer,
+    Customer,
+    DeviceLog,
+    LoyaltyCard,
+    PassRegistration,
+    PreparedPass,
+    Station,
+    Transaction,
+)
 
 
 @admin.register(Business)
@@ -17,6 +27,7 @@ class CustomerAdmin(admin.ModelAdmin):
 @admin.register(BusinessCustomer)
 class BusinessCustomerAdmin(admin.ModelAdmin):
     list_display = ("business", "customer")
+    list_select_related = ("business", "customer")
     list_filter = ("business",)
     search_fields = ("customer__name", "customer__phone_number")
 
@@ -24,6 +35,7 @@ class BusinessCustomerAdmin(admin.ModelAdmin):
 @admin.register(LoyaltyCard)
 class LoyaltyCardAdmin(admin.ModelAdmin):
     list_display = ("token", "get_business", "get_customer", "points_balance", "wallet_status", "apple_auth_token")
+    list_select_related = ("business_customer__business", "business_customer__customer")
     list_filter = ("business_customer__business", "wallet_status")
     search_fields = ("business_customer__customer__name", "business_customer__customer__phone_number")
 
@@ -39,14 +51,23 @@ class LoyaltyCardAdmin(admin.ModelAdmin):
 @admin.register(Station)
 class StationAdmin(admin.ModelAdmin):
     list_display = ("name", "business", "api_token")
+    list_select_related = ("business",)
     readonly_fields = ("api_token",)
     list_filter = ("business",)
     search_fields = ("name", "business__name")
 
 
+@admin.register(PreparedPass)
+class PreparedPassAdmin(admin.ModelAdmin):
+    list_display = ("station", "loyalty_card", "expires_at", "claimed_at")
+    list_select_related = ("station", "loyalty_card__business_customer__customer")
+    list_filter = ("station",)
+
+
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
     list_display = ("id", "loyalty_card", "station", "amount", "points_earned", "created_at")
+    list_select_related = ("loyalty_card__business_customer__customer", "station__business")
     list_filter = ("created_at", "station")
     search_fields = (
         "loyalty_card__business_customer__customer__name",
@@ -57,5 +78,13 @@ class TransactionAdmin(admin.ModelAdmin):
 @admin.register(PassRegistration)
 class PassRegistrationAdmin(admin.ModelAdmin):
     list_display = ("loyalty_card", "device_library_identifier", "pass_type_identifier", "updated_at")
+    list_select_related = ("loyalty_card__business_customer__customer",)
     search_fields = ("device_library_identifier", "loyalty_card__token")
 
+
+
+@admin.register(DeviceLog)
+class DeviceLogAdmin(admin.ModelAdmin):
+    list_display = ("received_at", "fingerprint")
+    list_filter = ("received_at",)
+    search_fields = ("message",)
@@ -0,0 +1,243 @@
+"""
+A local stand-in for Apple's push service.
+
+The stub speaks the APNs provider API over cleartext HTTP/2 (prior
+knowledge, no TLS). Point APNS_ENDPOINT at `ApnsStub().url` and Wallet
+update pushes land here instead of on Apple's hosts. Requests are checked
+the way APNs checks them (method, path, provider token shape, topic and
+device token) and answered with APNs status codes and reasons; latency,
+410 Unregistered and 429 TooManyRequests answers can be injected at
+configurable rates. Every request is kept in `received`.
+"""
+
+import json
+import random
+import re
+import socketserver
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+
+import h2.config
+import h2.connection
+import h2.events
+import h2.exceptions
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+DEVICE_PATH_PREFIX = "/3/device/"
+DEVICE_TOKEN = re.compile(r"[0-9a-fA-F]{64}")
+# APNs rejects provider tokens issued more than an hour ago.
+TOKEN_MAX_AGE = 60 * 60
+
+
+@dataclass(frozen=True)
+class ReceivedPush:
+    device_token: str
+    topic: str
+    push_type: str
+    authorization: str
+    status: int
+    reason: str = ""
+
+
+def provider_token_problem(authorization, now=None):
+    """The APNs reason a provider token would be rejected with, or None."""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return "MissingProviderToken"
+    try:
+        header = jwt.get_unverified_header(token)
+        claims = jwt.decode(token, options={"verify_signature": False})
+    except jwt.PyJWTError:
+        return "InvalidProviderToken"
+    if header.get("alg") != "ES256" or not header.get("kid") or not claims.get("iss"):
+        return "InvalidProviderToken"
+    issued_at = claims.get("iat")
+    if not isinstance(issued_at, int):
+        return "InvalidProviderToken"
+    if (now if now is not None else time.time()) - issued_at > TOKEN_MAX_AGE:
+        return "ExpiredProviderToken"
+    return None
+
+
+class _Connection(socketserver.BaseRequestHandler):
+    def setup(self):
+        self.stub = self.server.stub
+        self.h2 = h2.connection.H2Connection(
+            config=h2.config.H2Configuration(client_side=False, header_encoding="utf-8")
+        )
+        self.lock = threading.Lock()
+        self.streams = {}
+
+    def handle(self):
+        with self.lock:
+            self.h2.initiate_connection()
+            self.request.sendall(self.h2.data_to_send())
+        while True:
+            try:
+                data = self.request.recv(65535)
+            except OSError:
+                return
+            if not data:
+                return
+            try:
+                with self.lock:
+                    events = self.h2.receive_data(data)
+            except h2.exceptions.ProtocolError:
+                # Not an HTTP/2 client (APNs has no HTTP/1.1 fallback either).
+                return
+            for event in events:
+                if isinstance(event, h2.events.RequestReceived):
+                    self.streams[event.stream_id] = dict(event.headers)
+                elif isinstance(event, h2.events.DataReceived):
+                    with self.lock:
+                        self.h2.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                elif isinstance(event, h2.events.StreamEnded):
+                    self.stub.dispatch(self, event.stream_id, self.streams.pop(event.stream_id, {}))
+                elif isinstance(event, h2.events.ConnectionTerminated):
+                    self._flush()
+                    return
+            self._flush()
+
+    def _flush(self):
+        with self.lock:
+            data = self.h2.data_to_send()
+            if data:
+                self.request.sendall(data)
+
+    def respond(self, stream_id, status, body=None):
+        headers = [(":status", str(status)), ("apns-id", str(uuid.uuid4()).upper())]
+        payload = json.dumps(body).encode() if body else b""
+        if payload:
+            headers.append(("content-type", "application/json"))
+        try:
+            with self.lock:
+                self.h2.send_headers(stream_id, headers, end_stream=not payload)
+                if payload:
+                    self.h2.send_data(stream_id, payload, end_stream=True)
+                self.request.sendall(self.h2.data_to_send())
+        except (OSError, h2.exceptions.ProtocolError):
+            # The client went away while the answer was delayed.
+            pass
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ApnsStub:
+    def __init__(self, host="127.0.0.1", port=0, topic=None, latency_ms=0.0, jitter_ms=0.0,
+                 unregistered_rate=0.0, throttle_rate=0.0, seed=None):
+        self.topic = topic
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.unregistered_rate = unregistered_rate
+        self.throttle_rate = throttle_rate
+        self._rng = random.Random(seed)
+        self._server = _Server((host, port), _Connection)
+        self._server.stub = self
+        self._thread = None
+        self._lock = threading.Lock()
+        self.received = []
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def counts(self):
+        """Requests answered so far, by status code."""
+        with self._lock:
+            return Counter(push.status for push in self.received)
+
+    def _answer(self, headers):
+        if headers.get(":method") != "POST":
+            return 405, "MethodNotAllowed"
+        path = headers.get(":path", "")
+        if not path.startswith(DEVICE_PATH_PREFIX):
+            return 404, "BadPath"
+        problem = provider_token_problem(headers.get("authorization"))
+        if problem:
+            return 403, problem
+        topic = headers.get("apns-topic")
+        if not topic:
+            return 400, "MissingTopic"
+        if self.topic and topic != self.topic:
+            return 400, "TopicDisallowed"
+        if not DEVICE_TOKEN.fullmatch(path[len(DEVICE_PATH_PREFIX):]):
+            return 400, "BadDeviceToken"
+        roll = self._rng.random()
+        if roll < self.throttle_rate:
+            return 429, "TooManyRequests"
+        if roll < self.throttle_rate + self.unregistered_rate:
+            return 410, "Unregistered"
+        return 200, ""
+
+    def dispatch(self, connection, stream_id, headers):
+        with self._lock:
+            status, reason = self._answer(headers)
+            delay = max(self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms), 0) / 1000
+            self.received.append(
+                ReceivedPush(
+                    device_token=headers.get(":path", "")[len(DEVICE_PATH_PREFIX):],
+                    topic=headers.get("apns-topic", ""),
+                    push_type=headers.get("apns-push-type", ""),
+                    authorization=headers.get("authorization", ""),
+                    status=status,
+                    reason=reason,
+                )
+            )
+        body = None
+        if reason:
+            body = {"reason": reason}
+            if status == 410:
+                body["timestamp"] = int(time.time() * 1000)
+        if delay:
+            # Delayed answers must not hold up other streams on the connection.
+            threading.Timer(delay, connection.respond, (stream_id, status, body)).start()
+        else:
+            connection.respond(stream_id, status, body)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="apns-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def settings(self, directory):
+        """
+        Settings that send this process's pushes to the stub, signed with a
+        throwaway ES256 key written to `directory`.
+        """
+        key = ec.generate_private_key(ec.SECP256R1())
+        path = Path(directory) / "apns-stub.p8"
+        path.write_bytes(
+            key.private_bytes(
+                serialization.Encoding.PEM,
+                serialization.PrivateFormat.PKCS8,
+                serialization.NoEncryption(),
+            )
+        )
+        return {
+            "APNS_ENDPOINT": self.url,
+            "APNS_AUTH_KEY_PATH": str(path),
+            "APNS_KEY_ID": "STUBKEY000",
+            "APNS_TEAM_ID": "STUBTEAM00",
+        }
@@ -0,0 +1,210 @@
+import json
+import shutil
+from dataclasses import dataclass
+from datetime import date, datetime, timezone as dt_timezone
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .models import Transaction
+
+
+ARCHIVE_CHUNK_SIZE = 5000
+
+# name -> dtype; every column is a flat .npy array with one slot per transaction.
+COLUMNS = {
+    "created_at": np.int64,  # microseconds since the Unix epoch, UTC
+    "amount_cents": np.int64,
+    "final_amount_cents": np.int64,
+    "points_earned": np.uint32,
+    "points_redeemed": np.uint32,
+    "station": np.int32,  # index into meta.json "stations"
+}
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def archive_root(root=None) -> Path:
+    configured = root or getattr(settings, "TRANSACTION_ARCHIVE_DIR", "")
+    path = Path(configured) if configured else Path(settings.BASE_DIR) / "archive"
+    if not path.is_absolute():
+        path = Path(settings.BASE_DIR) / path
+    return path
+
+
+def month_start(value: date) -> datetime:
+    return datetime(value.year, value.month, 1, tzinfo=dt_timezone.utc)
+
+
+def next_month(value: datetime) -> datetime:
+    if value.month == 12:
+        return value.replace(year=value.year + 1, month=1)
+    return value.replace(month=value.month + 1)
+
+
+def period_label(start: datetime) -> str:
+    return f"{start:%Y-%m}"
+
+
+def period_dir(business_id, start: datetime, root=None) -> Path:
+    return archive_root(root) / str(business_id) / period_label(start)
+
+
+def _to_micros(value: datetime) -> int:
+    delta = value - datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def _to_cents(value) -> int:
+    return int(value.scaleb(2))
+
+
+def export_period(business_id, start: datetime, root=None, overwrite=False) -> int:
+    """
+    Write one calendar month of a business's transactions as column files.
+    Returns the number of rows archived.
+    """
+    end = next_month(start)
+    target = period_dir(business_id, start, root)
+    if target.exists():
+        if not overwrite:
+            raise ArchiveError(f"{target} already exists.")
+        shutil.rmtree(target)
+
+    queryset = Transaction.objects.filter(
+        business_id=business_id,
+        created_at__gte=start,
+        created_at__lt=end,
+    ).order_by("created_at")
+    total = queryset.count()
+
+    columns = {name: np.empty(total, dtype=dtype) for name, dtype in COLUMNS.items()}
+    station_index = {}
+    rows = queryset.values_list(
+        "created_at", "amount", "final_amount", "points_earned", "points_redeemed", "station_id"
+    ).iterator(chunk_size=ARCHIVE_CHUNK_SIZE)
+    position = 0
+    for created_at, amount, final_amount, earned, redeemed, station_id in rows:
+        if position == total:
+            break  # rows inserted after the count belong to the next run
+        columns["created_at"][position] = _to_micros(created_at)
+        columns["amount_cents"][position] = _to_cents(amount)
+        columns["final_amount_cents"][position] = _to_cents(final_amount)
+        columns["points_earned"][position] = earned
+        columns["points_redeemed"][position] = redeemed
+        columns["station"][position] = station_index.setdefault(station_id, len(station_index))
+        position += 1
+
+    # Write into a sibling directory and rename so readers never see a half-written period.
+    staging = target.with_name(target.name + ".partial")
+    if staging.exists():
+        shutil.rmtree(staging)
+    staging.mkdir(parents=True)
+    for name, values in columns.items():
+        np.save(staging / f"{name}.npy", values[:position])
+    meta = {
+        "business_id": str(business_id),
+        "period": period_label(start),
+        "rows": position,
+        "stations": [str(station_id) for station_id in station_index],
+    }
+    with open(staging / "meta.json", "w", encoding="utf-8") as meta_file:
+        json.dump(meta, meta_file)
+    staging.rename(target)
+    return position
+
+
+@dataclass
+class ArchivedPeriod:
+    path: Path
+    meta: dict
+
+    @classmethod
+    def open(cls, path: Path) -> "ArchivedPeriod":
+        with open(path / "meta.json", encoding="utf-8") as meta_file:
+            return cls(path=path, meta=json.load(meta_file))
+
+    def column(self, name: str) -> np.ndarray:
+        # Memory-mapped, so only the pages a report touches are read from disk.
+        return np.load(self.path / f"{name}.npy", mmap_mode="r")
+
+    def window(self, start_us=None, end_us=None) -> slice:
+        created = self.column("created_at")
+        lo = 0 if start_us is None else int(np.searchsorted(created, start_us, side="left"))
+        hi = len(created) if end_us is None else int(np.searchsorted(created, end_us, side="left"))
+        return slice(lo, hi)
+
+
+def archived_periods(business_id, start: datetime = None, end: datetime = None, root=None):
+    business_dir = archive_root(root) / str(business_id)
+    if not business_dir.is_dir():
+        return []
+    periods = []
+    for path in sorted(business_dir.iterdir()):
+        if path.suffix == ".partial" or not (path / "meta.json").exists():
+            continue
+        period_start = datetime.strptime(path.name, "%Y-%m").replace(tzinfo=dt_timezone.utc)
+        if end is not None and period_start >= end:
+            continue
+        if start is not None and next_month(period_start) <= start:
+            continue
+        periods.append(ArchivedPeriod.open(path))
+    return periods
+
+
+def summarize(business_id, start: datetime = None, end: datetime = None, root=None) -> dict:
+    """
+    Revenue and points totals over archived periods, optionally clipped to
+    [start, end). Only the archive files are read.
+    """
+    start_us = _to_micros(start) if start else None
+    end_us = _to_micros(end) if end else None
+    totals = {
+        "transactions": 0,
+        "revenue_cents": 0,
+        "final_revenue_cents": 0,
+        "points_earned": 0,
+        "points_redeemed": 0,
+    }
+    stations = {}
+    for period in archived_periods(business_id, start, end, root):
+        window = period.window(start_us, end_us)
+        amounts = period.column("amount_cents")[window]
+        totals["transactions"] += len(amounts)
+        totals["revenue_cents"] += int(amounts.sum(dtype=np.int64))
+        totals["final_revenue_cents"] += int(period.column("final_amount_cents")[window].sum(dtype=np.int64))
+        totals["points_earned"] += int(period.column("points_earned")[window].sum(dtype=np.int64))
+        totals["points_redeemed"] += int(period.column("points_redeemed")[window].sum(dtype=np.int64))
+
+        station_ids = period.meta["stations"]
+        if station_ids:
+            per_station = np.bincount(
+                period.column("station")[window],
+                weights=amounts,
+                minlength=len(station_ids),
+            )
+            for station_id, cents in zip(station_ids, per_station):
+                stations[station_id] = stations.get(station_id, 0) + int(cents)
+
+    totals["revenue_by_station_cents"] = stations
+    return totals
+
+
+def daily_revenue(business_id, start: datetime = None, end: datetime = None, root=None) -> dict:
+    start_us = _to_micros(start) if start else None
+    end_us = _to_micros(end) if end else None
+    per_day = {}
+    for period in archived_periods(business_id, start, end, root):
+        window = period.window(start_us, end_us)
+        days = period.column("created_at")[window] // 86_400_000_000
+        if not len(days):
+            continue
+        first_day = int(days[0])
+        buckets = np.bincount(days - first_day, weights=period.column("amount_cents")[window])
+        for offset in np.flatnonzero(buckets):
+            day = date.fromordinal(date(1970, 1, 1).toordinal() + first_day + int(offset))
+            per_day[day] = per_day.get(day, 0) + int(buckets[offset])
+    return per_day
@@ -0,0 +1,83 @@
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .models import Business
+from .synthetic import DatasetPlan, business_ids, generate_dataset
+
+
+_scratch_aliases = set()
+
+
+def is_scratch_database(alias=DEFAULT_DB_ALIAS):
+    """
+    True if `alias` is safe to wipe: opened by scratch_database, or an
+    in-memory SQLite database (as in tests).
+    """
+    connection = connections[alias]
+    in_memory = getattr(connection.creation, "is_in_memory_db", None)
+    return alias in _scratch_aliases or bool(in_memory and in_memory(connection.settings_dict["NAME"]))
+
+
+@contextmanager
+def scratch_database(alias=DEFAULT_DB_ALIAS, name=None):
+    """
+    Swap the connection over to a freshly migrated throwaway database so
+    benchmarks never write into the configured one. Pass `name` (a file
+    path for SQLite) when other threads must share it; SQLite's default
+    test database lives in memory.
+    """
+    connection = connections[alias]
+    original_name = connection.settings_dict["NAME"]
+    test_settings = connection.settings_dict.setdefault("TEST", {})
+    original_test_name = test_settings.get("NAME")
+    if name is not None:
+        test_settings["NAME"] = name
+    try:
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        _scratch_aliases.add(alias)
+        try:
+            yield connection
+        finally:
+            _scratch_aliases.discard(alias)
+            connection.creation.destroy_test_db(original_name, verbosity=0)
+    finally:
+        test_settings["NAME"] = original_test_name
+
+
+def measure(func, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def median_ms(timings):
+    return statistics.median(timings) * 1000
+
+
+def populate_transactions(total, businesses=20, stations_per_business=4, cards_per_business=500,
+                          span_days=365, batch_size=10000, seed=0):
+    """
+    Evenly spread synthetic transactions (see api.synthetic) for benchmarks
+    that compare queries rather than model realistic skew. Returns the
+    businesses in generation order.
+    """
+    plan = DatasetPlan(
+        businesses=businesses,
+        stations_per_business=stations_per_business,
+        cards_per_business=cards_per_business,
+        transactions=total,
+        span_days=span_days,
+        skew=0.0,
+        wallet_share=0.0,
+        batch_size=batch_size,
+        seed=seed,
+    )
+    generate_dataset(plan)
+    by_id = Business.objects.in_bulk(business_ids(plan))
+    return [by_id[business_id] for business_id in business_ids(plan)]
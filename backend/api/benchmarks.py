@@ -0,0 +1,295 @@
+"""
+Micro and macro benchmarks for the backend hot paths.
+
+Each benchmark prepares its data for one scale and hands back the callable
+to time; `run_benchmarks` times every case and returns one result per
+"name[scale]" key. Results are stored as JSON baselines by
+`manage.py run_benchmarks --save` and compared with `compare_benchmarks`.
+"""
+
+import platform
+import secrets
+import statistics
+import subprocess
+import tempfile
+import uuid
+from contextlib import ExitStack
+from dataclasses import dataclass
+from decimal import Decimal
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import BusinessUser
+from .apns_stub import ApnsStub
+from .bench import is_scratch_database, measure, populate_transactions
+from .models import Business, BusinessCustomer, Customer, LoyaltyCard, PassRegistration, Station
+from .passkit import _build_pass_json, build_pkpass, ensure_card_auth_token, list_serial_numbers
+from .push import PassRegistrationPayload, send_wallet_pass_update
+from .qr import qr_image
+
+DASHBOARD_SCALES = (10_000, 100_000, 1_000_000)
+REGISTRATION_SCALES = (1_000, 10_000)
+PUSH_SCALES = (1, 20)
+DEFAULT_REPEAT = 20
+DEFAULT_THRESHOLD = 0.10
+
+
+@dataclass(frozen=True)
+class Benchmark:
+    name: str
+    prepare: object
+    scales: tuple = (None,)
+    repeat: int = DEFAULT_REPEAT
+
+
+BENCHMARKS = {}
+
+
+def benchmark(name, scales=(None,), repeat=DEFAULT_REPEAT):
+    def register(prepare):
+        BENCHMARKS[name] = Benchmark(name, prepare, tuple(scales), repeat)
+        return prepare
+
+    return register
+
+
+def case_key(name, scale):
+    return name if scale is None else f"{name}[{scale}]"
+
+
+def summarize_timings(timings):
+    ms = sorted(value * 1000 for value in timings)
+    return {
+        "rounds": len(ms),
+        "median_ms": round(statistics.median(ms), 4),
+        "min_ms": round(ms[0], 4),
+        "max_ms": round(ms[-1], 4),
+        "stdev_ms": round(statistics.stdev(ms), 4) if len(ms) > 1 else 0.0,
+    }
+
+
+def run_benchmarks(names=None, max_scale=None, repeat=None, log=None):
+    """
+    Run the selected benchmarks against the current default database and
+    return {case: summary}. Every case flushes that database first, so it
+    must be a scratch one (see api.bench.scratch_database); anything else
+    raises ValueError before a row is touched.
+    """
+    if not is_scratch_database():
+        raise ValueError("Benchmarks flush the default database; open it with scratch_database() first.")
+    results = {}
+    for name, bench in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        for scale in bench.scales:
+            if scale is not None and max_scale is not None and scale > max_scale:
+                continue
+            key = case_key(name, scale)
+            if log:
+                log(f"Running {key}...")
+            # Every case starts from empty tables so earlier fixtures never skew it.
+            call_command("flush", interactive=False, verbosity=0)
+            with ExitStack() as stack:
+                func = bench.prepare(stack, scale)
+                func()  # warm-up round, not recorded
+                results[key] = summarize_timings(measure(func, repeat or bench.repeat))
+    return results
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "recorded_at": timezone.now().isoformat(),
+    }
+
+
+def compare_results(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    One row per case present in both runs: (case, baseline ms, current ms,
+    relative change, regressed?). A case regresses when its median grew by
+    more than `threshold` (0.10 = 10%).
+    """
+    rows = []
+    for key in sorted(set(baseline) & set(current)):
+        before = baseline[key]["median_ms"]
+        after = current[key]["median_ms"]
+        change = (after - before) / before if before else 0.0
+        rows.append((key, before, after, change, change > threshold))
+    return rows
+
+
+# -- fixtures -----------------------------------------------------------------
+
+
+_sequence = iter(range(10**9))
+
+
+def _tenant(business=None):
+    """A business (new unless given) with an owner, a station and one card."""
+    serial = next(_sequence)
+    if business is None:
+        business = Business.objects.create(
+            name=f"Bench Tenant {serial}",
+            reward_rate=Decimal("1.000"),
+            redemption_points=10,
+            redemption_rate=Decimal("0.10"),
+            logo_url="https://example.com/logo.png",
+        )
+    user = BusinessUser.objects.create_user(username=f"bench-owner-{serial}", password="unused", business=business)
+    station = Station.objects.create(business=business, name=f"Bench Register {serial}")
+    customer = Customer.objects.create(name="Bench Customer", phone_number=f"+1999{serial:07d}")
+    bc = BusinessCustomer.objects.create(business=business, customer=customer)
+    card = LoyaltyCard.objects.create(business_customer=bc, points_balance=1_000_000)
+    ensure_card_auth_token(card)
+    client = APIClient()
+    client.force_authenticate(user=user)
+    return client, station, card
+
+
+def _card_for_pass(card):
+    return LoyaltyCard.objects.select_related("business_customer__business", "business_customer__customer").get(
+        pk=card.pk
+    )
+
+
+def _signing_materials(directory):
+    """Generate a throwaway certificate so the signing path can be timed without Apple's."""
+    directory = Path(directory)
+    key, cert = directory / "key.pem", directory / "cert.pem"
+    commands = [
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-keyout", key, "-out", cert,
+         "-subj", "/CN=benchmark", "-days", "1"],
+        ["openssl", "pkcs12", "-export", "-in", cert, "-inkey", key, "-out", directory / "cert.p12",
+         "-passout", "pass:benchmark"],
+        ["openssl", "x509", "-in", cert, "-outform", "DER", "-out", directory / "wwdr.der"],
+    ]
+    for command in commands:
+        subprocess.run([str(part) for part in command], check=True, capture_output=True)
+    return {
+        "APPLE_PASS_CERT_PATH": str(directory / "cert.p12"),
+        "APPLE_PASS_CERT_PASSWORD": "benchmark",
+        "APPLE_PASS_WWDR_CERT_PATH": str(directory / "wwdr.der"),
+    }
+
+
+# -- benchmarks ---------------------------------------------------------------
+
+
+@benchmark("pass_json", repeat=200)
+def _pass_json(stack, scale):
+    card = _card_for_pass(_tenant()[2])
+    return lambda: _build_pass_json(card)
+
+
+@benchmark("build_pkpass_unsigned")
+def _build_pkpass_unsigned(stack, scale):
+    stack.enter_context(override_settings(APPLE_PASS_CERT_PATH="", APPLE_PASS_WWDR_CERT_PATH=""))
+    card = _card_for_pass(_tenant()[2])
+    return lambda: build_pkpass(card)
+
+
+@benchmark("build_pkpass_signed", repeat=10)
+def _build_pkpass_signed(stack, scale):
+    directory = stack.enter_context(tempfile.TemporaryDirectory())
+    stack.enter_context(override_settings(**_signing_materials(directory)))
+    card = _card_for_pass(_tenant()[2])
+    return lambda: build_pkpass(card)
+
+
+def _create_transaction(redeem):
+    def prepare(stack, scale):
+        client, station, card = _tenant()
+        url = reverse("transaction-list")
+        payload = {"loyalty_card_id": str(card.pk), "amount": "20.00", "redeem": redeem}
+
+        def create():
+            response = client.post(url, payload, format="json", HTTP_X_STATION_TOKEN=station.api_token)
+            assert response.status_code == 201, response.content
+
+        return create
+
+    return prepare
+
+
+benchmark("transaction_create")(_create_transaction(redeem=False))
+benchmark("transaction_create_redeem")(_create_transaction(redeem=True))
+
+
+@benchmark("qr_png_uncached")
+def _qr_png_uncached(stack, scale):
+    # The view serves repeats from qr_image's LRU; this times a miss.
+    tokens = (str(uuid.uuid4()) for _ in iter(int, 1))
+    return lambda: qr_image.__wrapped__(next(tokens), "png", "medium")
+
+
+@benchmark("loyalty_card_issue")
+def _loyalty_card_issue(stack, scale):
+    client, station, _ = _tenant()
+    url = reverse("loyaltycard-issue")
+    phones = (f"+1555{index:07d}" for index in range(10**7))
+
+    def issue():
+        payload = {"customer_name": "Walk In", "phone_number": next(phones)}
+        response = client.post(url, payload, format="json", HTTP_X_STATION_TOKEN=station.api_token)
+        assert response.status_code == 201, response.content
+
+    return issue
+
+
+def _dashboard(url_name):
+    def prepare(stack, scale):
+        businesses = populate_transactions(scale, businesses=10, cards_per_business=200)
+        client = _tenant(businesses[0])[0]
+        url = reverse(url_name)
+
+        def load():
+            response = client.get(url)
+            assert response.status_code == 200, response.content
+
+        return load
+
+    return prepare
+
+
+benchmark("dashboard_metrics", scales=DASHBOARD_SCALES, repeat=5)(_dashboard("dashboard-metrics"))
+benchmark("dashboard_detail", scales=DASHBOARD_SCALES, repeat=5)(_dashboard("dashboard-data"))
+
+
+@benchmark("list_serial_numbers", scales=REGISTRATION_SCALES, repeat=10)
+def _list_serial_numbers(stack, scale):
+    business = populate_transactions(0, businesses=1, stations_per_business=1, cards_per_business=scale)[0]
+    cards = LoyaltyCard.objects.filter(business_customer__business=business).values_list("pk", flat=True)
+    pass_type = settings.APPLE_PASS_TYPE_IDENTIFIER
+    PassRegistration.objects.bulk_create(
+        PassRegistration(
+            loyalty_card_id=card_id,
+            device_library_identifier="bench-device",
+            pass_type_identifier=pass_type,
+            push_token="bench-push",
+        )
+        for card_id in cards
+    )
+    return lambda: list_serial_numbers("bench-device", pass_type, None)
+
+
+@benchmark("apns_push", scales=PUSH_SCALES, repeat=10)
+def _apns_push(stack, scale):
+    # One card update fanned out to `scale` registered devices, answered by the local stub.
+    directory = stack.enter_context(tempfile.TemporaryDirectory())
+    stub = stack.enter_context(ApnsStub())
+    stack.enter_context(override_settings(**stub.settings(directory)))
+    payloads = [
+        PassRegistrationPayload(push_token=secrets.token_hex(32), serial_number=f"bench-{index}")
+        for index in range(scale)
+    ]
+    return lambda: send_wallet_pass_update(payloads)
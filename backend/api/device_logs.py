@@ -0,0 +1,169 @@
+"""
+Apple Wallet device logs, buffered in memory and written in batches.
+
+Devices POST `{"logs": [...]}` to the PassKit log endpoint when a pass
+fails to update. Those requests must stay cheap, so the view only appends
+the lines to a ring buffer: a bounded deque that drops its oldest lines
+when writes fall behind. A daemon thread started on first use drains the
+buffer into the DeviceLog table every PASSKIT_LOG_FLUSH_SECONDS, or sooner
+once a batch is waiting, and trims rows older than the retention window
+about once an hour. With PASSKIT_LOG_FLUSH_SECONDS = 0 no thread runs and
+lines stay buffered until flush() is called.
+
+Each line is stored with a fingerprint that masks its timestamps, URLs,
+identifiers and numbers, so `manage.py device_log_report` can group equal
+failures with one GROUP BY.
+"""
+
+import atexit
+import logging
+import re
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from server.metrics import REGISTRY
+
+from .models import DeviceLog
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_LENGTH = DeviceLog._meta.get_field("message").max_length
+FINGERPRINT_LENGTH = DeviceLog._meta.get_field("fingerprint").max_length
+PURGE_INTERVAL_SECONDS = 3600
+
+_MASKS = (
+    (re.compile(r"^\[[^\]]*\]\s*"), ""),
+    (re.compile(r"\bhttps?://[^\s()<>\[\]]+"), "<url>"),
+    (re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.IGNORECASE), "<uuid>"),
+    (re.compile(r"\b(?=[0-9a-f]*\d)[0-9a-f]{16,}\b", re.IGNORECASE), "<hex>"),
+    (re.compile(r"\d+(?:\.\d+)*"), "<n>"),
+    (re.compile(r"\s+"), " "),
+)
+
+device_log_lines = REGISTRY.counter(
+    "passkit_device_log_lines_total",
+    "Device log lines by outcome: buffered, dropped (buffer full or write failed) or written.",
+    ("outcome",),
+)
+
+
+def fingerprint(message):
+    """`message` with its variable parts masked."""
+    for pattern, replacement in _MASKS:
+        message = pattern.sub(replacement, message)
+    return message.strip()[:FINGERPRINT_LENGTH]
+
+
+class DeviceLogBuffer:
+    def __init__(self, capacity=None, batch_size=None, flush_seconds=None):
+        self.capacity = capacity if capacity is not None else settings.PASSKIT_LOG_BUFFER_SIZE
+        self.batch_size = batch_size if batch_size is not None else settings.PASSKIT_LOG_BATCH_SIZE
+        self._flush_seconds = flush_seconds
+        self._lines = deque(maxlen=self.capacity)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._last_purge = 0.0
+
+    @property
+    def flush_seconds(self):
+        # Read on use: the shared buffer is built at import, before tests override settings.
+        return self._flush_seconds if self._flush_seconds is not None else settings.PASSKIT_LOG_FLUSH_SECONDS
+
+    def __len__(self):
+        return len(self._lines)
+
+    def append(self, messages):
+        """Buffer the string entries of `messages`; never touches the database."""
+        now = timezone.now()
+        lines = [
+            (now, message[:MESSAGE_LENGTH])
+            for message in messages[:settings.PASSKIT_LOG_MAX_LINES]
+            if isinstance(message, str) and message.strip()
+        ]
+        if not lines:
+            return
+        with self._lock:
+            dropped = max(0, len(self._lines) + len(lines) - self.capacity)
+            self._lines.extend(lines)
+            pending = len(self._lines)
+        device_log_lines.inc(len(lines), outcome="buffered")
+        if dropped:
+            device_log_lines.inc(dropped, outcome="dropped")
+        if self.flush_seconds > 0:
+            self._ensure_thread()
+            if pending >= self.batch_size:
+                self._wake.set()
+
+    def _take(self):
+        with self._lock:
+            return [self._lines.popleft() for _ in range(min(self.batch_size, len(self._lines)))]
+
+    def flush(self):
+        """Write everything buffered in batches; returns the number of rows written."""
+        written = 0
+        with self._flush_lock:
+            while batch := self._take():
+                try:
+                    DeviceLog.objects.bulk_create(
+                        DeviceLog(received_at=received_at, fingerprint=fingerprint(message), message=message)
+                        for received_at, message in batch
+                    )
+                except DatabaseError:
+                    device_log_lines.inc(len(batch), outcome="dropped")
+                    raise
+                device_log_lines.inc(len(batch), outcome="written")
+                written += len(batch)
+        return written
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="device-log-flush", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            try:
+                self.flush()
+                if time.monotonic() - self._last_purge >= PURGE_INTERVAL_SECONDS:
+                    self._last_purge = time.monotonic()
+                    purge_device_logs()
+            except DatabaseError:
+                logger.exception("Writing device logs failed.")
+            finally:
+                close_old_connections()
+
+
+device_log_buffer = DeviceLogBuffer()
+
+
+def purge_device_logs(before=None):
+    """Delete device logs received before `before` (default: the retention window)."""
+    if before is None:
+        before = timezone.now() - timedelta(days=settings.PASSKIT_LOG_RETENTION_DAYS)
+    deleted, _ = DeviceLog.objects.filter(received_at__lt=before).delete()
+    return deleted
+
+
+def common_device_errors(since, limit=20):
+    """The `limit` most frequent fingerprints received since `since`, with counts and a sample line."""
+    return list(
+        DeviceLog.objects.filter(received_at__gte=since)
+        .values("fingerprint")
+        .annotate(count=Count("id"), last_seen=Max("received_at"), sample=Max("message"))
+        .order_by("-count", "fingerprint")[:limit]
+    )
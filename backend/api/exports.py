@@ -0,0 +1,150 @@
+import csv
+import json
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from uuid import UUID
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from .models import BusinessCustomer, LoyaltyCard, Transaction
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+TRANSACTION_COLUMNS = [
+    ("id", "id"),
+    ("created_at", "created_at"),
+    ("station_id", "station_id"),
+    ("station", "station__name"),
+    ("loyalty_card", "loyalty_card_id"),
+    ("customer", "loyalty_card__business_customer__customer__name"),
+    ("phone_number", "loyalty_card__business_customer__customer__phone_number"),
+    ("amount", "amount"),
+    ("final_amount", "final_amount"),
+    ("points_earned", "points_earned"),
+    ("points_redeemed", "points_redeemed"),
+]
+
+CUSTOMER_COLUMNS = [
+    ("business_customer_id", "id"),
+    ("customer_id", "customer_id"),
+    ("name", "customer__name"),
+    ("phone_number", "customer__phone_number"),
+]
+
+LOYALTY_CARD_COLUMNS = [
+    ("token", "token"),
+    ("business_customer_id", "business_customer_id"),
+    ("customer", "business_customer__customer__name"),
+    ("phone_number", "business_customer__customer__phone_number"),
+    ("points_balance", "points_balance"),
+    ("wallet_status", "wallet_status"),
+    ("created_at", "created_at"),
+    ("updated_at", "updated_at"),
+]
+
+
+def _parse_bound(field, value, end=False):
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValidationError({field: "Use YYYY-MM-DD or an ISO 8601 datetime."})
+        # A bare end date includes the whole day.
+        if end:
+            day += timedelta(days=1)
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _date_range_filters(params, field):
+    filters = {}
+    start = _parse_bound("start", params.get("start"))
+    end = _parse_bound("end", params.get("end"), end=True)
+    if start:
+        filters[f"{field}__gte"] = start
+    if end:
+        filters[f"{field}__lt"] = end
+    return filters
+
+
+def transaction_rows(business, params):
+    filters = _date_range_filters(params, "created_at")
+    station = params.get("station")
+    if station:
+        try:
+            filters["station_id"] = UUID(station)
+        except ValueError:
+            raise ValidationError({"station": "Must be a station id."})
+    return Transaction.objects.filter(business=business, **filters).order_by("created_at"), TRANSACTION_COLUMNS
+
+
+def customer_rows(business, params):
+    return BusinessCustomer.objects.filter(business=business).order_by("customer__name"), CUSTOMER_COLUMNS
+
+
+def loyalty_card_rows(business, params):
+    filters = _date_range_filters(params, "created_at")
+    queryset = LoyaltyCard.objects.filter(business_customer__business=business, **filters).order_by("created_at")
+    return queryset, LOYALTY_CARD_COLUMNS
+
+
+EXPORTS = {
+    "transactions": transaction_rows,
+    "customers": customer_rows,
+    "loyaltycards": loyalty_card_rows,
+}
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (Decimal, UUID, date)):
+        return str(value)
+    return value
+
+
+class _LineBuffer:
+    """File-like sink that hands back whatever csv.writer writes to it."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(queryset, columns, chunk_size=EXPORT_CHUNK_SIZE):
+    writer = csv.writer(_LineBuffer())
+    yield writer.writerow([header for header, _ in columns])
+    lookups = [lookup for _, lookup in columns]
+    lines = []
+    for row in queryset.values_list(*lookups).iterator(chunk_size=chunk_size):
+        lines.append(writer.writerow([_plain(value) for value in row]))
+        if len(lines) >= chunk_size:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+
+def stream_ndjson(queryset, columns, chunk_size=EXPORT_CHUNK_SIZE):
+    headers = [header for header, _ in columns]
+    lookups = [lookup for _, lookup in columns]
+    lines = []
+    for row in queryset.values_list(*lookups).iterator(chunk_size=chunk_size):
+        lines.append(json.dumps(dict(zip(headers, map(_plain, row)))) + "\n")
+        if len(lines) >= chunk_size:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+
+EXPORT_FORMATS = {
+    "csv": (stream_csv, "text/csv"),
+    "ndjson": (stream_ndjson, "application/x-ndjson"),
+}
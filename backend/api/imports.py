@@ -0,0 +1,228 @@
+"""
+Bulk customer and loyalty card import.
+
+Rows come from CSV (with a header line) or NDJSON, one customer per row:
+
+    name           customer name (also accepted as "customer_name")
+    phone_number   any format normalize_phone_number accepts (also "phone")
+    points_balance optional opening balance, used with opening_balances=True
+
+Input is read lazily and processed in chunks. Each chunk resolves existing
+customers, business links and cards with one IN query apiece and creates
+the missing rows with bulk_create, so the query count grows with chunks,
+not rows, and memory stays bounded by the chunk size. Existing customers
+keep their name and existing cards keep their balance; importing the same
+file twice creates nothing the second time.
+"""
+
+import codecs
+import csv
+import json
+import math
+from dataclasses import dataclass, field
+
+from django.db import IntegrityError, transaction
+
+from server.query_budget import extend_query_budget
+
+from .models import BusinessCustomer, Customer, LoyaltyCard
+from .passkit import card_auth_token
+from .utils import normalize_phone_number
+
+IMPORT_CHUNK_SIZE = 1000
+# Rows per INSERT; keeps the widest model (LoyaltyCard) under SQLite's 999 parameters.
+INSERT_BATCH_SIZE = 90
+MAX_REPORTED_ERRORS = 100
+NAME_COLUMNS = ("name", "customer_name")
+PHONE_COLUMNS = ("phone_number", "phone")
+BALANCE_COLUMN = "points_balance"
+
+
+@dataclass
+class ImportSummary:
+    rows: int = 0
+    customers_created: int = 0
+    customers_matched: int = 0
+    cards_created: int = 0
+    cards_existing: int = 0
+    error_count: int = 0
+    errors: list = field(default_factory=list)
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def as_dict(self):
+        return {
+            "rows": self.rows,
+            "customers_created": self.customers_created,
+            "customers_matched": self.customers_matched,
+            "cards_created": self.cards_created,
+            "cards_existing": self.cards_existing,
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
+
+
+def _decoded(lines):
+    # utf-8-sig drops the byte order mark spreadsheet exports like to add.
+    return codecs.iterdecode(lines, "utf-8-sig")
+
+
+def read_csv(lines):
+    """(line number, record) for each data row of a CSV byte stream."""
+    reader = csv.DictReader(_decoded(lines))
+    for record in reader:
+        yield reader.line_num, record
+
+
+def read_ndjson(lines):
+    for number, line in enumerate(_decoded(lines), start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, None
+            continue
+        yield number, record if isinstance(record, dict) else None
+
+
+IMPORT_FORMATS = {
+    "csv": read_csv,
+    "ndjson": read_ndjson,
+}
+
+
+def _first(record, columns):
+    for column in columns:
+        value = record.get(column)
+        if value not in (None, ""):
+            return str(value).strip()
+    return ""
+
+
+def _parse(record, opening_balances):
+    """(name, phone, balance) for a valid record, or an error message."""
+    if record is None:
+        return "Not a JSON object."
+    name = _first(record, NAME_COLUMNS)
+    if not name:
+        return "Missing name."
+    if len(name) > Customer._meta.get_field("name").max_length:
+        return "Name is too long."
+    phone = normalize_phone_number(_first(record, PHONE_COLUMNS))
+    if not phone:
+        return "Phone number must contain digits."
+    if len(phone) > 20:
+        return "Phone number is too long after normalization."
+    balance = 0
+    if opening_balances and record.get(BALANCE_COLUMN) not in (None, ""):
+        try:
+            balance = int(record[BALANCE_COLUMN])
+        except (TypeError, ValueError):
+            return "points_balance must be a whole number."
+        if balance < 0:
+            return "points_balance cannot be negative."
+    return name, phone, balance
+
+
+def _chunk_query_allowance(rows):
+    # Three lookups, three batched inserts and the transaction around them.
+    return 3 + 3 * math.ceil(rows / INSERT_BATCH_SIZE) + 2
+
+
+def _import_chunk(business, rows, summary):
+    """Create what `rows` ({phone: (line, name, balance)}) needs; all or nothing."""
+    with transaction.atomic(using=business._state.db):
+        customers = {
+            customer.phone_number: customer
+            for customer in Customer.objects.filter(phone_number__in=list(rows))
+        }
+        new_customers = [
+            Customer(name=name, phone_number=phone)
+            for phone, (_, name, _) in rows.items()
+            if phone not in customers
+        ]
+        Customer.objects.bulk_create(new_customers, batch_size=INSERT_BATCH_SIZE)
+        matched = len(customers)
+        customers.update((customer.phone_number, customer) for customer in new_customers)
+
+        links = {
+            link.customer_id: link
+            for link in BusinessCustomer.objects.filter(
+                business=business, customer_id__in=[customer.pk for customer in customers.values()]
+            )
+        }
+        new_links = [
+            BusinessCustomer(business=business, customer=customer)
+            for customer in customers.values()
+            if customer.pk not in links
+        ]
+        BusinessCustomer.objects.bulk_create(new_links, batch_size=INSERT_BATCH_SIZE)
+        links.update((link.customer_id, link) for link in new_links)
+
+        carded = set(
+            LoyaltyCard.objects.filter(
+                business_customer_id__in=[link.pk for link in links.values()]
+            ).values_list("business_customer_id", flat=True)
+        )
+        new_cards = []
+        for phone, (_, _, balance) in rows.items():
+            link = links[customers[phone].pk]
+            if link.pk in carded:
+                continue
+            card = LoyaltyCard(business_customer=link, points_balance=balance)
+            card.apple_auth_token = card_auth_token(card)
+            new_cards.append(card)
+        LoyaltyCard.objects.bulk_create(new_cards, batch_size=INSERT_BATCH_SIZE)
+
+    summary.customers_created += len(new_customers)
+    summary.customers_matched += matched
+    summary.cards_created += len(new_cards)
+    summary.cards_existing += len(rows) - len(new_cards)
+
+
+def _flush(business, rows, summary):
+    if not rows:
+        return
+    extend_query_budget(_chunk_query_allowance(len(rows)))
+    try:
+        _import_chunk(business, rows, summary)
+    except IntegrityError:
+        # Someone else created one of these customers or cards since the
+        # lookups ran; a second pass sees their rows.
+        extend_query_budget(_chunk_query_allowance(len(rows)))
+        _import_chunk(business, rows, summary)
+
+
+def import_customers(business, records, opening_balances=False, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """
+    Import (line number, record) pairs for `business` and return an
+    ImportSummary. Invalid rows are reported and skipped; a phone number
+    seen twice in one chunk keeps its first row. `progress(summary)` runs
+    after every chunk.
+    """
+    summary = ImportSummary()
+    rows = {}
+    for line, record in records:
+        summary.rows += 1
+        parsed = _parse(record, opening_balances)
+        if isinstance(parsed, str):
+            summary.add_error(line, parsed)
+            continue
+        name, phone, balance = parsed
+        if phone in rows:
+            summary.add_error(line, f"Duplicate of line {rows[phone][0]}.")
+            continue
+        rows[phone] = (line, name, balance)
+        if len(rows) >= chunk_size:
+            _flush(business, rows, summary)
+            rows = {}
+            if progress:
+                progress(summary)
+    _flush(business, rows, summary)
+    if progress and rows:
+        progress(summary)
+    return summary
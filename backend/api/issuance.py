@@ -0,0 +1,160 @@
+"""
+Loyalty card issuance in one short transaction.
+
+Issuing a card for a phone number upserts the customer, upserts the
+business link and inserts the card unless the link already has one, each
+as a single statement, then queues the card at the station. Every step
+writes, so on SQLite the transaction takes the write lock with its first
+statement and concurrent issuances for the same phone queue behind it
+instead of racing between a lookup and an insert: all of them end up with
+the same customer, link and card.
+"""
+
+import uuid
+from dataclasses import dataclass
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import BusinessCustomer, Customer, LoyaltyCard, Station
+from .passkit import card_auth_token
+from .prepared import enqueue_prepared_pass
+from .utils import retry_on_database_lock
+
+
+@dataclass
+class IssuedCard:
+    customer: Customer
+    business_customer: BusinessCustomer
+    loyalty_card: LoyaltyCard
+    created: bool
+
+
+class _Statement:
+    """Column lists and parameter preparation for hand-written SQL on one model."""
+
+    def __init__(self, connection, model):
+        self.connection = connection
+        self.model = model
+        self.table = connection.ops.quote_name(model._meta.db_table)
+
+    def column(self, name):
+        return self.connection.ops.quote_name(self.model._meta.get_field(name).column)
+
+    def columns(self, names):
+        return ", ".join(self.column(name) for name in names)
+
+    def params(self, values):
+        return [
+            self.model._meta.get_field(name).get_db_prep_save(value, self.connection)
+            for name, value in values.items()
+        ]
+
+
+def _fetch_one(connection, sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchone()
+
+
+def _upsert_customer(connection, name, phone_number):
+    statement = _Statement(connection, Customer)
+    values = {"id": uuid.uuid4(), "name": name, "phone_number": phone_number}
+    row = _fetch_one(
+        connection,
+        f"INSERT INTO {statement.table} ({statement.columns(values)}) VALUES (%s, %s, %s) "
+        f"ON CONFLICT ({statement.column('phone_number')}) DO UPDATE SET "
+        f"{statement.column('name')} = excluded.{statement.column('name')} "
+        f"RETURNING {statement.column('id')}",
+        statement.params(values),
+    )
+    customer = Customer(id=Customer._meta.pk.to_python(row[0]), name=name, phone_number=phone_number)
+    customer._state.adding = False
+    customer._state.db = connection.alias
+    return customer
+
+
+def _upsert_business_customer(connection, business, customer):
+    statement = _Statement(connection, BusinessCustomer)
+    values = {"id": uuid.uuid4(), "business": business.pk, "customer": customer.pk}
+    # A no-op update, so the existing row's id comes back through RETURNING.
+    row = _fetch_one(
+        connection,
+        f"INSERT INTO {statement.table} ({statement.columns(values)}) VALUES (%s, %s, %s) "
+        f"ON CONFLICT ({statement.columns(['business', 'customer'])}) DO UPDATE SET "
+        f"{statement.column('customer')} = excluded.{statement.column('customer')} "
+        f"RETURNING {statement.column('id')}",
+        statement.params(values),
+    )
+    link = BusinessCustomer(id=BusinessCustomer._meta.pk.to_python(row[0]), business=business, customer=customer)
+    link._state.adding = False
+    link._state.db = connection.alias
+    return link
+
+
+def _insert_card_unless_present(connection, link):
+    """The new card, or None when the link already has one."""
+    now = timezone.now()
+    card = LoyaltyCard(token=uuid.uuid4(), business_customer=link, created_at=now, updated_at=now)
+    card.apple_auth_token = card_auth_token(card)
+    statement = _Statement(connection, LoyaltyCard)
+    values = {
+        "token": card.token,
+        "business_customer": link.pk,
+        "points_balance": card.points_balance,
+        "wallet_status": card.wallet_status,
+        "apple_auth_token": card.apple_auth_token,
+        "pass_version": card.pass_version,
+        "created_at": now,
+        "updated_at": now,
+    }
+    placeholders = ", ".join(["%s"] * len(values))
+    row = _fetch_one(
+        connection,
+        f"INSERT INTO {statement.table} ({statement.columns(values)}) SELECT {placeholders} "
+        f"WHERE NOT EXISTS (SELECT 1 FROM {statement.table} WHERE {statement.column('business_customer')} = %s) "
+        f"RETURNING {statement.column('token')}",
+        [*statement.params(values), statement.params({"business_customer": link.pk})[0]],
+    )
+    if row is None:
+        return None
+    card._state.adding = False
+    card._state.db = connection.alias
+    return card
+
+
+def _issue(business, station, name, phone_number):
+    alias = business._state.db
+    connection = connections[alias]
+    with transaction.atomic(using=alias):
+        customer = _upsert_customer(connection, name, phone_number)
+        link = _upsert_business_customer(connection, business, customer)
+        card = _insert_card_unless_present(connection, link)
+        created = card is not None
+        if card is None:
+            card = LoyaltyCard.objects.using(alias).filter(business_customer=link).order_by("created_at").first()
+            card.business_customer = link
+            if not card.apple_auth_token:
+                card.apple_auth_token = card_auth_token(card)
+                card.save(update_fields=["apple_auth_token", "updated_at"])
+
+        prepared_at = timezone.now()
+        enqueue_prepared_pass(station, card, using=alias, now=prepared_at)
+        Station.objects.using(alias).filter(pk=station.pk).update(
+            prepared_loyalty_card=card, prepared_at=prepared_at
+        )
+    station.prepared_loyalty_card = card
+    station.prepared_at = prepared_at
+    return IssuedCard(customer=customer, business_customer=link, loyalty_card=card, created=created)
+
+
+def issue_loyalty_card(business, station, name, phone_number):
+    """
+    Get or create the customer (renamed to `name`), their link to `business`
+    and its loyalty card, and queue the card on `station`. Runs six
+    statements for a new card and seven for an existing one.
+    """
+    return retry_on_database_lock(
+        lambda: _issue(business, station, name, phone_number),
+        operation="card_issue",
+    )
@@ -0,0 +1,382 @@
+"""
+Closed-loop load generation against the real HTTP endpoints.
+
+Virtual stations, Wallet devices and owners each run in their own thread
+and loop: send a request, wait for the response, then pause for an
+exponentially distributed think time (mean 1 / rate seconds; a rate of 0
+sends the next request straight away). Offered load therefore grows with
+the population rather than a fixed request rate, and the throughput the
+server settles at is the number to read when sizing how many stations one
+deployment sustains.
+
+Stations and owners authenticate with a session cookie from one login per
+tenant rather than HTTP Basic credentials: Basic auth hashes the password
+on every request, and the run would mostly measure PBKDF2.
+"""
+
+import math
+import random
+import secrets
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+import httpx
+from django.conf import settings
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application
+from django.urls import reverse
+
+SIGNUP_DEFAULTS = {
+    "reward_rate": "1.000",
+    "redemption_points": 100,
+    "redemption_rate": "0.10",
+    "logo_url": "https://example.com/logo.png",
+    "primary_color": "#112233",
+    "background_color": "#FFFFFF",
+}
+
+
+@dataclass(frozen=True)
+class LoadPlan:
+    businesses: int = 2
+    stations: int = 8
+    devices: int = 16
+    owners: int = 2
+    duration: float = 30.0
+    # Requests per second each virtual user aims for between responses.
+    station_rate: float = 1.0
+    device_rate: float = 0.2
+    owner_rate: float = 0.2
+    issue_share: float = 0.1
+    redeem_share: float = 0.05
+    # Cards issued per business before the clock starts.
+    cards: int = 20
+    passes_per_device: int = 2
+    seed: int = 0
+    timeout: float = 10.0
+
+
+@dataclass
+class OperationStats:
+    requests: int
+    errors: int
+    throughput: float
+    p50_ms: float
+    p90_ms: float
+    p99_ms: float
+    max_ms: float
+
+    @property
+    def error_rate(self):
+        return self.errors / self.requests if self.requests else 0.0
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(fraction * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+class LoadRecorder:
+    def __init__(self):
+        self._latencies = defaultdict(list)
+        self._errors = defaultdict(int)
+        self._statuses = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def record(self, operation, elapsed, status, ok):
+        with self._lock:
+            self._latencies[operation].append(elapsed)
+            self._statuses[operation][status] += 1
+            if not ok:
+                self._errors[operation] += 1
+
+    def statuses(self):
+        with self._lock:
+            return {operation: dict(counts) for operation, counts in self._statuses.items()}
+
+    def summary(self, elapsed):
+        """{operation: OperationStats}, plus an "all" row across operations."""
+        with self._lock:
+            latencies = {operation: list(values) for operation, values in self._latencies.items()}
+            errors = dict(self._errors)
+        latencies["all"] = [value for values in latencies.values() for value in values]
+        errors["all"] = sum(errors.values())
+        stats = {}
+        for operation, values in latencies.items():
+            ms = sorted(value * 1000 for value in values)
+            stats[operation] = OperationStats(
+                requests=len(ms),
+                errors=errors.get(operation, 0),
+                throughput=len(ms) / elapsed if elapsed else 0.0,
+                p50_ms=percentile(ms, 0.50),
+                p90_ms=percentile(ms, 0.90),
+                p99_ms=percentile(ms, 0.99),
+                max_ms=ms[-1] if ms else 0.0,
+            )
+        return stats
+
+
+@dataclass
+class Tenant:
+    username: str
+    password: str
+    # Session cookie from logging in once, sent by every client of the tenant.
+    session: dict = field(default_factory=dict)
+    stations: list = field(default_factory=list)
+    # (serial number, ApplePass authentication token) of every card issued so far.
+    cards: list = field(default_factory=list)
+
+
+class _VirtualUser(threading.Thread):
+    def __init__(self, base_url, plan, recorder, rate, seed, cookies=None):
+        super().__init__(daemon=True)
+        self.base_url = base_url.rstrip("/")
+        self.plan = plan
+        self.recorder = recorder
+        self.rate = rate
+        self.rng = random.Random(seed)
+        self.client = httpx.Client(base_url=self.base_url, cookies=cookies, timeout=plan.timeout)
+        self.stop_at = None
+
+    def call(self, operation, method, url, expected=(200,), **kwargs):
+        started = time.perf_counter()
+        try:
+            response = self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.recorder.record(operation, time.perf_counter() - started, "network_error", ok=False)
+            return None
+        ok = response.status_code in expected
+        self.recorder.record(operation, time.perf_counter() - started, response.status_code, ok)
+        return response if ok else None
+
+    def think(self):
+        if self.rate <= 0:
+            return
+        remaining = self.stop_at - time.perf_counter()
+        time.sleep(max(min(self.rng.expovariate(self.rate), remaining), 0))
+
+    def setup(self):
+        pass
+
+    def step(self):
+        raise NotImplementedError
+
+    def run(self):
+        try:
+            self.setup()
+            while time.perf_counter() < self.stop_at:
+                self.step()
+                self.think()
+        finally:
+            self.client.close()
+
+
+class VirtualStation(_VirtualUser):
+    """A point-of-sale register: mostly checkouts, sometimes a new card."""
+
+    def __init__(self, base_url, plan, recorder, seed, tenant, station_token, phones):
+        super().__init__(base_url, plan, recorder, plan.station_rate, seed, cookies=tenant.session)
+        self.tenant = tenant
+        self.client.headers["X-Station-Token"] = station_token
+        self.phones = phones
+
+    def step(self):
+        if not self.tenant.cards or self.rng.random() < self.plan.issue_share:
+            response = self.call(
+                "station.issue_card",
+                "POST",
+                reverse("loyaltycard-issue"),
+                expected=(201,),
+                json={"customer_name": "Load Test", "phone_number": next(self.phones)},
+            )
+            if response is not None:
+                card = response.json()["loyalty_card"]
+                self.tenant.cards.append((card["token"], card["authentication_token"]))
+            return
+
+        serial = self.rng.choice(self.tenant.cards)[0]
+        redeem = self.rng.random() < self.plan.redeem_share
+        self.call(
+            "station.redeem" if redeem else "station.transaction",
+            "POST",
+            reverse("transaction-list"),
+            expected=(201,),
+            json={"loyalty_card_id": serial, "amount": f"{self.rng.randint(300, 6000) / 100:.2f}", "redeem": redeem},
+        )
+
+
+class VirtualDevice(_VirtualUser):
+    """An iPhone holding a few passes: registers them, then polls for updates."""
+
+    def __init__(self, base_url, plan, recorder, seed, passes, pass_type):
+        super().__init__(base_url, plan, recorder, plan.device_rate, seed)
+        self.device_id = secrets.token_hex(16)
+        self.push_token = secrets.token_hex(32)
+        self.passes = dict(passes)
+        self.pass_type = pass_type
+        self.last_updated = None
+
+    def setup(self):
+        for serial, auth_token in self.passes.items():
+            self.call(
+                "device.register",
+                "POST",
+                reverse("passkit-device-registration", args=[self.device_id, self.pass_type, serial]),
+                expected=(200, 201),
+                json={"pushToken": self.push_token},
+                headers={"Authorization": f"ApplePass {auth_token}"},
+            )
+
+    def step(self):
+        params = {"passesUpdatedSince": self.last_updated} if self.last_updated else {}
+        response = self.call(
+            "device.list_updates",
+            "GET",
+            reverse("passkit-device-registration-list", args=[self.device_id, self.pass_type]),
+            params=params,
+        )
+        if response is None:
+            return
+        body = response.json()
+        self.last_updated = body["lastUpdated"]
+        for serial in body["serialNumbers"]:
+            self.call(
+                "device.download_pass",
+                "GET",
+                reverse("passkit-pass-download", args=[self.pass_type, serial]),
+                headers={"Authorization": f"ApplePass {self.passes[serial]}"},
+            )
+
+
+class VirtualOwner(_VirtualUser):
+    """A business owner with the dashboard open."""
+
+    def __init__(self, base_url, plan, recorder, seed, tenant):
+        super().__init__(base_url, plan, recorder, plan.owner_rate, seed, cookies=tenant.session)
+        self.views = ("dashboard-metrics", "dashboard-data")
+        self.turn = 0
+
+    def step(self):
+        name = self.views[self.turn % len(self.views)]
+        self.turn += 1
+        self.call(f"owner.{name}", "GET", reverse(name))
+
+
+def _phone_numbers(prefix):
+    for number in range(10**6):
+        yield f"+1{prefix:04d}{number:06d}"
+
+
+def log_in(client, tenant):
+    """Log `tenant` in once and keep the session cookie for its clients."""
+    response = client.post(reverse("accounts-login"), json={"username": tenant.username, "password": tenant.password})
+    response.raise_for_status()
+    # Set directly: the cookie is marked Secure and the server may be plain HTTP.
+    tenant.session = {settings.SESSION_COOKIE_NAME: response.cookies[settings.SESSION_COOKIE_NAME]}
+
+
+def provision(base_url, plan, phone_blocks, log=None):
+    """
+    Sign up the businesses, stations and starting cards the virtual users
+    share. Every client that issues cards draws phone numbers from its own
+    block of `phone_blocks`, so each issue creates a new customer.
+    """
+    run = secrets.token_hex(4)
+    tenants = []
+    with httpx.Client(base_url=base_url.rstrip("/"), timeout=plan.timeout) as client:
+        for index in range(plan.businesses):
+            tenant = Tenant(username=f"load-{run}-{index}", password=secrets.token_urlsafe(16))
+            response = client.post(
+                reverse("business-signup"),
+                json={
+                    **SIGNUP_DEFAULTS,
+                    "business_name": f"Load Test {run} {index}",
+                    "username": tenant.username,
+                    "password": tenant.password,
+                },
+            )
+            response.raise_for_status()
+            log_in(client, tenant)
+            client.cookies.clear()
+            tenants.append(tenant)
+
+    for index, tenant in enumerate(tenants):
+        with httpx.Client(base_url=base_url.rstrip("/"), cookies=tenant.session, timeout=plan.timeout) as client:
+            for number in range(index, plan.stations, len(tenants)):
+                response = client.post(reverse("station-list"), json={"name": f"Register {number + 1}"})
+                response.raise_for_status()
+                tenant.stations.append(response.json()["api_token"])
+            if not tenant.stations:
+                continue
+
+            phones = _phone_numbers(next(phone_blocks))
+            client.headers["X-Station-Token"] = tenant.stations[0]
+            for _ in range(plan.cards):
+                response = client.post(
+                    reverse("loyaltycard-issue"),
+                    json={"customer_name": "Load Test", "phone_number": next(phones)},
+                )
+                response.raise_for_status()
+                card = response.json()["loyalty_card"]
+                tenant.cards.append((card["token"], card["authentication_token"]))
+        if log:
+            log(f"Provisioned {tenant.username}: {len(tenant.stations)} stations, {len(tenant.cards)} cards.")
+    return tenants
+
+
+def run_load(base_url, plan, pass_type, log=None):
+    """
+    Provision tenants over HTTP, run every virtual user for plan.duration
+    seconds and return (summary by operation, status counts, elapsed).
+    """
+    rng = random.Random(plan.seed)
+    phone_blocks = iter(rng.sample(range(1000, 10000), plan.businesses + plan.stations))
+    tenants = provision(base_url, plan, phone_blocks, log=log)
+    recorder = LoadRecorder()
+    users = []
+
+    for number in range(plan.stations):
+        tenant = tenants[number % len(tenants)]
+        token = tenant.stations[number // len(tenants)]
+        phones = _phone_numbers(next(phone_blocks))
+        users.append(VirtualStation(base_url, plan, recorder, rng.random(), tenant, token, phones))
+    all_cards = [card for tenant in tenants for card in tenant.cards]
+    for _ in range(plan.devices if all_cards else 0):
+        passes = rng.sample(all_cards, min(plan.passes_per_device, len(all_cards)))
+        users.append(VirtualDevice(base_url, plan, recorder, rng.random(), passes, pass_type))
+    for number in range(plan.owners):
+        users.append(VirtualOwner(base_url, plan, recorder, rng.random(), tenants[number % len(tenants)]))
+
+    started = time.perf_counter()
+    for user in users:
+        user.stop_at = started + plan.duration
+        user.start()
+    for user in users:
+        user.join()
+    elapsed = time.perf_counter() - started
+    return recorder.summary(elapsed), recorder.statuses(), elapsed
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def local_server(host="127.0.0.1", port=0):
+    """Serve the project's WSGI application from a background thread and yield its URL."""
+    server = ThreadedWSGIServer((host, port), _QuietRequestHandler, allow_reuse_address=False)
+    server.set_app(get_internal_wsgi_application())
+    thread = threading.Thread(target=server.serve_forever, name="load-test-server", daemon=True)
+    thread.start()
+    try:
+        yield f"http://{host}:{server.server_port}"
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
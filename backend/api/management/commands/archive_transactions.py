@@ -0,0 +1,40 @@
+from datetime import timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.archive import ArchiveError, export_period, month_start, period_dir
+from api.models import Business, Transaction
+
+
+class Command(BaseCommand):
+    help = "Export closed months of transactions into per-business columnar archive files."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--business", help="Only archive this business id.")
+        parser.add_argument("--root", help="Archive directory (defaults to TRANSACTION_ARCHIVE_DIR).")
+        parser.add_argument("--overwrite", action="store_true", help="Rebuild periods that already exist.")
+
+    def handle(self, *args, **options):
+        # A month is closed once the current month has started.
+        cutoff = month_start(timezone.now())
+        businesses = Business.objects.all()
+        if options["business"]:
+            businesses = businesses.filter(pk=options["business"])
+            if not businesses.exists():
+                raise CommandError("Unknown business.")
+
+        for business in businesses.iterator():
+            # Archive periods are UTC months regardless of TIME_ZONE.
+            months = Transaction.objects.filter(business=business, created_at__lt=cutoff).datetimes(
+                "created_at", "month", tzinfo=dt_timezone.utc
+            )
+            for month in months:
+                start = month_start(month)
+                if period_dir(business.pk, start, options["root"]).exists() and not options["overwrite"]:
+                    continue
+                try:
+                    rows = export_period(business.pk, start, options["root"], options["overwrite"])
+                except ArchiveError as exc:
+                    raise CommandError(str(exc)) from exc
+                self.stdout.write(f"{business.name} {start:%Y-%m}: {rows} transactions")
@@ -0,0 +1,72 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from api.bench import measure, median_ms, populate_transactions, scratch_database
+from api.models import Transaction
+
+
+class Command(BaseCommand):
+    help = "Compare join-based and denormalized business filtering on a synthetic transaction table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--businesses", type=int, default=20)
+        parser.add_argument("--repeat", type=int, default=5)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        with scratch_database():
+            self.stdout.write(f"Generating {options['rows']:,} transactions...")
+            businesses = populate_transactions(
+                options["rows"],
+                businesses=options["businesses"],
+                seed=options["seed"],
+            )
+            self._run(businesses[0], options["repeat"])
+
+    def _run(self, biz, repeat):
+        now = timezone.now()
+        week_ago = now - timedelta(days=7)
+        quarter_ago = now - timedelta(days=90)
+
+        station_path = {"station__business": biz}
+        card_path = {"loyalty_card__business_customer__business": biz}
+        direct = {"business": biz}
+
+        def recent_page(scope):
+            return lambda: list(Transaction.objects.filter(**scope).order_by("-created_at")[:25])
+
+        def points_redeemed(scope):
+            return lambda: Transaction.objects.filter(**scope, created_at__gte=week_ago).aggregate(
+                total=Sum("points_redeemed")
+            )
+
+        def revenue_trend(scope):
+            return lambda: list(
+                Transaction.objects.filter(**scope, created_at__gte=quarter_ago)
+                .annotate(day=TruncDate("created_at"))
+                .values("day")
+                .order_by("day")
+                .annotate(total=Sum("amount"))
+            )
+
+        def count(scope):
+            return lambda: Transaction.objects.filter(**scope).count()
+
+        cases = [
+            ("recent page (station join)", recent_page(station_path), recent_page(direct)),
+            ("points redeemed 7d (card join)", points_redeemed(card_path), points_redeemed(direct)),
+            ("revenue trend 90d (station join)", revenue_trend(station_path), revenue_trend(direct)),
+            ("count (station join)", count(station_path), count(direct)),
+        ]
+
+        self.stdout.write(f"{'query':<36}{'join ms':>12}{'direct ms':>12}{'speedup':>10}")
+        for label, joined, denormalized in cases:
+            joined_ms = median_ms(measure(joined, repeat))
+            direct_ms = median_ms(measure(denormalized, repeat))
+            speedup = joined_ms / direct_ms if direct_ms else float("inf")
+            self.stdout.write(f"{label:<36}{joined_ms:>12.2f}{direct_ms:>12.2f}{speedup:>9.1f}x")
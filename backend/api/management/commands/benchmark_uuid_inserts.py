@@ -0,0 +1,65 @@
+import sqlite3
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from api.ids import uuid7
+
+
+# Mirrors the columns Django creates for api_transaction on SQLite; the
+# char(32) primary key is what random uuid4 values scatter across.
+TABLE_SQL = """
+CREATE TABLE txn (
+    id char(32) NOT NULL PRIMARY KEY,
+    points_earned integer unsigned NOT NULL,
+    amount decimal NOT NULL,
+    created_at datetime NOT NULL
+)
+"""
+
+
+class Command(BaseCommand):
+    help = "Measure SQLite insert throughput for random (uuid4) versus time-ordered (uuid7) primary keys."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=2_000_000)
+        parser.add_argument("--batch-size", type=int, default=10_000)
+        parser.add_argument("--cache-size-kib", type=int, default=8192)
+
+    def handle(self, *args, **options):
+        results = {}
+        for label, generator in (("uuid4", uuid.uuid4), ("uuid7", uuid7)):
+            with tempfile.TemporaryDirectory() as tmp:
+                results[label] = self._run(Path(tmp) / "bench.sqlite3", generator, options)
+
+        self.stdout.write(f"{'ids':<8}{'rows/s':>12}{'last batch rows/s':>20}{'db MiB':>10}")
+        for label, (overall, last_batch, size_mib) in results.items():
+            self.stdout.write(f"{label:<8}{overall:>12,.0f}{last_batch:>20,.0f}{size_mib:>10.1f}")
+
+    def _run(self, path, generator, options):
+        rows = options["rows"]
+        batch_size = options["batch_size"]
+        self.stdout.write(f"Inserting {rows:,} rows keyed by {generator.__name__}...")
+
+        db = sqlite3.connect(path)
+        db.execute(f"PRAGMA cache_size=-{options['cache_size_kib']}")
+        db.execute(TABLE_SQL)
+
+        inserted = 0
+        last_batch_rate = 0.0
+        started = time.perf_counter()
+        while inserted < rows:
+            size = min(batch_size, rows - inserted)
+            batch = [(generator().hex, 10, "10.00", "2025-01-01 00:00:00") for _ in range(size)]
+            batch_started = time.perf_counter()
+            with db:
+                db.executemany("INSERT INTO txn VALUES (?, ?, ?, ?)", batch)
+            last_batch_rate = size / (time.perf_counter() - batch_started)
+            inserted += size
+        overall_rate = rows / (time.perf_counter() - started)
+
+        db.close()
+        return overall_rate, last_batch_rate, path.stat().st_size / (1024 * 1024)
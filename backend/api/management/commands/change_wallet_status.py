@@ -0,0 +1,66 @@
+import json
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Business
+from api.pass_refresh import push_card_updates
+from api.serializers import WalletStatusChangeSerializer
+from api.sharding import shard_map, use_shard
+from api.wallet_status import WALLET_STATUS_CHUNK_SIZE, change_wallet_status
+
+
+class Command(BaseCommand):
+    help = (
+        "Revoke, expire or reinstate a business's loyalty cards in bulk, then push the change "
+        "to their devices at PASS_REFRESH_PUSHES_PER_SECOND (or --rate)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("business_id")
+        parser.add_argument("wallet_status", choices=WalletStatusChangeSerializer.STATUSES)
+        parser.add_argument("--token", dest="tokens", action="append", help="A card token; repeat for more.")
+        parser.add_argument("--tokens-file", help="File with one card token per line.")
+        parser.add_argument("--current-status", choices=WalletStatusChangeSerializer.STATUSES)
+        parser.add_argument("--created-before", help="ISO 8601 timestamp.")
+        parser.add_argument("--updated-before", help="ISO 8601 timestamp.")
+        parser.add_argument("--all", action="store_true", help="Every card of the business.")
+        parser.add_argument("--chunk-size", type=int, default=WALLET_STATUS_CHUNK_SIZE)
+        parser.add_argument("--rate", type=float, help="Pushes per second.")
+
+    def handle(self, *args, **options):
+        try:
+            business_id = uuid.UUID(options["business_id"])
+            alias = shard_map.shard_for(business_id)
+            business = Business.objects.using(alias).get(pk=business_id)
+        except (ValueError, Business.DoesNotExist) as exc:
+            raise CommandError(f"Unknown business {options['business_id']}.") from exc
+
+        tokens = list(options["tokens"] or [])
+        if options["tokens_file"]:
+            try:
+                with open(options["tokens_file"]) as handle:
+                    tokens += [line.strip() for line in handle if line.strip()]
+            except OSError as exc:
+                raise CommandError(str(exc)) from exc
+
+        data = {"wallet_status": options["wallet_status"], "all": options["all"]}
+        if tokens:
+            data["tokens"] = tokens
+        for name in ("current_status", "created_before", "updated_before"):
+            if options[name]:
+                data[name] = options[name]
+        serializer = WalletStatusChangeSerializer(data=data)
+        if not serializer.is_valid():
+            raise CommandError(json.dumps(serializer.errors))
+
+        with use_shard(alias):
+            change = change_wallet_status(
+                business,
+                serializer.validated_data["wallet_status"],
+                chunk_size=options["chunk_size"],
+                **serializer.filters(),
+            )
+        # A command's process ends with it, so the fan-out runs here rather than in the background.
+        devices = push_card_updates(business, change.card_ids, rate=options["rate"])
+        self.stdout.write(json.dumps({**change.as_dict(), "devices_notified": devices}))
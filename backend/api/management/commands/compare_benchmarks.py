@@ -0,0 +1,39 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks import DEFAULT_THRESHOLD, compare_results
+
+
+def report_comparison(stdout, baseline, current, threshold):
+    rows = compare_results(baseline, current, threshold)
+    stdout.write(f"{'case':<36}{'baseline ms':>13}{'current ms':>13}{'change':>9}")
+    for key, before, after, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        stdout.write(f"{key:<36}{before:>13.3f}{after:>13.3f}{change:>+9.1%}{flag}")
+
+    regressions = [row[0] for row in rows if row[4]]
+    if regressions:
+        raise CommandError(
+            f"{len(regressions)} case(s) slower than the baseline by more than {threshold:.0%}: "
+            + ", ".join(regressions)
+        )
+
+
+class Command(BaseCommand):
+    help = "Compare two benchmark result files and fail when a case regressed beyond the threshold."
+
+    def add_arguments(self, parser):
+        parser.add_argument("baseline")
+        parser.add_argument("current")
+        parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                            help="Allowed slowdown of the median before a case counts as a regression (0.10 = 10%%).")
+
+    def handle(self, *args, **options):
+        try:
+            baseline = json.loads(Path(options["baseline"]).read_text())["results"]
+            current = json.loads(Path(options["current"]).read_text())["results"]
+        except (OSError, ValueError, KeyError) as exc:
+            raise CommandError(f"Could not read benchmark results: {exc}") from exc
+        report_comparison(self.stdout, baseline, current, options["threshold"])
@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.device_logs import common_device_errors, purge_device_logs
+
+
+class Command(BaseCommand):
+    help = "List the most common Apple Wallet device log messages, grouped by fingerprint."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hours", type=int, default=24, help="How far back to look (default 24).")
+        parser.add_argument("--limit", type=int, default=20)
+        parser.add_argument("--purge", action="store_true",
+                            help="First delete logs older than PASSKIT_LOG_RETENTION_DAYS.")
+
+    def handle(self, *args, **options):
+        if options["purge"]:
+            self.stdout.write(f"{purge_device_logs():,} old device logs deleted")
+
+        rows = common_device_errors(timezone.now() - timedelta(hours=options["hours"]), options["limit"])
+        if not rows:
+            self.stdout.write(f"No device logs in the last {options['hours']} hours.")
+            return
+        self.stdout.write(f"{'count':>8}  {'last seen':<20}  message")
+        for row in rows:
+            last_seen = timezone.localtime(row["last_seen"]).strftime("%Y-%m-%d %H:%M:%S")
+            self.stdout.write(f"{row['count']:>8,}  {last_seen:<20}  {row['fingerprint']}")
+            self.stdout.write(f"{'':>8}  {'':<20}  e.g. {row['sample']}")
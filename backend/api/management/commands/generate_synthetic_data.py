@@ -0,0 +1,74 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from api.synthetic import DatasetPlan, generate_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Insert a deterministic synthetic dataset (businesses, stations, customers, cards, "
+        "Zipf-distributed transactions and wallet registrations) for scale testing. On SQLite a "
+        "million transactions take around 40 seconds, most of it spent updating the transaction "
+        "table's indexes; --workers only spreads out row generation."
+    )
+
+    def add_arguments(self, parser):
+        defaults = DatasetPlan()
+        parser.add_argument("--businesses", type=int, default=defaults.businesses)
+        parser.add_argument("--stations", type=int, default=defaults.stations_per_business, help="Stations per business.")
+        parser.add_argument("--cards", type=int, default=defaults.cards_per_business, help="Customers and cards per business.")
+        parser.add_argument("--transactions", type=int, default=defaults.transactions)
+        parser.add_argument("--span-days", type=int, default=defaults.span_days)
+        parser.add_argument("--skew", type=float, default=defaults.skew, help="Zipf exponent; 0 spreads traffic evenly.")
+        parser.add_argument("--redeem-share", type=float, default=defaults.redeem_share)
+        parser.add_argument("--wallet-share", type=float, default=defaults.wallet_share,
+                            help="Fraction of cards with a registered Wallet device.")
+        parser.add_argument("--batch-size", type=int, default=defaults.batch_size)
+        parser.add_argument("--seed", type=int, default=defaults.seed)
+        parser.add_argument("--phone-start", type=int, default=defaults.phone_start,
+                            help="First phone number suffix; move it to avoid clashing with existing customers.")
+        parser.add_argument("--end", help="ISO timestamp the time span ends at (default: now). Fix it for reproducible rows.")
+        parser.add_argument("--workers", type=int, default=1, help="Processes generating separate businesses.")
+
+    def handle(self, *args, **options):
+        end = None
+        if options["end"]:
+            try:
+                end = datetime.fromisoformat(options["end"])
+            except ValueError as exc:
+                raise CommandError(f"Invalid --end: {exc}") from exc
+            if end.tzinfo is None:
+                raise CommandError("--end must include a UTC offset.")
+
+        plan = DatasetPlan(
+            businesses=options["businesses"],
+            stations_per_business=options["stations"],
+            cards_per_business=options["cards"],
+            transactions=options["transactions"],
+            span_days=options["span_days"],
+            skew=options["skew"],
+            redeem_share=options["redeem_share"],
+            wallet_share=options["wallet_share"],
+            batch_size=options["batch_size"],
+            seed=options["seed"],
+            phone_start=options["phone_start"],
+            end=end,
+        )
+
+        started = time.perf_counter()
+        try:
+            summary = generate_dataset(plan, workers=options["workers"])
+        except IntegrityError as exc:
+            raise CommandError(
+                f"Rows clash with existing data ({exc}). Use another --seed or --phone-start."
+            ) from exc
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f"Created {summary.businesses:,} businesses, {summary.stations:,} stations, {summary.cards:,} cards, "
+            f"{summary.registrations:,} wallet registrations and {summary.transactions:,} transactions "
+            f"in {elapsed:.1f}s ({summary.transactions / elapsed:,.0f} transactions/s)."
+        )
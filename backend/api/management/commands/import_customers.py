@@ -0,0 +1,68 @@
+import json
+import sys
+import time
+import uuid
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.imports import IMPORT_CHUNK_SIZE, IMPORT_FORMATS, import_customers
+from api.models import Business
+from api.sharding import shard_map, use_shard
+
+
+class Command(BaseCommand):
+    help = (
+        "Import customers and loyalty cards for a business from a CSV or NDJSON file "
+        "(columns: name, phone_number, optional points_balance)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("business_id")
+        parser.add_argument("path", help='File to import, or "-" for standard input.')
+        parser.add_argument("--format", choices=sorted(IMPORT_FORMATS),
+                            help="Defaults to the file extension, or csv for standard input.")
+        parser.add_argument("--opening-balances", action="store_true",
+                            help="Seed new cards with the points_balance column.")
+        parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or ("ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv")
+
+        try:
+            business_id = uuid.UUID(options["business_id"])
+            alias = shard_map.shard_for(business_id)
+            business = Business.objects.using(alias).get(pk=business_id)
+        except (ValueError, Business.DoesNotExist) as exc:
+            raise CommandError(f"Unknown business {options['business_id']}.") from exc
+
+        started = time.perf_counter()
+
+        def progress(summary):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{summary.rows:,} rows read, {summary.cards_created:,} cards created "
+                f"({summary.rows / elapsed:,.0f} rows/s)"
+            )
+
+        try:
+            stream = sys.stdin.buffer if path == "-" else Path(path).open("rb")
+        except OSError as exc:
+            raise CommandError(str(exc)) from exc
+        with stream, use_shard(alias):
+            summary = import_customers(
+                business,
+                IMPORT_FORMATS[file_format](stream),
+                opening_balances=options["opening_balances"],
+                chunk_size=options["chunk_size"],
+                progress=progress,
+            )
+
+        result = summary.as_dict()
+        errors = result.pop("errors")
+        self.stdout.write(json.dumps(result))
+        for error in errors:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        if summary.error_count > len(errors):
+            self.stderr.write(f"... and {summary.error_count - len(errors):,} more errors.")
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.sharding import BusinessMover
+
+
+class Command(BaseCommand):
+    help = "Move a business and all of its rows to another tenant shard while it keeps serving traffic."
+
+    def add_arguments(self, parser):
+        parser.add_argument("business_id")
+        parser.add_argument("target", help="Database alias of the destination shard.")
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument(
+            "--wait",
+            type=float,
+            default=None,
+            help="Seconds to wait after flipping the directory (defaults to TENANT_SHARD_CACHE_SECONDS).",
+        )
+
+    def handle(self, *args, **options):
+        mover = BusinessMover(
+            options["business_id"],
+            options["target"],
+            batch_size=options["batch_size"],
+            log=self.stdout.write,
+        )
+        self.stdout.write(f"Moving {options['business_id']} from {mover.source} to {mover.target}.")
+        try:
+            mover.run(wait_seconds=options["wait"])
+        except ValueError as exc:
+            raise CommandError(str(exc)) from exc
@@ -0,0 +1,58 @@
+import json
+import sys
+import uuid
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Business
+from api.provisioning import MAX_PROVISIONED_STATIONS, provision_stations
+from api.sharding import shard_map, use_shard
+
+
+class Command(BaseCommand):
+    help = (
+        "Create many stations for a business at once, either from a file with one name per line "
+        "or as --count numbered stations named after --prefix. Prints one JSON object per station."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("business_id")
+        parser.add_argument("--names-file", help='File with one station name per line, or "-" for standard input.')
+        parser.add_argument("--count", type=int, default=0, help="Create this many numbered stations.")
+        parser.add_argument("--prefix", default="Register", help="Name of numbered stations (default: Register).")
+
+    def handle(self, *args, **options):
+        try:
+            business_id = uuid.UUID(options["business_id"])
+            alias = shard_map.shard_for(business_id)
+            business = Business.objects.using(alias).get(pk=business_id)
+        except (ValueError, Business.DoesNotExist) as exc:
+            raise CommandError(f"Unknown business {options['business_id']}.") from exc
+
+        if options["names_file"]:
+            if options["names_file"] == "-":
+                lines = sys.stdin.read().splitlines()
+            else:
+                try:
+                    lines = Path(options["names_file"]).read_text().splitlines()
+                except OSError as exc:
+                    raise CommandError(str(exc)) from exc
+            names = [line.strip() for line in lines if line.strip()]
+        else:
+            names = [f"{options['prefix']} {number}" for number in range(1, options["count"] + 1)]
+        if not names:
+            raise CommandError("Give --names-file or a positive --count.")
+
+        created = 0
+        with use_shard(alias):
+            for start in range(0, len(names), MAX_PROVISIONED_STATIONS):
+                for station in provision_stations(business, names[start:start + MAX_PROVISIONED_STATIONS]):
+                    self.stdout.write(json.dumps({
+                        "id": str(station.pk),
+                        "name": station.name,
+                        "public_slug": station.public_slug,
+                        "api_token": station.api_token,
+                    }))
+                    created += 1
+        self.stderr.write(f"Created {created:,} stations for {business.name}.")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api.prepared import purge_expired_prepared_passes
+from api.sharding import tenant_shards
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete expired prepared passes on every tenant shard. Stations that keep issuing "
+        "clean their own queues; this catches the ones that stopped."
+    )
+
+    def handle(self, *args, **options):
+        for alias in tenant_shards():
+            deleted = purge_expired_prepared_passes(alias)
+            self.stdout.write(f"{alias}: {deleted:,} expired prepared passes deleted")
@@ -0,0 +1,52 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.apns_stub import ApnsStub
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve a local APNs stand-in over cleartext HTTP/2 until interrupted. Start the backend with "
+        "APNS_ENDPOINT=http://<host>:<port> to send Wallet update pushes to it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=2197)
+        parser.add_argument("--topic", default=settings.APNS_TOPIC,
+                            help="Topic pushes must carry; an empty value accepts any topic.")
+        parser.add_argument("--latency-ms", type=float, default=0.0)
+        parser.add_argument("--jitter-ms", type=float, default=0.0)
+        parser.add_argument("--unregistered-rate", type=float, default=0.0,
+                            help="Fraction of pushes answered with 410 Unregistered.")
+        parser.add_argument("--throttle-rate", type=float, default=0.0,
+                            help="Fraction of pushes answered with 429 TooManyRequests.")
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--verbose-pushes", action="store_true", help="Print every push as it is answered.")
+
+    def handle(self, *args, **options):
+        stub = ApnsStub(
+            host=options["host"],
+            port=options["port"],
+            topic=options["topic"] or None,
+            latency_ms=options["latency_ms"],
+            jitter_ms=options["jitter_ms"],
+            unregistered_rate=options["unregistered_rate"],
+            throttle_rate=options["throttle_rate"],
+            seed=options["seed"],
+        )
+        self.stdout.write(f"APNs stub listening on {stub.url} (set APNS_ENDPOINT={stub.url}). Ctrl-C to stop.")
+        seen = 0
+        with stub:
+            try:
+                while True:
+                    time.sleep(1)
+                    if options["verbose_pushes"]:
+                        for push in stub.received[seen:]:
+                            self.stdout.write(f"{push.status} {push.reason or 'OK'} {push.device_token} {push.topic}")
+                        seen = len(stub.received)
+            except KeyboardInterrupt:
+                pass
+        self.stdout.write(f"Answered {len(stub.received):,} pushes: {dict(sorted(stub.counts().items()))}")
@@ -0,0 +1,51 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.bench import scratch_database
+from api.benchmarks import BENCHMARKS, DEFAULT_THRESHOLD, environment, run_benchmarks
+
+from .compare_benchmarks import report_comparison
+
+
+class Command(BaseCommand):
+    help = "Time the backend hot paths on a scratch database and optionally save or compare a JSON baseline."
+
+    def add_arguments(self, parser):
+        parser.add_argument("names", nargs="*", help=f"Benchmarks to run (default: all of {', '.join(BENCHMARKS)}).")
+        parser.add_argument("--max-scale", type=int, help="Skip cases larger than this many rows (e.g. 10000 for a quick run).")
+        parser.add_argument("--repeat", type=int, help="Rounds per case, overriding each benchmark's default.")
+        parser.add_argument("--save", help="Write the results to this JSON file.")
+        parser.add_argument("--compare", help="Compare against this baseline JSON file and fail on regressions.")
+        parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                            help="Allowed slowdown of the median before a case counts as a regression (0.10 = 10%%).")
+
+    def handle(self, *args, **options):
+        unknown = set(options["names"]) - set(BENCHMARKS)
+        if unknown:
+            raise CommandError(f"Unknown benchmarks: {', '.join(sorted(unknown))}.")
+
+        with scratch_database():
+            results = run_benchmarks(
+                names=options["names"],
+                max_scale=options["max_scale"],
+                repeat=options["repeat"],
+                log=self.stdout.write,
+            )
+
+        self.stdout.write(f"{'case':<36}{'median ms':>12}{'min ms':>12}{'max ms':>12}{'rounds':>8}")
+        for key, summary in results.items():
+            self.stdout.write(
+                f"{key:<36}{summary['median_ms']:>12.3f}{summary['min_ms']:>12.3f}"
+                f"{summary['max_ms']:>12.3f}{summary['rounds']:>8}"
+            )
+
+        if options["save"]:
+            document = {"environment": environment(), "results": results}
+            Path(options["save"]).write_text(json.dumps(document, indent=2, sort_keys=True))
+            self.stdout.write(f"Saved {len(results)} results to {options['save']}.")
+
+        if options["compare"]:
+            baseline = json.loads(Path(options["compare"]).read_text())["results"]
+            report_comparison(self.stdout, baseline, results, options["threshold"])
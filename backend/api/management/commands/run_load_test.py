@@ -0,0 +1,136 @@
+import json
+import tempfile
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from api.apns_stub import ApnsStub
+from api.bench import scratch_database
+from api.loadtest import LoadPlan, local_server, run_load
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the HTTP API with simulated stations, Wallet devices and dashboard owners and report "
+        "latency percentiles, error rates and throughput per operation. Without --base-url the "
+        "server runs in this process against a scratch database, which is convenient but shares "
+        "the CPU with the load generator; point --base-url at a separately started server "
+        "(e.g. gunicorn) for capacity numbers."
+    )
+
+    def add_arguments(self, parser):
+        defaults = LoadPlan()
+        parser.add_argument("--base-url", help="Server to load, e.g. http://127.0.0.1:8000.")
+        parser.add_argument("--businesses", type=int, default=defaults.businesses)
+        parser.add_argument("--stations", type=int, default=defaults.stations)
+        parser.add_argument("--devices", type=int, default=defaults.devices)
+        parser.add_argument("--owners", type=int, default=defaults.owners)
+        parser.add_argument("--duration", type=float, default=defaults.duration, help="Seconds to run.")
+        parser.add_argument("--station-rate", type=float, default=defaults.station_rate,
+                            help="Requests per second per station; 0 means back to back.")
+        parser.add_argument("--device-rate", type=float, default=defaults.device_rate)
+        parser.add_argument("--owner-rate", type=float, default=defaults.owner_rate)
+        parser.add_argument("--issue-share", type=float, default=defaults.issue_share,
+                            help="Fraction of station requests that issue a new card.")
+        parser.add_argument("--redeem-share", type=float, default=defaults.redeem_share)
+        parser.add_argument("--cards", type=int, default=defaults.cards, help="Cards issued per business up front.")
+        parser.add_argument("--passes-per-device", type=int, default=defaults.passes_per_device)
+        parser.add_argument("--seed", type=int, default=defaults.seed)
+        parser.add_argument("--timeout", type=float, default=defaults.timeout, help="Per-request timeout in seconds.")
+        parser.add_argument("--apns-port", type=int, default=0,
+                            help="Port of the local APNs stub; fix it to point an external server's APNS_ENDPOINT at it.")
+        parser.add_argument("--apns-latency-ms", type=float, default=0.0, help="Delay the stub adds to every push.")
+        parser.add_argument("--apns-unregistered-rate", type=float, default=0.0,
+                            help="Fraction of pushes the stub answers with 410 Unregistered.")
+        parser.add_argument("--apns-throttle-rate", type=float, default=0.0,
+                            help="Fraction of pushes the stub answers with 429 TooManyRequests.")
+        parser.add_argument("--json", help="Also write the results to this file.")
+
+    def handle(self, *args, **options):
+        plan = LoadPlan(
+            businesses=options["businesses"],
+            stations=options["stations"],
+            devices=options["devices"],
+            owners=options["owners"],
+            duration=options["duration"],
+            station_rate=options["station_rate"],
+            device_rate=options["device_rate"],
+            owner_rate=options["owner_rate"],
+            issue_share=options["issue_share"],
+            redeem_share=options["redeem_share"],
+            cards=options["cards"],
+            passes_per_device=options["passes_per_device"],
+            seed=options["seed"],
+            timeout=options["timeout"],
+        )
+
+        with ExitStack() as stack:
+            stub = stack.enter_context(
+                ApnsStub(
+                    port=options["apns_port"],
+                    topic=settings.APNS_TOPIC,
+                    latency_ms=options["apns_latency_ms"],
+                    unregistered_rate=options["apns_unregistered_rate"],
+                    throttle_rate=options["apns_throttle_rate"],
+                    seed=options["seed"],
+                )
+            )
+            base_url = options["base_url"]
+            if base_url:
+                self.stdout.write(f"APNs stub listening on {stub.url}; start the server with APNS_ENDPOINT={stub.url} to count pushes.")
+            else:
+                directory = stack.enter_context(tempfile.TemporaryDirectory())
+                stack.enter_context(scratch_database(name=str(Path(directory) / "load.sqlite3")))
+                stack.enter_context(override_settings(**stub.settings(directory)))
+                base_url = stack.enter_context(local_server())
+            self.stdout.write(f"Loading {base_url} for {plan.duration:.0f}s...")
+            summary, statuses, elapsed = run_load(
+                base_url, plan, settings.APPLE_PASS_TYPE_IDENTIFIER, log=self.stdout.write
+            )
+            pushes = stub.counts()
+
+        self.stdout.write(
+            f"\n{'operation':<30}{'requests':>10}{'req/s':>9}{'errors':>9}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}"
+        )
+        for operation in sorted(summary, key=lambda name: (name == "all", name)):
+            stats = summary[operation]
+            self.stdout.write(
+                f"{operation:<30}{stats.requests:>10,}{stats.throughput:>9.1f}{stats.error_rate:>9.2%}"
+                f"{stats.p50_ms:>8.1f}ms{stats.p90_ms:>8.1f}ms{stats.p99_ms:>8.1f}ms{stats.max_ms:>8.1f}ms"
+            )
+        total_pushes = sum(pushes.values())
+        self.stdout.write(
+            f"\nAPNs pushes received: {total_pushes:,} ({total_pushes / elapsed:.1f}/s), "
+            f"by status: {dict(sorted(pushes.items()))}"
+        )
+        failing = {
+            operation: {status: count for status, count in counts.items() if status not in (200, 201)}
+            for operation, counts in statuses.items()
+        }
+        for operation, counts in sorted(failing.items()):
+            if counts:
+                self.stdout.write(f"  {operation} failures by status: {counts}")
+
+        if options["json"]:
+            Path(options["json"]).write_text(
+                json.dumps(
+                    {
+                        "plan": vars(plan),
+                        "elapsed_s": round(elapsed, 3),
+                        "apns_pushes": {str(status): count for status, count in pushes.items()},
+                        "operations": {
+                            operation: {**vars(stats), "error_rate": stats.error_rate}
+                            for operation, stats in summary.items()
+                        },
+                        "statuses": {
+                            operation: {str(status): count for status, count in counts.items()}
+                            for operation, counts in statuses.items()
+                        },
+                    },
+                    indent=2,
+                    sort_keys=True,
+                )
+            )
@@ -0,0 +1,176 @@
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+SCHEMA = [
+    "CREATE TABLE card (id integer PRIMARY KEY, business_id integer NOT NULL, balance integer NOT NULL)",
+    "CREATE TABLE txn (id integer PRIMARY KEY, business_id integer NOT NULL, card_id integer NOT NULL, "
+    "amount integer NOT NULL, points integer NOT NULL, created_at real NOT NULL)",
+    "CREATE INDEX txn_business_created ON txn (business_id, created_at)",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Run concurrent checkout writers and dashboard readers against a scratch SQLite file, "
+        "once with Django's default connection setup and once with the production profile."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--writers", type=int, default=8)
+        parser.add_argument("--readers", type=int, default=8)
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds per configuration.")
+        parser.add_argument("--businesses", type=int, default=10)
+        parser.add_argument("--cards", type=int, default=2000)
+        parser.add_argument("--seed-rows", type=int, default=100_000)
+        parser.add_argument("--timeout", type=float, default=None, help="Override the lock timeout in seconds.")
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'profile':<12}{'writes/s':>10}{'reads/s':>10}{'write p50':>11}{'write p99':>11}"
+            f"{'read p99':>10}{'lock errs':>11}{'lock rate':>11}"
+        )
+        for profile in ("default", "production"):
+            with tempfile.TemporaryDirectory() as tmp:
+                result = self._run(Path(tmp) / "load.sqlite3", profile, options)
+            self.stdout.write(
+                f"{profile:<12}{result['writes_per_s']:>10,.0f}{result['reads_per_s']:>10,.0f}"
+                f"{result['write_p50_ms']:>9.1f}ms{result['write_p99_ms']:>9.1f}ms{result['read_p99_ms']:>8.1f}ms"
+                f"{result['lock_errors']:>11,}{result['lock_rate']:>10.2%}"
+            )
+
+    def _connect(self, path, profile, timeout_override):
+        if profile == "production":
+            pragmas = settings.SQLITE_PRODUCTION_PRAGMAS
+            timeout = timeout_override if timeout_override is not None else pragmas["busy_timeout"] / 1000
+            conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+            for name, value in pragmas.items():
+                conn.execute(f"PRAGMA {name}={value}")
+            if timeout_override is not None:
+                conn.execute(f"PRAGMA busy_timeout={int(timeout_override * 1000)}")
+            return conn, "BEGIN IMMEDIATE"
+        # Matches Django's stock SQLite settings: rollback journal, sqlite3's
+        # default 5s timeout and deferred transactions.
+        timeout = timeout_override if timeout_override is not None else 5.0
+        conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        return conn, "BEGIN"
+
+    def _seed(self, path, options):
+        conn = sqlite3.connect(path)
+        for statement in SCHEMA:
+            conn.execute(statement)
+        rng = random.Random(0)
+        conn.executemany(
+            "INSERT INTO card (id, business_id, balance) VALUES (?, ?, 0)",
+            ((card, card % options["businesses"]) for card in range(options["cards"])),
+        )
+        now = time.time()
+        conn.executemany(
+            "INSERT INTO txn (business_id, card_id, amount, points, created_at) VALUES (?, ?, ?, ?, ?)",
+            (
+                (card % options["businesses"], card, rng.randint(100, 5000), 10, now - rng.random() * 30 * 86400)
+                for card in (rng.randrange(options["cards"]) for _ in range(options["seed_rows"]))
+            ),
+        )
+        conn.commit()
+        conn.close()
+
+    def _run(self, path, profile, options):
+        self._seed(path, options)
+        if profile == "production":
+            # journal_mode=WAL is persistent, so set it once before the workers start.
+            conn, _ = self._connect(path, profile, None)
+            conn.close()
+
+        stop_at = time.perf_counter() + options["duration"]
+        lock = threading.Lock()
+        stats = {"write_latencies": [], "read_latencies": [], "lock_errors": 0, "attempts": 0}
+
+        def record(kind, latency=None, locked=False):
+            with lock:
+                stats["attempts"] += 1
+                if locked:
+                    stats["lock_errors"] += 1
+                else:
+                    stats[kind].append(latency)
+
+        def writer(worker):
+            rng = random.Random(worker)
+            conn, begin = self._connect(path, profile, options["timeout"])
+            while time.perf_counter() < stop_at:
+                card = rng.randrange(options["cards"])
+                started = time.perf_counter()
+                try:
+                    conn.execute(begin)
+                    # Read-then-write, like the checkout path's select_for_update + save.
+                    conn.execute("SELECT balance FROM card WHERE id = ?", (card,)).fetchone()
+                    conn.execute("UPDATE card SET balance = balance + 10 WHERE id = ?", (card,))
+                    conn.execute(
+                        "INSERT INTO txn (business_id, card_id, amount, points, created_at) VALUES (?, ?, ?, ?, ?)",
+                        (card % options["businesses"], card, 1000, 10, time.time()),
+                    )
+                    conn.execute("COMMIT")
+                except sqlite3.OperationalError as exc:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    if "locked" not in str(exc) and "busy" not in str(exc):
+                        raise
+                    record("write_latencies", locked=True)
+                else:
+                    record("write_latencies", time.perf_counter() - started)
+            conn.close()
+
+        def reader(worker):
+            rng = random.Random(1000 + worker)
+            conn, _ = self._connect(path, profile, options["timeout"])
+            while time.perf_counter() < stop_at:
+                business = rng.randrange(options["businesses"])
+                started = time.perf_counter()
+                try:
+                    conn.execute(
+                        "SELECT count(*), sum(amount), sum(points) FROM txn WHERE business_id = ? AND created_at >= ?",
+                        (business, time.time() - 7 * 86400),
+                    ).fetchone()
+                except sqlite3.OperationalError as exc:
+                    if "locked" not in str(exc) and "busy" not in str(exc):
+                        raise
+                    record("read_latencies", locked=True)
+                else:
+                    record("read_latencies", time.perf_counter() - started)
+            conn.close()
+
+        threads = [threading.Thread(target=writer, args=(index,)) for index in range(options["writers"])]
+        threads += [threading.Thread(target=reader, args=(index,)) for index in range(options["readers"])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        def percentile(values, fraction):
+            if not values:
+                return 0.0
+            if len(values) == 1:
+                return values[0] * 1000
+            return statistics.quantiles(values, n=100)[int(fraction * 100) - 1] * 1000
+
+        writes = stats["write_latencies"]
+        reads = stats["read_latencies"]
+        return {
+            "writes_per_s": len(writes) / elapsed,
+            "reads_per_s": len(reads) / elapsed,
+            "write_p50_ms": percentile(writes, 0.50),
+            "write_p99_ms": percentile(writes, 0.99),
+            "read_p99_ms": percentile(reads, 0.99),
+            "lock_errors": stats["lock_errors"],
+            "lock_rate": stats["lock_errors"] / stats["attempts"] if stats["attempts"] else 0.0,
+        }
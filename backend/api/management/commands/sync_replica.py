@@ -0,0 +1,27 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from server.replica import copy_sqlite_database
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database into the read replica, once or on an interval."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=0, help="Repeat every N seconds.")
+
+    def handle(self, *args, **options):
+        alias = settings.DATABASE_REPLICA_ALIAS
+        if alias not in connections.settings:
+            raise CommandError("No replica configured; set DJANGO_DB_REPLICA_NAME.")
+
+        while True:
+            started = time.perf_counter()
+            copy_sqlite_database(target_alias=alias)
+            self.stdout.write(f"Replica synced in {(time.perf_counter() - started) * 1000:.0f}ms")
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
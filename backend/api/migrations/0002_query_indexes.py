@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-19 05:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='loyaltycard',
+            index=models.Index(fields=['business_customer', 'created_at'], name='card_bc_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='passregistration',
+            index=models.Index(fields=['device_library_identifier', 'pass_type_identifier'], name='passreg_device_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='passregistration',
+            index=models.Index(fields=['updated_at'], name='passreg_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['station', 'created_at'], name='txn_station_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['loyalty_card', 'created_at'], name='txn_card_created_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+BACKFILL_CHUNK_SIZE = 5000
+
+
+def backfill_transaction_business(apps, schema_editor):
+    Station = apps.get_model("api", "Station")
+    Transaction = apps.get_model("api", "Transaction")
+    db_alias = schema_editor.connection.alias
+
+    station_business = Station.objects.using(db_alias).filter(pk=OuterRef("station_id")).values("business_id")[:1]
+    transactions = Transaction.objects.using(db_alias).order_by("pk")
+    # Walk the primary key: nothing indexes business yet, so filtering on it
+    # would rescan the table for every chunk.
+    last_pk = None
+    while True:
+        page = transactions if last_pk is None else transactions.filter(pk__gt=last_pk)
+        chunk = list(page.values_list("pk", flat=True)[:BACKFILL_CHUNK_SIZE])
+        if not chunk:
+            break
+        Transaction.objects.using(db_alias).filter(pk__in=chunk, business__isnull=True).update(
+            business_id=Subquery(station_business)
+        )
+        last_pk = chunk[-1]
+
+
+class Migration(migrations.Migration):
+
+    # Each backfill chunk commits on its own so large tables are never locked
+    # for the whole migration.
+    atomic = False
+
+    dependencies = [
+        ('api', '0002_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='business',
+            field=models.ForeignKey(db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='api.business'),
+        ),
+        migrations.RunPython(backfill_transaction_business, migrations.RunPython.noop),
+    ]
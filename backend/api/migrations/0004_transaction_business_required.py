@@ -0,0 +1,21 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_transaction_business'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='business',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.CASCADE, to='api.business'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['business', 'created_at'], name='txn_business_created_idx'),
+        ),
+    ]
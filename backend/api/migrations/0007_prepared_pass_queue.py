@@ -0,0 +1,29 @@
+# Generated by Django 5.2.7 on 2026-10-19 06:54
+
+import api.ids
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_tenant_shard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PreparedPass',
+            fields=[
+                ('id', models.UUIDField(default=api.ids.uuid7, editable=False, primary_key=True, serialize=False)),
+                ('expires_at', models.DateTimeField()),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('claim_token', models.CharField(blank=True, max_length=32, null=True, unique=True)),
+                ('loyalty_card', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.loyaltycard')),
+                ('station', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prepared_passes', to='api.station')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['station', 'claimed_at', 'id'], name='prepared_station_queue_idx'), models.Index(fields=['expires_at'], name='prepared_expires_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:10
+
+import api.models
+from django.db import migrations, models
+
+
+BACKFILL_CHUNK_SIZE = 5000
+
+
+def backfill_pass_version(apps, schema_editor):
+    # Versions are floored at the clock in milliseconds, so an existing card
+    # starts at its updated_at and the ISO lastUpdated tags devices already
+    # hold keep comparing correctly.
+    LoyaltyCard = apps.get_model("api", "LoyaltyCard")
+    db_alias = schema_editor.connection.alias
+
+    pending = LoyaltyCard.objects.using(db_alias).order_by("pk")
+    last_pk = None
+    while True:
+        chunk = pending if last_pk is None else pending.filter(pk__gt=last_pk)
+        cards = list(chunk.only("pk", "updated_at")[:BACKFILL_CHUNK_SIZE])
+        if not cards:
+            break
+        for card in cards:
+            card.pass_version = int(card.updated_at.timestamp() * 1000)
+        LoyaltyCard.objects.using(db_alias).bulk_update(cards, ["pass_version"])
+        last_pk = cards[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    # Each backfill chunk commits on its own so large tables are never locked
+    # for the whole migration.
+    atomic = False
+
+    dependencies = [
+        ('api', '0007_prepared_pass_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loyaltycard',
+            name='pass_version',
+            field=models.BigIntegerField(default=api.models.clock_pass_version),
+        ),
+        migrations.RunPython(backfill_pass_version, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='loyaltycard',
+            index=models.Index(fields=['pass_version'], name='card_pass_version_idx'),
+        ),
+    ]
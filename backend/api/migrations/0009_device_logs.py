@@ -0,0 +1,25 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_card_pass_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('received_at', models.DateTimeField(db_index=True)),
+                ('fingerprint', models.CharField(max_length=255)),
+                ('message', models.CharField(max_length=1000)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['fingerprint', 'received_at'], name='device_log_fingerprint_idx')],
+            },
+        ),
+    ]
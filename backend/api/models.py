@@ -1,9 +1,31 @@
 from decimal import Decimal
 from django.db import models
+from django.db.models import Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
 from django.utils.text import slugify
 import secrets
+import time
 import uuid
 
+from .ids import uuid7
+
+def clock_pass_version():
+    """The clock in milliseconds: new cards' pass_version and the floor of later ones."""
+    return int(time.time() * 1000)
+
+
+def next_pass_version():
+    """
+    Expression for a card's next pass_version: one past the newest version
+    on the card's database, and at least the clock in milliseconds. It is
+    evaluated inside the UPDATE, and SQLite runs one writer at a time, so
+    versions grow in commit order; the clock floor keeps versions from
+    different shards comparable for a device holding passes from both.
+    """
+    newest = LoyaltyCard.objects.order_by("-pass_version").values("pass_version")[:1]
+    return Greatest(Coalesce(Subquery(newest), Value(0)) + 1, Value(clock_pass_version()))
+
+
 class Business(models.Model):
 
     id = models.UUIDField(
@@ -101,6 +123,8 @@ class LoyaltyCard(models.Model):
         on_delete = models.CASCADE
     )
 
+    # Random, not time-ordered: the token is the QR payload and the pass
+    # serial, so a uuid7 would tell anyone holding a card when it was made.
     token = models.UUIDField(
         primary_key = True,
         default = uuid.uuid4,
@@ -152,6 +176,30 @@ class LoyaltyCard(models.Model):
         unique=True
     )
 
+    # Bumped (see api.passkit.next_pass_version) whenever the pass a device
+    # holds for this card changes; Wallet devices sync against it.
+    pass_version = models.BigIntegerField(
+        default=clock_pass_version
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["business_customer", "created_at"], name="card_bc_created_idx"),
+            models.Index(fields=["pass_version"], name="card_pass_version_idx"),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Every saved change may alter the pass, so it gets a new version the
+        # way updated_at gets a new time, or devices would never fetch it.
+        if not self._state.adding:
+            self.pass_version = next_pass_version()
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "pass_version"}
+        super().save(*args, **kwargs)
+        if not isinstance(self.pass_version, int):
+            # Computed in the UPDATE; dropping it reloads the value when read.
+            del self.__dict__["pass_version"]
+
     def __str__(self):
         return f"Customer: {self.business_customer.customer.name} | Points: {self.points_balance}"
 
@@ -204,23 +252,52 @@ class Station(models.Model):
         if not self.api_token:
             self.api_token = secrets.token_hex(32)
         if not self.public_slug:
-            self.public_slug = self._generate_unique_slug()
+            self.public_slug = self._generate_unique_slug(kwargs.get("using"))
         super().save(*args, **kwargs)
 
-    def _generate_unique_slug(self):
-        base_slug = slugify(self.name) or uuid.uuid4().hex[:8]
-        slug = base_slug
-        counter = 1
-        while Station.objects.filter(public_slug=slug).exclude(pk=self.pk).exists():
-            slug = f"{base_slug}-{counter}"
-            counter += 1
-        return slug
+    def _generate_unique_slug(self, using=None):
+        return Station.allocate_slugs([self.name], using=using, exclude_pk=self.pk)[0]
+
+    @staticmethod
+    def allocate_slugs(names, using=None, exclude_pk=None):
+        """
+        One free public slug per name, in order: the slugified name, then
+        name-1, name-2, ... A single query fetches every taken slug that
+        could collide, as a range scan of the unique index per base slug
+        ("base" and "base-" up to "base."), so the cost does not grow with
+        the number of collisions.
+        """
+        bases = [slugify(name) or uuid.uuid4().hex[:8] for name in names]
+        distinct = set(bases)
+        taken = set()
+        if distinct:
+            prefixes = models.Q()
+            for base in distinct:
+                prefixes |= models.Q(public_slug=base) | models.Q(public_slug__gt=f"{base}-", public_slug__lt=f"{base}.")
+            queryset = Station.objects.filter(prefixes)
+            if using:
+                queryset = queryset.using(using)
+            if exclude_pk is not None:
+                queryset = queryset.exclude(pk=exclude_pk)
+            taken = set(queryset.values_list("public_slug", flat=True))
+
+        slugs, counters = [], {}
+        for base in bases:
+            counter = counters.get(base, 0)
+            slug = base if counter == 0 else f"{base}-{counter}"
+            while slug in taken:
+                counter += 1
+                slug = f"{base}-{counter}"
+            taken.add(slug)
+            counters[base] = counter + 1
+            slugs.append(slug)
+        return slugs
 
 class Transaction(models.Model):
 
     id = models.UUIDField(
         primary_key=True,
-        default=uuid.uuid4,
+        default=uuid7,
         editable=False
     )
 
@@ -236,6 +313,15 @@ class Transaction(models.Model):
         on_delete = models.CASCADE
     )
 
+    # Copied from station.business so tenant-scoped queries skip the joins.
+    # The (business, created_at) index below also serves plain business lookups.
+    business = models.ForeignKey(
+        Business,
+        on_delete = models.CASCADE,
+        editable = False,
+        db_index = False
+    )
+
     points_earned = models.PositiveIntegerField(
         default = 0
     )
@@ -259,9 +345,24 @@ class Transaction(models.Model):
         auto_now_add = True
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["station", "created_at"], name="txn_station_created_idx"),
+            models.Index(fields=["loyalty_card", "created_at"], name="txn_card_created_idx"),
+            models.Index(fields=["business", "created_at"], name="txn_business_created_idx"),
+        ]
+
     def __str__(self):
         return f"Txn {self.id} | {self.points_earned} pts"
 
+    def save(self, *args, **kwargs):
+        if not self.business_id and self.station_id:
+            if Transaction.station.is_cached(self):
+                self.business_id = self.station.business_id
+            else:
+                self.business_id = Station.objects.values_list("business_id", flat=True).get(pk=self.station_id)
+        super().save(*args, **kwargs)
+
 
 class PassRegistration(models.Model):
     loyalty_card = models.ForeignKey(
@@ -276,6 +377,112 @@ class PassRegistration(models.Model):
 
     class Meta:
         unique_together = ("loyalty_card", "device_library_identifier", "pass_type_identifier")
+        indexes = [
+            models.Index(
+                fields=["device_library_identifier", "pass_type_identifier"],
+                name="passreg_device_type_idx",
+            ),
+            models.Index(fields=["updated_at"], name="passreg_updated_idx"),
+        ]
 
     def __str__(self):
         return f"{self.device_library_identifier} -> {self.loyalty_card_id}"
+
+
+class TenantShard(models.Model):
+    """
+    Directory entry mapping a business to the database alias holding its rows.
+    Always stored on the default database; businesses without an entry live on
+    TENANT_DEFAULT_SHARD.
+    """
+
+    business_id = models.UUIDField(
+        primary_key=True
+    )
+    alias = models.CharField(
+        max_length=64
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True
+    )
+
+    def __str__(self):
+        return f"{self.business_id} -> {self.alias}"
+
+
+class PreparedPass(models.Model):
+    """
+    A card staged at a station, waiting for its customer to open the public
+    pass page. Entries are handed out oldest first (ids are time-ordered);
+    claiming one stamps claimed_at and a claim token so the same customer
+    can fetch it again until it expires.
+    """
+
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid7,
+        editable=False
+    )
+
+    station = models.ForeignKey(
+        Station,
+        on_delete=models.CASCADE,
+        related_name="prepared_passes",
+    )
+
+    loyalty_card = models.ForeignKey(
+        LoyaltyCard,
+        on_delete=models.CASCADE,
+        related_name="+",
+    )
+
+    expires_at = models.DateTimeField()
+
+    claimed_at = models.DateTimeField(
+        null=True,
+        blank=True
+    )
+
+    claim_token = models.CharField(
+        max_length=32,
+        null=True,
+        blank=True,
+        unique=True
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["station", "claimed_at", "id"], name="prepared_station_queue_idx"),
+            models.Index(fields=["expires_at"], name="prepared_expires_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.station_id} <- {self.loyalty_card_id}"
+
+
+class DeviceLog(models.Model):
+    """
+    A line Apple Wallet devices POST to the PassKit log endpoint. The
+    fingerprint is the message with its variable parts (timestamps, URLs,
+    identifiers, numbers) masked, so equal failures group together.
+    """
+
+    received_at = models.DateTimeField(
+        db_index=True
+    )
+
+    fingerprint = models.CharField(
+        max_length=255
+    )
+
+    message = models.CharField(
+        max_length=1000
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["fingerprint", "received_at"], name="device_log_fingerprint_idx"),
+        ]
+
+    def __str__(self):
+        return self.fingerprint
@@ -0,0 +1,47 @@
+"""
+Signed, expiring links to a staged pass.
+
+The issue view used to hand customers the prepared-pass URL with the
+station's api_token in it, which is the station's credential. A pass link
+instead carries an expiry and an HMAC over (station, card, expiry) keyed
+by SECRET_KEY, so the download view can check it without loading the
+station and the link grants nothing beyond that one card until it expires.
+"""
+
+import time
+
+from django.conf import settings
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+KEY_SALT = "api.pass_links"
+
+
+def pass_link_signature(station_id, card_token, expires):
+    value = f"{station_id}:{card_token}:{expires}"
+    return salted_hmac(KEY_SALT, value, algorithm="sha256").hexdigest()[:32]
+
+
+def signed_pass_path(station_id, card_token, expires=None, url_name="station-signed-pass"):
+    """
+    Path and query of a pass link valid for PASS_LINK_TTL_SECONDS. With
+    url_name="station-signed-pass-qr" the same signature unlocks the
+    card's QR code images.
+    """
+    if expires is None:
+        expires = int(time.time()) + settings.PASS_LINK_TTL_SECONDS
+    path = reverse(url_name, args=[station_id, card_token])
+    return f"{path}?expires={expires}&signature={pass_link_signature(station_id, card_token, expires)}"
+
+
+def pass_link_problem(station_id, card_token, expires, signature, now=None):
+    """Why a pass link is not valid, or None when it is."""
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return "Invalid pass link."
+    if not constant_time_compare(signature or "", pass_link_signature(station_id, card_token, expires)):
+        return "Invalid pass link."
+    if expires <= (now if now is not None else time.time()):
+        return "Pass link expired."
+    return None
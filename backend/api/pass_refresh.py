@@ -0,0 +1,205 @@
+"""
+Background fan-out of pass updates to a business's devices.
+
+Two jobs share one paced sender:
+
+- refresh_business_passes, after a branding change: a new name, colour or
+  reward rule makes every pass of the business stale. It renders the new
+  pass template once, gives all of the business's cards a new pass_version
+  in chunked UPDATEs (so devices list them as changed), then streams the
+  registrations in pk order.
+- push_card_updates, after changes that already re-versioned a known set
+  of cards (bulk revocation, see api/wallet_status.py): it only looks up
+  and pushes the devices holding those cards.
+
+Either way each device is pushed once, and pushes go out at
+PASS_REFRESH_PUSHES_PER_SECOND: every push makes a device download its
+passes again, and a business with 100k installed passes must not turn into
+100k downloads in the same second.
+
+schedule_pass_refresh runs the jobs on a daemon thread, one per business
+at a time. Work scheduled while a job runs is merged into a single
+follow-up run (card sets are unioned, and a full refresh covers them), so
+a burst of edits costs two fan-outs, not one per save. With
+PASS_REFRESH_IN_BACKGROUND off (as in tests) the jobs run inline.
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from server.query_budget import extend_query_budget
+
+from .models import Business, LoyaltyCard, PassRegistration, next_pass_version
+from .passkit import business_pass_template
+from .push import PassRegistrationPayload, send_wallet_pass_update
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PassRefresh:
+    cards_updated: int = 0
+    devices_notified: int = 0
+
+
+class _PacedPushes:
+    """Sends update pushes at most `rate` a second, each push token once."""
+
+    def __init__(self, business, rate, sleep):
+        self.business = business
+        self.rate = rate
+        self.sleep = sleep
+        self.step = max(1, int(rate))
+        self.pushed = set()
+        self.sent = 0
+        self.started = time.monotonic()
+
+    def send(self, registrations):
+        """Push the (push_token, card_id) pairs whose device hasn't been pushed yet."""
+        payloads = []
+        for push_token, card_id in registrations:
+            if push_token not in self.pushed:
+                self.pushed.add(push_token)
+                payloads.append(PassRegistrationPayload(push_token=push_token, serial_number=str(card_id)))
+        # At most a second's worth per send, then wait until the rate allows the next.
+        for start in range(0, len(payloads), self.step):
+            batch = payloads[start:start + self.step]
+            try:
+                send_wallet_pass_update(batch)
+            except Exception:  # pragma: no cover - best effort network call
+                logger.exception("Failed to send wallet updates for business %s", self.business.pk)
+            self.sent += len(batch)
+            wait = self.sent / self.rate - (time.monotonic() - self.started)
+            if wait > 0:
+                self.sleep(wait)
+
+
+def _bump_pass_versions(business, alias, chunk_size):
+    cards = LoyaltyCard.objects.using(alias).filter(business_customer__business_id=business.pk).order_by("token")
+    updated, last_token = 0, None
+    while True:
+        extend_query_budget(2)
+        chunk = cards if last_token is None else cards.filter(token__gt=last_token)
+        tokens = list(chunk.values_list("token", flat=True)[:chunk_size])
+        if not tokens:
+            return updated
+        # updated_at too: business moves copy cards changed since the copy began by it.
+        updated += LoyaltyCard.objects.using(alias).filter(pk__in=tokens).update(
+            pass_version=next_pass_version(), updated_at=timezone.now()
+        )
+        last_token = tokens[-1]
+
+
+def _registrations(alias):
+    return PassRegistration.objects.using(alias).exclude(push_token="")
+
+
+def refresh_business_passes(business, chunk_size=None, rate=None, sleep=time.sleep):
+    """
+    Re-version every card of `business` and push its devices, at most
+    `rate` pushes a second. Returns a PassRefresh.
+    """
+    alias = business._state.db
+    chunk_size = chunk_size or settings.PASS_REFRESH_CHUNK_SIZE
+    pushes = _PacedPushes(business, rate or settings.PASS_REFRESH_PUSHES_PER_SECOND, sleep)
+    # Warm the template so the downloads the pushes trigger only fill in card fields.
+    business_pass_template(business)
+    refresh = PassRefresh(cards_updated=_bump_pass_versions(business, alias, chunk_size))
+
+    registrations = _registrations(alias).filter(
+        loyalty_card__business_customer__business_id=business.pk
+    ).order_by("pk")
+    last_pk = 0
+    while True:
+        extend_query_budget(1)
+        rows = list(registrations.filter(pk__gt=last_pk).values_list("pk", "push_token", "loyalty_card_id")[:chunk_size])
+        if not rows:
+            break
+        last_pk = rows[-1][0]
+        pushes.send((push_token, card_id) for _, push_token, card_id in rows)
+    refresh.devices_notified = len(pushes.pushed)
+    return refresh
+
+
+def push_card_updates(business, card_ids, chunk_size=None, rate=None, sleep=time.sleep):
+    """
+    Push the devices holding any of `card_ids` (cards of `business` whose
+    pass_version was already bumped), at most `rate` pushes a second.
+    Returns the number of devices pushed.
+    """
+    alias = business._state.db
+    chunk_size = chunk_size or settings.PASS_REFRESH_CHUNK_SIZE
+    pushes = _PacedPushes(business, rate or settings.PASS_REFRESH_PUSHES_PER_SECOND, sleep)
+    card_ids = list(card_ids)
+    for start in range(0, len(card_ids), chunk_size):
+        extend_query_budget(1)
+        pushes.send(
+            _registrations(alias)
+            .filter(loyalty_card_id__in=card_ids[start:start + chunk_size])
+            .values_list("push_token", "loyalty_card_id")
+        )
+    return len(pushes.pushed)
+
+
+class PassRefreshScheduler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._running = set()
+        # business id -> card ids still to push, or None for a full refresh.
+        self._pending = {}
+
+    def schedule(self, business, card_ids=None):
+        """
+        Refresh all of `business`'s passes, or with `card_ids` only push the
+        devices holding those cards. If a job for the business is running,
+        the work is merged into its follow-up run instead. True if started.
+        """
+        with self._lock:
+            if card_ids is None or self._pending.get(business.pk, ()) is None:
+                self._pending[business.pk] = None
+            else:
+                self._pending.setdefault(business.pk, set()).update(card_ids)
+            if business.pk in self._running:
+                return False
+            self._running.add(business.pk)
+        alias = business._state.db
+        if settings.PASS_REFRESH_IN_BACKGROUND:
+            threading.Thread(
+                target=self._run, args=(business.pk, alias), name=f"pass-refresh-{business.pk}", daemon=True
+            ).start()
+        else:
+            self._run(business.pk, alias)
+        return True
+
+    def _run(self, business_id, alias):
+        while True:
+            with self._lock:
+                if business_id not in self._pending:
+                    self._running.discard(business_id)
+                    return
+                card_ids = self._pending.pop(business_id)
+            try:
+                extend_query_budget(1)
+                business = Business.objects.using(alias).get(pk=business_id)
+                if card_ids is None:
+                    refresh_business_passes(business)
+                else:
+                    push_card_updates(business, sorted(card_ids))
+            except Exception:
+                logger.exception("Refreshing passes of business %s failed.", business_id)
+            finally:
+                if settings.PASS_REFRESH_IN_BACKGROUND:
+                    close_old_connections()
+
+
+pass_refresh_scheduler = PassRefreshScheduler()
+
+
+def schedule_pass_refresh(business, card_ids=None):
+    return pass_refresh_scheduler.schedule(business, card_ids)
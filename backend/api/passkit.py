@@ -6,20 +6,38 @@ import os
 import subprocess
 import tempfile
 import zipfile
-from datetime import datetime
+from datetime import datetime, timezone as dt_timezone
 from decimal import Decimal
+from functools import lru_cache
 from pathlib import Path
 from shutil import copyfile
 
 from django.conf import settings
+from django.db.models import Max, Window
 from django.utils import timezone
 
+from server.instrumentation import timed
+from server.metrics import REGISTRY, SIZE_BUCKETS
+
 from .models import LoyaltyCard, PassRegistration
 from .push import PassRegistrationPayload, send_wallet_pass_update
+from .sharding import shard_querysets
 
 
 logger = logging.getLogger(__name__)
 
+pkpass_build_seconds = REGISTRY.histogram("pkpass_build_seconds", "Time spent building a .pkpass bundle.")
+pkpass_sign_seconds = REGISTRY.histogram("pkpass_sign_seconds", "Time spent signing a pass manifest.")
+pkpass_size_bytes = REGISTRY.histogram("pkpass_size_bytes", "Size of built .pkpass bundles.", buckets=SIZE_BUCKETS)
+
+# Business fields shown on passes, in the order _pass_template unpacks them.
+PASS_BRANDING_FIELDS = (
+    "name", "primary_color", "background_color", "reward_rate", "redemption_points", "redemption_rate",
+)
+PASS_TEMPLATE_CACHE_SIZE = 1024
+# Wallet statuses whose passes are shown as voided.
+VOIDED_WALLET_STATUSES = ("revoked", "expired")
+
 PLACEHOLDER_ICON = base64.b64decode(
     "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR4nGNgYAAAAAMAASsJTYQAAAAASUVORK5CYII="
 )
@@ -29,11 +47,15 @@ class PassKitError(Exception):
     pass
 
 
+def card_auth_token(card: LoyaltyCard) -> str:
+    secret = getattr(settings, "APPLE_PASS_AUTH_TOKEN_SECRET", "changeme")
+    raw = f"{secret}:{card.token}:{timezone.now().timestamp()}".encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
 def ensure_card_auth_token(card: LoyaltyCard) -> LoyaltyCard:
     if not card.apple_auth_token:
-        secret = getattr(settings, "APPLE_PASS_AUTH_TOKEN_SECRET", "changeme")
-        raw = f"{secret}:{card.token}:{timezone.now().timestamp()}".encode("utf-8")
-        card.apple_auth_token = hashlib.sha256(raw).hexdigest()
+        card.apple_auth_token = card_auth_token(card)
         card.save(update_fields=["apple_auth_token", "updated_at"])
     return card
 
@@ -81,20 +103,57 @@ def _write_assets(tmpdir: Path):
     return assets
 
 
-def _build_pass_json(card: LoyaltyCard) -> dict:
-    business = card.business_customer.business
-    earn_rate = business.reward_rate.quantize(Decimal("1"))
-    redeem_percent = (business.redemption_rate * 100).quantize(Decimal("1"))
+def pass_branding(business) -> tuple:
+    """The business fields a pass shows; passes go stale when these change."""
+    return tuple(getattr(business, name) for name in PASS_BRANDING_FIELDS)
+
+
+@lru_cache(maxsize=PASS_TEMPLATE_CACHE_SIZE)
+def _pass_template(branding: tuple) -> dict:
+    name, primary_color, background_color, reward_rate, redemption_points, redemption_rate = branding
+    earn_rate = reward_rate.quantize(Decimal("1"))
+    redeem_percent = (redemption_rate * 100).quantize(Decimal("1"))
     return {
+        "organizationName": name,
+        "description": f"{name} Loyalty",
+        "logoText": name,
+        "backgroundColor": background_color,
+        "foregroundColor": primary_color,
+        "secondaryFields": (
+            {
+                "key": "reward_rate",
+                "label": "Earn Rate",
+                "value": f"{earn_rate} pt per $1",
+            },
+            {
+                "key": "redeem",
+                "label": "Redeem",
+                "value": f"{redemption_points} pts → {redeem_percent}% off",
+            },
+        ),
+    }
+
+
+def business_pass_template(business) -> dict:
+    """
+    The business-wide part of its passes, rendered once per branding and
+    cached. Shared between calls: read it, don't change it.
+    """
+    return _pass_template(pass_branding(business))
+
+
+def _build_pass_json(card: LoyaltyCard) -> dict:
+    template = business_pass_template(card.business_customer.business)
+    pass_json = {
         "formatVersion": 1,
         "passTypeIdentifier": settings.APPLE_PASS_TYPE_IDENTIFIER,
         "serialNumber": str(card.token),
         "teamIdentifier": settings.APPLE_PASS_TEAM_ID,
-        "organizationName": business.name,
-        "description": f"{business.name} Loyalty",
-        "logoText": business.name,
-        "backgroundColor": business.background_color,
-        "foregroundColor": business.primary_color,
+        "organizationName": template["organizationName"],
+        "description": template["description"],
+        "logoText": template["logoText"],
+        "backgroundColor": template["backgroundColor"],
+        "foregroundColor": template["foregroundColor"],
         "labelColor": "#FFFFFF",
         "webServiceURL": settings.APPLE_PASS_WEB_SERVICE_URL,
         "authenticationToken": card.apple_auth_token,
@@ -118,18 +177,7 @@ def _build_pass_json(card: LoyaltyCard) -> dict:
                     "value": card.points_balance,
                 }
             ],
-            "secondaryFields": [
-                {
-                    "key": "reward_rate",
-                    "label": "Earn Rate",
-                    "value": f"{earn_rate} pt per $1",
-                },
-                {
-                    "key": "redeem",
-                    "label": "Redeem",
-                    "value": f"{business.redemption_points} pts → {redeem_percent}% off",
-                },
-            ],
+            "secondaryFields": [dict(field) for field in template["secondaryFields"]],
             "backFields": [
                 {
                     "key": "customer",
@@ -144,6 +192,9 @@ def _build_pass_json(card: LoyaltyCard) -> dict:
             ],
         },
     }
+    if card.wallet_status in VOIDED_WALLET_STATUSES:
+        pass_json["voided"] = True
+    return pass_json
 
 
 def _create_manifest(file_map):
@@ -265,6 +316,8 @@ def _write_unsigned_signature(tmpdir: Path):
     return signature_path
 
 
+@timed("pass_build")
+@pkpass_build_seconds.time()
 def build_pkpass(card: LoyaltyCard) -> bytes:
     ensure_card_auth_token(card)
 
@@ -285,7 +338,8 @@ def build_pkpass(card: LoyaltyCard) -> bytes:
 
         if _have_signing_materials():
             try:
-                signature_path = _create_signature(tmpdir, manifest_path)
+                with pkpass_sign_seconds.time():
+                    signature_path = _create_signature(tmpdir, manifest_path)
             except PassKitError:
                 signature_path = _write_unsigned_signature(tmpdir)
         else:
@@ -299,7 +353,9 @@ def build_pkpass(card: LoyaltyCard) -> bytes:
                 zf.write(path, arcname=name)
 
         with open(pkpass_path, "rb") as output:
-            return output.read()
+            data = output.read()
+        pkpass_size_bytes.observe(len(data))
+        return data
 
 
 def register_device(card: LoyaltyCard, device_identifier: str, pass_type_identifier: str, push_token: str):
@@ -321,31 +377,45 @@ def unregister_device(card: LoyaltyCard, device_identifier: str, pass_type_ident
     ).delete()
 
 
-def _parse_updated_since(value: str | None):
+def _parse_updated_since(value: str | None) -> int | None:
+    """passesUpdatedSince as a pass_version. ISO timestamps, which older
+    responses used as tags, map to milliseconds like the backfilled versions."""
     if not value:
         return None
+    if value.isdigit():
+        return int(value)
     try:
-        return datetime.fromisoformat(value)
+        since = datetime.fromisoformat(value)
     except ValueError:
         return None
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since, dt_timezone.utc)
+    return int(since.timestamp() * 1000)
 
 
 def list_serial_numbers(device_identifier: str, pass_type_identifier: str, passes_updated_since: str | None):
-    since_dt = _parse_updated_since(passes_updated_since)
-    serials = []
-    latest = None
-    qs = PassRegistration.objects.select_related("loyalty_card").filter(
+    """
+    Serial numbers of the device's passes changed since the tag, and the
+    tag to send next time: the newest pass_version among them. One query per
+    shard does the filtering and the maximum.
+    """
+    since = _parse_updated_since(passes_updated_since)
+    qs = PassRegistration.objects.filter(
         device_library_identifier=device_identifier,
         pass_type_identifier=pass_type_identifier,
     )
-    for registration in qs:
-        card = registration.loyalty_card
-        if since_dt and card.updated_at <= since_dt:
-            continue
-        serials.append(str(card.token))
-        latest = max(latest or card.updated_at, card.updated_at)
-    latest_tag = latest.isoformat() if latest else timezone.now().isoformat()
-    return serials, latest_tag
+    if since is not None:
+        qs = qs.filter(loyalty_card__pass_version__gt=since)
+    qs = qs.values_list("loyalty_card_id", Window(Max("loyalty_card__pass_version")))
+
+    serials = []
+    latest = since or 0
+    # A device can hold passes from businesses on different shards.
+    for shard_qs in shard_querysets(qs):
+        for token, newest in shard_qs:
+            serials.append(str(token))
+            latest = max(latest, newest)
+    return serials, str(latest)
 
 
 def notify_loyalty_card_updated(card: LoyaltyCard):
@@ -372,3 +442,4 @@ def notify_loyalty_card_updated(card: LoyaltyCard):
         send_wallet_pass_update(payloads)
     except Exception:  # pragma: no cover - best effort network call
         logger.exception("Failed to send wallet update for card %s", card.pk)
+
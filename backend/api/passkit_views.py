@@ -1,12 +1,13 @@
 from django.conf import settings
 from django.http import HttpResponse, HttpResponseNotAllowed
-from django.shortcuts import get_object_or_404
 from rest_framework import status
 from rest_framework.exceptions import PermissionDenied, NotFound
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from .device_logs import device_log_buffer
 from .models import LoyaltyCard
+from .sharding import locate_or_404
 from .passkit import (
     build_pkpass,
     ensure_card_auth_token,
@@ -26,7 +27,10 @@ def _require_pass_type(pass_type_identifier: str):
 
 
 def _get_card(serial_number):
-    return get_object_or_404(LoyaltyCard, token=serial_number)
+    return locate_or_404(
+        LoyaltyCard.objects.select_related("business_customer__business", "business_customer__customer"),
+        token=serial_number,
+    )
 
 
 def _require_pass_authorization(request, card: LoyaltyCard):
@@ -42,6 +46,7 @@ def _require_pass_authorization(request, card: LoyaltyCard):
 class DeviceRegistrationView(APIView):
     authentication_classes = []
     permission_classes = []
+    query_budget = 8
 
     def post(self, request, device_library_identifier, pass_type_identifier, serial_number):
         _require_pass_type(pass_type_identifier)
@@ -70,6 +75,7 @@ class DeviceRegistrationView(APIView):
 class DeviceRegistrationListView(APIView):
     authentication_classes = []
     permission_classes = []
+    query_budget = 2
 
     def get(self, request, device_library_identifier, pass_type_identifier):
         _require_pass_type(pass_type_identifier)
@@ -90,6 +96,7 @@ class DeviceRegistrationListView(APIView):
 class PassDownloadView(APIView):
     authentication_classes = []
     permission_classes = []
+    query_budget = 5
 
     def get(self, request, pass_type_identifier, serial_number):
         _require_pass_type(pass_type_identifier)
@@ -104,6 +111,11 @@ class PassDownloadView(APIView):
 class PassKitLogView(APIView):
     authentication_classes = []
     permission_classes = []
+    # Lines are buffered in memory and written in the background.
+    query_budget = 0
 
     def post(self, request):
+        logs = request.data.get("logs") if isinstance(request.data, dict) else None
+        if isinstance(logs, list):
+            device_log_buffer.append(logs)
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,125 @@
+"""
+Per-station queue of prepared passes.
+
+Issuing a card at a station appends it to the station's queue instead of
+overwriting a single slot, so a busy counter can stage the next customer
+before the previous one has opened the public pass page. Each visitor of
+the page claims the oldest unclaimed entry with one UPDATE whose WHERE
+clause picks that entry and requires it to be still unclaimed, so two
+visitors can never be handed the same pass. The claim token lets the same
+visitor download the pass again (the page probes as JSON, then opens the
+.pkpass) until the claim window ends. Claims are written and looked up on
+the station's write database: the public page may have read the station
+from the replica, and a claim recorded there would be lost.
+
+The queue stays small without a sweeper: every enqueue deletes the
+station's expired entries and trims the unclaimed ones to
+PREPARED_PASS_QUEUE_LENGTH in the same statement, through the
+(station, claimed_at, id) index. `purge_expired_prepared_passes` clears
+stations that have stopped issuing through the expires_at index.
+"""
+
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import router
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import PreparedPass, Station
+
+# Everything _build_pass_json reads, fetched with the entry.
+PREPARED_PASS_RELATIONS = (
+    "loyalty_card__business_customer__business",
+    "loyalty_card__business_customer__customer",
+)
+
+
+def _write_alias(station):
+    # The station's shard, or the primary when it was read from the replica.
+    return router.db_for_write(PreparedPass, instance=station)
+
+
+def _queue(station, using=None):
+    return PreparedPass.objects.using(using or station._state.db).filter(station=station)
+
+
+def _unclaimed(station, now, using=None):
+    return _queue(station, using).filter(claimed_at__isnull=True, expires_at__gt=now)
+
+
+def enqueue_prepared_pass(station, card, using, now=None):
+    """
+    Stage `card` at the back of `station`'s queue on database `using`. A
+    card already waiting there moves to the back rather than queueing twice,
+    and the oldest entries drop out once the queue is full.
+    """
+    now = now or timezone.now()
+    queue = PreparedPass.objects.using(using).filter(station=station)
+    keep = max(settings.PREPARED_PASS_QUEUE_LENGTH, 1) - 1
+    newest = (
+        queue.filter(claimed_at__isnull=True, expires_at__gt=now)
+        .exclude(loyalty_card=card)
+        .order_by("-id")
+        .values("pk")[:keep]
+    )
+    queue.filter(
+        Q(expires_at__lte=now)
+        | Q(claimed_at__isnull=True) & (Q(loyalty_card=card) | ~Q(pk__in=newest))
+    ).delete()
+    return PreparedPass.objects.using(using).create(
+        station=station,
+        loyalty_card=card,
+        expires_at=now + timedelta(seconds=settings.PREPARED_PASS_TTL_SECONDS),
+    )
+
+
+def next_prepared_pass(station, now=None):
+    """The entry the next visitor would get, without claiming it."""
+    return (
+        _unclaimed(station, now or timezone.now())
+        .select_related(*PREPARED_PASS_RELATIONS)
+        .order_by("id")
+        .first()
+    )
+
+
+def claim_prepared_pass(station, now=None):
+    """Claim the oldest unclaimed entry for the caller, or return None."""
+    now = now or timezone.now()
+    using = _write_alias(station)
+    token = secrets.token_urlsafe(16)
+    head = _unclaimed(station, now, using).order_by("id").values("pk")[:1]
+    # Checked again on the row itself: a concurrent claimer may have taken it
+    # after the subquery picked it.
+    claimed = _unclaimed(station, now, using).filter(pk__in=head).update(
+        claimed_at=now,
+        claim_token=token,
+        expires_at=now + timedelta(seconds=settings.PREPARED_PASS_CLAIM_SECONDS),
+    )
+    if not claimed:
+        return None
+    entry = _queue(station, using).select_related(*PREPARED_PASS_RELATIONS).get(claim_token=token)
+    # The station's prepared slot mirrors the newest staged card for the
+    # dashboard; once that card is handed out the slot is empty.
+    Station.objects.using(using).filter(
+        pk=station.pk, prepared_loyalty_card=entry.loyalty_card_id
+    ).update(prepared_loyalty_card=None, prepared_at=None)
+    return entry
+
+
+def claimed_prepared_pass(station, claim_token, now=None):
+    """The entry claimed with `claim_token`, while its claim window lasts."""
+    return (
+        _queue(station, _write_alias(station))
+        .filter(claim_token=claim_token, expires_at__gt=now or timezone.now())
+        .select_related(*PREPARED_PASS_RELATIONS)
+        .first()
+    )
+
+
+def purge_expired_prepared_passes(using, now=None):
+    """Delete expired entries on database `using`; returns how many went."""
+    deleted, _ = PreparedPass.objects.using(using).filter(expires_at__lte=now or timezone.now()).delete()
+    return deleted
@@ -0,0 +1,46 @@
+"""
+Bulk station provisioning.
+
+Creating stations one by one costs a slug lookup and an INSERT each. Here
+the slugs for the whole batch come from one Station.allocate_slugs query,
+tokens are generated in Python, and the rows go in with bulk_create, so a
+chain opening hundreds of registers runs a handful of statements.
+"""
+
+import math
+import secrets
+
+from django.db import IntegrityError, transaction
+
+from server.query_budget import extend_query_budget
+
+from .models import Station
+
+MAX_PROVISIONED_STATIONS = 1000
+# Keeps each INSERT under SQLite's 999 parameters (Station has 7 columns).
+STATION_BATCH_SIZE = 140
+
+
+def _provision(business, names):
+    alias = business._state.db
+    with transaction.atomic(using=alias):
+        slugs = Station.allocate_slugs(names, using=alias)
+        stations = [
+            Station(business=business, name=name, public_slug=slug, api_token=secrets.token_hex(32))
+            for name, slug in zip(names, slugs)
+        ]
+        return Station.objects.using(alias).bulk_create(stations, batch_size=STATION_BATCH_SIZE)
+
+
+def provision_stations(business, names):
+    """Create a station for each name under `business`; returns them in order."""
+    names = [name.strip() for name in names]
+    inserts = math.ceil(len(names) / STATION_BATCH_SIZE)
+    extend_query_budget(inserts)
+    try:
+        return _provision(business, names)
+    except IntegrityError:
+        # A station created concurrently took one of the slugs; allocating
+        # again sees it.
+        extend_query_budget(inserts + 3)
+        return _provision(business, names)
@@ -8,8 +8,14 @@ import httpx
 import jwt
 from django.conf import settings
 
+from server.instrumentation import timed
+from server.metrics import REGISTRY
+
 logger = logging.getLogger(__name__)
 
+apns_pushes = REGISTRY.counter("apns_push_total", "Wallet update pushes by outcome.", ("outcome",))
+apns_push_seconds = REGISTRY.histogram("apns_push_seconds", "Round trip of a single APNs request.")
+
 
 def _resolve_path(path_value: str) -> Optional[Path]:
     if not path_value:
@@ -29,11 +35,16 @@ class PassRegistrationPayload:
 class AppleWalletPushClient:
     def __init__(self):
         self._private_key: Optional[str] = None
+        self._key_path: Optional[Path] = None
         self._jwt_token: Optional[str] = None
         self._jwt_issued_at: int = 0
+        self._jwt_identity: tuple = ()
 
     @property
     def _host(self) -> str:
+        endpoint = getattr(settings, "APNS_ENDPOINT", "")
+        if endpoint:
+            return endpoint.rstrip("/")
         env = (getattr(settings, "APNS_ENV", "production") or "production").lower()
         if env in {"sandbox", "development", "dev"}:
             return "https://api.sandbox.push.apple.com"
@@ -58,10 +69,11 @@ class AppleWalletPushClient:
         )
 
     def _load_private_key(self) -> Optional[str]:
-        if self._private_key is not None:
+        path = _resolve_path(getattr(settings, "APNS_AUTH_KEY_PATH", ""))
+        if self._private_key is not None and path == self._key_path:
             return self._private_key
 
-        path = _resolve_path(getattr(settings, "APNS_AUTH_KEY_PATH", ""))
+        self._key_path = path
         if not path:
             logger.warning("APNs auth key path missing; cannot send wallet pushes.")
             return None
@@ -75,12 +87,13 @@ class AppleWalletPushClient:
 
     def _current_jwt(self) -> Optional[str]:
         now = int(time.time())
-        if self._jwt_token and now - self._jwt_issued_at < 45 * 60:
+        key_id = getattr(settings, "APNS_KEY_ID", None)
+        team_id = getattr(settings, "APNS_TEAM_ID", None)
+        identity = (getattr(settings, "APNS_AUTH_KEY_PATH", ""), key_id, team_id)
+        if self._jwt_token and identity == self._jwt_identity and now - self._jwt_issued_at < 45 * 60:
             return self._jwt_token
 
         private_key = self._load_private_key()
-        key_id = getattr(settings, "APNS_KEY_ID", None)
-        team_id = getattr(settings, "APNS_TEAM_ID", None)
 
         if not all([private_key, key_id, team_id]):
             return None
@@ -100,15 +113,18 @@ class AppleWalletPushClient:
             return None
 
         self._jwt_issued_at = now
+        self._jwt_identity = identity
         return self._jwt_token
 
     def send_pass_update(self, payload: PassRegistrationPayload) -> bool:
         if not self.is_configured():
+            apns_pushes.inc(outcome="not_configured")
             return False
 
         token = self._current_jwt()
         topic = self._topic
         if not token or not topic:
+            apns_pushes.inc(outcome="no_credentials")
             return False
 
         url = f"{self._host}/3/device/{payload.push_token}"
@@ -119,14 +135,19 @@ class AppleWalletPushClient:
             "apns-priority": "5",
         }
 
+        # Over cleartext (a local stub) there is no TLS handshake to negotiate
+        # HTTP/2, so it is spoken with prior knowledge, as APNs only speaks HTTP/2.
+        cleartext = url.startswith("http://")
         try:
-            with httpx.Client(http2=True, timeout=10.0) as client:
+            with apns_push_seconds.time(), httpx.Client(http1=not cleartext, http2=True, timeout=10.0) as client:
                 response = client.post(url, headers=headers, json={})
         except httpx.HTTPError as exc:
+            apns_pushes.inc(outcome="network_error")
             logger.warning("APNs push failed for %s: %s", payload.serial_number, exc)
             return False
 
         if response.status_code not in (200, 201):
+            apns_pushes.inc(outcome=f"http_{response.status_code}")
             logger.warning(
                 "APNs push error (%s) for %s: %s",
                 response.status_code,
@@ -135,6 +156,7 @@ class AppleWalletPushClient:
             )
             return False
 
+        apns_pushes.inc(outcome="sent")
         return True
 
 
@@ -148,6 +170,7 @@ def get_wallet_push_client() -> AppleWalletPushClient:
     return _client
 
 
+@timed("push")
 def send_wallet_pass_update(pass_payloads: Iterable[PassRegistrationPayload]) -> None:
     client = get_wallet_push_client()
     if not pass_payloads:
@@ -0,0 +1,346 @@
+"""
+QR code rendering for loyalty card tokens, in pure Python.
+
+The encoder covers what card payloads need: byte mode, error correction
+level M and versions 1-10 (up to 213 bytes; a card token is 36). The
+matrix follows ISO/IEC 18004: function patterns, Reed-Solomon codewords
+interleaved across blocks, the zigzag placement and the mask with the
+lowest penalty score. PNGs are 1-bit grayscale written with zlib, SVGs a
+single path of dark modules.
+
+A card's payload never changes, so rendered images are kept in an LRU
+cache keyed by payload, format and size.
+"""
+
+import struct
+import zlib
+from functools import lru_cache
+
+QR_IMAGE_FORMATS = {
+    "png": "image/png",
+    "svg": "image/svg+xml",
+}
+# Pixels per module; a version 3 code (29 modules + 8 of quiet zone) is
+# 148, 296 and 592 pixels wide.
+QR_SIZES = {
+    "small": 4,
+    "medium": 8,
+    "large": 16,
+}
+QR_CACHE_SIZE = 1024
+QUIET_ZONE = 4
+
+# Per version at level M: (EC codewords per block, [(blocks, data codewords per block), ...]).
+_BLOCKS_M = {
+    1: (10, [(1, 16)]),
+    2: (16, [(1, 28)]),
+    3: (26, [(1, 44)]),
+    4: (18, [(2, 32)]),
+    5: (24, [(2, 43)]),
+    6: (16, [(4, 27)]),
+    7: (18, [(4, 31)]),
+    8: (22, [(2, 38), (2, 39)]),
+    9: (22, [(3, 36), (2, 37)]),
+    10: (26, [(4, 43), (1, 44)]),
+}
+_ALIGNMENT_CENTERS = {
+    1: [],
+    2: [6, 18],
+    3: [6, 22],
+    4: [6, 26],
+    5: [6, 30],
+    6: [6, 34],
+    7: [6, 22, 38],
+    8: [6, 24, 42],
+    9: [6, 26, 46],
+    10: [6, 28, 50],
+}
+_LEVEL_M_FORMAT_BITS = 0b00
+_MASKS = (
+    lambda x, y: (x + y) % 2 == 0,
+    lambda x, y: y % 2 == 0,
+    lambda x, y: x % 3 == 0,
+    lambda x, y: (x + y) % 3 == 0,
+    lambda x, y: (x // 3 + y // 2) % 2 == 0,
+    lambda x, y: x * y % 2 + x * y % 3 == 0,
+    lambda x, y: (x * y % 2 + x * y % 3) % 2 == 0,
+    lambda x, y: ((x + y) % 2 + x * y % 3) % 2 == 0,
+)
+
+
+def _gf_multiply(x, y):
+    z = 0
+    for i in range(7, -1, -1):
+        z = (z << 1) ^ ((z >> 7) * 0x11D)
+        z ^= ((y >> i) & 1) * x
+    return z
+
+
+@lru_cache(maxsize=None)
+def _rs_divisor(degree):
+    divisor = [0] * (degree - 1) + [1]
+    root = 1
+    for _ in range(degree):
+        for j in range(degree):
+            divisor[j] = _gf_multiply(divisor[j], root)
+            if j + 1 < degree:
+                divisor[j] ^= divisor[j + 1]
+        root = _gf_multiply(root, 0x02)
+    return tuple(divisor)
+
+
+def _rs_remainder(data, degree):
+    divisor = _rs_divisor(degree)
+    remainder = [0] * degree
+    for byte in data:
+        factor = byte ^ remainder.pop(0)
+        remainder.append(0)
+        for i, coefficient in enumerate(divisor):
+            remainder[i] ^= _gf_multiply(coefficient, factor)
+    return remainder
+
+
+def _data_capacity(version):
+    _, groups = _BLOCKS_M[version]
+    return sum(blocks * size for blocks, size in groups)
+
+
+def _choose_version(length):
+    for version in _BLOCKS_M:
+        count_bits = 8 if version < 10 else 16
+        if 4 + count_bits + 8 * length <= 8 * _data_capacity(version):
+            return version
+    raise ValueError(f"QR payload of {length} bytes is too long (at most 213).")
+
+
+def _codewords(data, version):
+    capacity = _data_capacity(version)
+    count_bits = 8 if version < 10 else 16
+    bits = [0, 1, 0, 0]
+    bits += [(len(data) >> i) & 1 for i in range(count_bits - 1, -1, -1)]
+    for byte in data:
+        bits += [(byte >> i) & 1 for i in range(7, -1, -1)]
+    bits += [0] * min(4, 8 * capacity - len(bits))
+    bits += [0] * (-len(bits) % 8)
+    codewords = [int("".join(map(str, bits[i:i + 8])), 2) for i in range(0, len(bits), 8)]
+    padding = (0xEC, 0x11)
+    codewords += [padding[i % 2] for i in range(capacity - len(codewords))]
+
+    ec_length, groups = _BLOCKS_M[version]
+    blocks, offset = [], 0
+    for count, size in groups:
+        for _ in range(count):
+            blocks.append(codewords[offset:offset + size])
+            offset += size
+    ec_blocks = [_rs_remainder(block, ec_length) for block in blocks]
+
+    interleaved = []
+    for i in range(max(len(block) for block in blocks)):
+        interleaved += [block[i] for block in blocks if i < len(block)]
+    for i in range(ec_length):
+        interleaved += [block[i] for block in ec_blocks]
+    return interleaved
+
+
+class _Matrix:
+    def __init__(self, version):
+        self.version = version
+        self.size = 17 + 4 * version
+        self.modules = [[False] * self.size for _ in range(self.size)]
+        self.function = [[False] * self.size for _ in range(self.size)]
+        self._draw_function_patterns()
+
+    def _set_function(self, x, y, dark):
+        self.modules[y][x] = dark
+        self.function[y][x] = True
+
+    def _draw_function_patterns(self):
+        size = self.size
+        for i in range(size):
+            self._set_function(6, i, i % 2 == 0)
+            self._set_function(i, 6, i % 2 == 0)
+        for cx, cy in ((3, 3), (size - 4, 3), (3, size - 4)):
+            for dy in range(-4, 5):
+                for dx in range(-4, 5):
+                    x, y = cx + dx, cy + dy
+                    if 0 <= x < size and 0 <= y < size:
+                        self._set_function(x, y, max(abs(dx), abs(dy)) not in (2, 4))
+        centers = _ALIGNMENT_CENTERS[self.version]
+        last = len(centers) - 1
+        for i, cx in enumerate(centers):
+            for j, cy in enumerate(centers):
+                if (i, j) in ((0, 0), (0, last), (last, 0)):
+                    continue
+                for dy in range(-2, 3):
+                    for dx in range(-2, 3):
+                        self._set_function(cx + dx, cy + dy, max(abs(dx), abs(dy)) != 1)
+        self.draw_format_bits(0)
+        if self.version >= 7:
+            remainder = self.version
+            for _ in range(12):
+                remainder = (remainder << 1) ^ ((remainder >> 11) * 0x1F25)
+            bits = self.version << 12 | remainder
+            for i in range(18):
+                dark = (bits >> i) & 1 == 1
+                a, b = size - 11 + i % 3, i // 3
+                self._set_function(a, b, dark)
+                self._set_function(b, a, dark)
+
+    def draw_format_bits(self, mask):
+        data = _LEVEL_M_FORMAT_BITS << 3 | mask
+        remainder = data
+        for _ in range(10):
+            remainder = (remainder << 1) ^ ((remainder >> 9) * 0x537)
+        bits = (data << 10 | remainder) ^ 0x5412
+        bit = lambda i: (bits >> i) & 1 == 1  # noqa: E731
+
+        size = self.size
+        for i in range(6):
+            self._set_function(8, i, bit(i))
+        self._set_function(8, 7, bit(6))
+        self._set_function(8, 8, bit(7))
+        self._set_function(7, 8, bit(8))
+        for i in range(9, 15):
+            self._set_function(14 - i, 8, bit(i))
+        for i in range(8):
+            self._set_function(size - 1 - i, 8, bit(i))
+        for i in range(8, 15):
+            self._set_function(8, size - 15 + i, bit(i))
+        self._set_function(8, size - 8, True)
+
+    def place(self, codewords):
+        size = self.size
+        total = len(codewords) * 8
+        i = 0
+        right = size - 1
+        while right >= 1:
+            if right == 6:
+                right = 5
+            upward = (right + 1) & 2 == 0
+            for vertical in range(size):
+                y = size - 1 - vertical if upward else vertical
+                for x in (right, right - 1):
+                    if not self.function[y][x] and i < total:
+                        self.modules[y][x] = (codewords[i >> 3] >> (7 - (i & 7))) & 1 == 1
+                        i += 1
+            right -= 2
+
+    def apply_mask(self, mask):
+        condition = _MASKS[mask]
+        for y in range(self.size):
+            row, function = self.modules[y], self.function[y]
+            for x in range(self.size):
+                if not function[x] and condition(x, y):
+                    row[x] = not row[x]
+
+
+def _run_penalty(line):
+    penalty, run, previous = 0, 0, None
+    for dark in line:
+        if dark == previous:
+            run += 1
+        else:
+            if run >= 5:
+                penalty += run - 2
+            run, previous = 1, dark
+    if run >= 5:
+        penalty += run - 2
+    return penalty
+
+
+_FINDER_LIKE = (
+    (True, False, True, True, True, False, True, False, False, False, False),
+    (False, False, False, False, True, False, True, True, True, False, True),
+)
+
+
+def _finder_penalty(line):
+    padded = [False] * 4 + list(line) + [False] * 4
+    return 40 * sum(
+        tuple(padded[i:i + 11]) in _FINDER_LIKE for i in range(len(padded) - 10)
+    )
+
+
+def _penalty(modules):
+    size = len(modules)
+    columns = [[modules[y][x] for y in range(size)] for x in range(size)]
+    penalty = 0
+    for line in (*modules, *columns):
+        penalty += _run_penalty(line) + _finder_penalty(line)
+    for y in range(size - 1):
+        for x in range(size - 1):
+            if modules[y][x] == modules[y][x + 1] == modules[y + 1][x] == modules[y + 1][x + 1]:
+                penalty += 3
+    dark = sum(map(sum, modules))
+    penalty += 10 * (abs(dark * 20 - size * size * 10) // (size * size))
+    return penalty
+
+
+def qr_matrix(data, mask=None):
+    """Rows of booleans (True is dark) encoding `data` (bytes or str)."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    version = _choose_version(len(data))
+    codewords = _codewords(data, version)
+
+    def build(candidate):
+        matrix = _Matrix(version)
+        matrix.place(codewords)
+        matrix.apply_mask(candidate)
+        matrix.draw_format_bits(candidate)
+        return matrix.modules
+
+    if mask is not None:
+        return build(mask)
+    return min((build(candidate) for candidate in range(len(_MASKS))), key=_penalty)
+
+
+def _png_chunk(kind, body):
+    return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body))
+
+
+def render_png(modules, scale):
+    width = (len(modules) + 2 * QUIET_ZONE) * scale
+    light_row = b"\x00" + b"\xff" * ((width + 7) // 8)
+    rows = [light_row] * (QUIET_ZONE * scale)
+    for line in modules:
+        pixels = [True] * QUIET_ZONE + [not dark for dark in line] + [True] * QUIET_ZONE
+        bits = "".join(("1" if light else "0") * scale for light in pixels)
+        bits += "1" * (-len(bits) % 8)
+        row = b"\x00" + int(bits, 2).to_bytes(len(bits) // 8, "big")
+        rows += [row] * scale
+    rows += [light_row] * (QUIET_ZONE * scale)
+    header = struct.pack(">IIBBBBB", width, width, 1, 0, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _png_chunk(b"IHDR", header)
+        + _png_chunk(b"IDAT", zlib.compress(b"".join(rows), 9))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+def render_svg(modules, scale):
+    width = len(modules) + 2 * QUIET_ZONE
+    path = "".join(
+        f"M{x + QUIET_ZONE},{y + QUIET_ZONE}h1v1h-1z"
+        for y, line in enumerate(modules)
+        for x, dark in enumerate(line)
+        if dark
+    )
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width * scale}" height="{width * scale}" '
+        f'viewBox="0 0 {width} {width}" shape-rendering="crispEdges">'
+        f'<rect width="{width}" height="{width}" fill="#fff"/><path fill="#000" d="{path}"/></svg>'
+    ).encode("ascii")
+
+
+_RENDERERS = {
+    "png": render_png,
+    "svg": render_svg,
+}
+
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def qr_image(payload, image_format, size):
+    """Encoded image bytes for `payload`, cached by all three arguments."""
+    return _RENDERERS[image_format](qr_matrix(payload), QR_SIZES[size])
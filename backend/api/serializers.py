@@ -76,7 +76,7 @@ class TransactionSerializer(serializers.ModelSerializer):
     loyalty_card = LoyaltyCardSerializer(read_only = True)
 
     loyalty_card_id = serializers.PrimaryKeyRelatedField(
-        queryset = LoyaltyCard.objects.all(),
+        queryset = LoyaltyCard.objects.select_related("business_customer"),
         source = "loyalty_card",
         write_only = True,
         required = False,
@@ -137,3 +137,27 @@ class LoyaltyCardIssueSerializer(serializers.Serializer):
         if len(normalized) > 20:
             raise serializers.ValidationError("Phone number is too long after normalization.")
         return normalized
+
+
+class WalletStatusChangeSerializer(serializers.Serializer):
+    """A bulk wallet status change: the new status and which cards get it."""
+
+    STATUSES = [value for value, _ in LoyaltyCard._meta.get_field("wallet_status").choices]
+    FILTERS = ("tokens", "current_status", "created_before", "updated_before")
+
+    wallet_status = serializers.ChoiceField(choices=STATUSES)
+    tokens = serializers.ListField(child=serializers.UUIDField(), allow_empty=False, max_length=10000, required=False)
+    current_status = serializers.ChoiceField(choices=STATUSES, required=False)
+    created_before = serializers.DateTimeField(required=False)
+    updated_before = serializers.DateTimeField(required=False)
+    all = serializers.BooleanField(default=False)
+
+    def validate(self, attrs):
+        if not attrs["all"] and not any(name in attrs for name in self.FILTERS):
+            raise serializers.ValidationError(
+                f"Choose cards with at least one of {', '.join(self.FILTERS)}, or send all=true for every card."
+            )
+        return attrs
+
+    def filters(self):
+        return {name: self.validated_data[name] for name in self.FILTERS if name in self.validated_data}
@@ -0,0 +1,414 @@
+"""
+Tenant sharding: each business and everything scoped to it lives on one
+database alias from TENANT_SHARDS, chosen by the TenantShard directory on the
+default database.
+
+Customer phone numbers are unique per shard, not globally. A Customer row is
+the shard-local identity for a normalized phone number: a person who is a
+customer of two businesses on different shards has one row on each shard,
+and moving a business merges its customers into the target shard by phone.
+Accounts, sessions and the directory itself stay on the default database.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction as db_transaction
+from django.http import Http404
+from django.utils import timezone
+
+from .models import (
+    Business,
+    BusinessCustomer,
+    Customer,
+    LoyaltyCard,
+    PassRegistration,
+    PreparedPass,
+    Station,
+    TenantShard,
+    Transaction,
+)
+from .utils import explicit_timestamps
+
+
+SHARDED_MODELS = frozenset(
+    model._meta.label_lower
+    for model in (Business, Customer, BusinessCustomer, LoyaltyCard, Station, Transaction, PassRegistration, PreparedPass)
+)
+
+
+def is_sharded(model):
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+def tenant_shards():
+    return list(getattr(settings, "TENANT_SHARDS", [DEFAULT_DB_ALIAS]))
+
+
+def default_shard():
+    return getattr(settings, "TENANT_DEFAULT_SHARD", DEFAULT_DB_ALIAS)
+
+
+class ShardMap:
+    """
+    Cached business -> alias lookups. Entries expire after
+    TENANT_SHARD_CACHE_SECONDS so other processes notice moved businesses.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def shard_for(self, business_id):
+        key = str(business_id)
+        now = time.monotonic()
+        cached = self._entries.get(key)
+        if cached and cached[1] > now:
+            return cached[0]
+
+        alias = (
+            TenantShard.objects.using(DEFAULT_DB_ALIAS)
+            .filter(business_id=business_id)
+            .values_list("alias", flat=True)
+            .first()
+        ) or default_shard()
+        with self._lock:
+            self._entries[key] = (alias, now + getattr(settings, "TENANT_SHARD_CACHE_SECONDS", 30))
+        return alias
+
+    def assign(self, business_id, alias):
+        TenantShard.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+            business_id=business_id,
+            defaults={"alias": alias},
+        )
+        self.forget(business_id)
+
+    def forget(self, business_id=None):
+        with self._lock:
+            if business_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(business_id), None)
+
+
+shard_map = ShardMap()
+
+
+class _TenantState:
+    __slots__ = ("request", "alias")
+
+    def __init__(self, request=None, alias=None):
+        self.request = request
+        self.alias = alias
+
+
+_state = contextvars.ContextVar("tenant_shard_state", default=None)
+
+
+def _context_alias():
+    state = _state.get()
+    if state is None:
+        return None
+    if state.alias:
+        return state.alias
+    # Read the user lazily: DRF authenticates inside the view and copies the
+    # user back onto the Django request, after this middleware has run.
+    user = getattr(state.request, "user", None)
+    business_id = getattr(user, "business_id", None)
+    if business_id:
+        return shard_map.shard_for(business_id)
+    return None
+
+
+def _pin_context(alias):
+    state = _state.get()
+    if state is not None:
+        state.alias = alias
+
+
+@contextmanager
+def use_shard(alias):
+    """Route unhinted tenant queries to alias, e.g. in commands and scripts."""
+    token = _state.set(_TenantState(alias=alias))
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+class TenantShardMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _state.set(_TenantState(request=request))
+        try:
+            return self.get_response(request)
+        finally:
+            _state.reset(token)
+
+
+class TenantShardRouter:
+    def _alias_for(self, model, hints):
+        if model is TenantShard:
+            return DEFAULT_DB_ALIAS
+        if not is_sharded(model):
+            return None
+
+        instance = hints.get("instance")
+        if instance is not None:
+            if is_sharded(type(instance)) and instance._state.db:
+                return instance._state.db
+            business_id = instance.pk if isinstance(instance, Business) else getattr(instance, "business_id", None)
+            if business_id:
+                return shard_map.shard_for(business_id)
+        return _context_alias() or default_shard()
+
+    def db_for_read(self, model, **hints):
+        return self._alias_for(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._alias_for(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Accounts on the default database point at businesses on any shard.
+        if not (is_sharded(type(obj1)) and is_sharded(type(obj2))):
+            return True
+        return None
+
+
+def shard_querysets(queryset):
+    """
+    One queryset per tenant shard, for lookups that arrive without a tenant
+    (Wallet devices, public pass links). Unsharded deployments get the
+    queryset back untouched so other routers still apply.
+    """
+    aliases = tenant_shards()
+    if len(aliases) == 1:
+        return [queryset]
+    return [queryset.using(alias) for alias in aliases]
+
+
+def locate_or_404(queryset, **lookup):
+    for candidate in shard_querysets(queryset.filter(**lookup)):
+        obj = candidate.first()
+        if obj is not None:
+            # Later unhinted queries in this request belong to the same tenant.
+            _pin_context(obj._state.db)
+            return obj
+    raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _field_names(model, exclude=()):
+    return [
+        field.name
+        for field in model._meta.concrete_fields
+        if not field.primary_key and field.name not in exclude
+    ]
+
+
+class BusinessMover:
+    """
+    Online copy of one business to another shard.
+
+    Rows are copied in batches while the business keeps serving traffic, then
+    rows changed since the copy started are copied again, the directory entry
+    is flipped, and after other processes' shard caches have expired a final
+    catch-up runs before the source rows are deleted.
+    """
+
+    def __init__(self, business_id, target, batch_size=2000, log=None):
+        self.business_id = business_id
+        self.source = shard_map.shard_for(business_id)
+        self.target = target
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+        self.customer_ids = {}
+
+    def run(self, wait_seconds=None):
+        if self.source == self.target:
+            raise ValueError(f"Business already lives on {self.target}.")
+        if self.target not in connections.settings:
+            raise ValueError(f"Unknown database alias {self.target}.")
+        slugs = self._source(Station).filter(business_id=self.business_id).values_list("public_slug", flat=True)
+        taken = list(
+            self._target(Station)
+            .filter(public_slug__in=list(slugs))
+            .exclude(business_id=self.business_id)
+            .values_list("public_slug", flat=True)
+        )
+        if taken:
+            raise ValueError(f"Station slugs already used on {self.target}: {', '.join(taken)}")
+
+        started = timezone.now()
+        self.copy()
+        caught_up = timezone.now()
+        self.copy(since=started)
+
+        shard_map.assign(self.business_id, self.target)
+        self.log(f"Directory now points {self.business_id} at {self.target}.")
+        if wait_seconds is None:
+            wait_seconds = getattr(settings, "TENANT_SHARD_CACHE_SECONDS", 30)
+        time.sleep(wait_seconds)
+
+        # Leave a margin for clock skew between the copy and in-flight writes.
+        self.copy(since=caught_up - timedelta(seconds=1))
+        self.delete_source()
+
+    def _source(self, model):
+        return model.objects.using(self.source)
+
+    def _target(self, model):
+        return model.objects.using(self.target)
+
+    def _upsert(self, model, objs, unique_fields=None, update_fields=None):
+        update_fields = update_fields if update_fields is not None else _field_names(model)
+        self._target(model).bulk_create(
+            objs,
+            update_conflicts=True,
+            unique_fields=unique_fields or [model._meta.pk.name],
+            update_fields=update_fields,
+        )
+
+    def copy(self, since=None):
+        label = "catch-up" if since else "copy"
+        business = self._source(Business).get(pk=self.business_id)
+        self._upsert(Business, [business])
+
+        bcs = self._source(BusinessCustomer).filter(business_id=self.business_id)
+        self._copy_customers(bcs)
+        for batch in _batched(bcs.order_by("pk").iterator(chunk_size=self.batch_size), self.batch_size):
+            for bc in batch:
+                bc.customer_id = self.customer_ids[bc.customer_id]
+            self._upsert(BusinessCustomer, batch, update_fields=["customer"])
+
+        cards = self._source(LoyaltyCard).filter(business_customer__business_id=self.business_id)
+        if since:
+            cards = cards.filter(updated_at__gte=since)
+        with explicit_timestamps(LoyaltyCard, "created_at", "updated_at"):
+            copied = self._copy_batches(LoyaltyCard, cards)
+
+        stations = self._source(Station).filter(business_id=self.business_id)
+        self._copy_batches(Station, stations)
+        # Queues are short-lived and small, so every pass copies them whole.
+        self._copy_batches(PreparedPass, self._source(PreparedPass).filter(station__business_id=self.business_id))
+
+        transactions = self._source(Transaction).filter(business_id=self.business_id)
+        if since:
+            transactions = transactions.filter(created_at__gte=since)
+        with explicit_timestamps(Transaction, "created_at"):
+            copied += self._copy_batches(Transaction, transactions, immutable=True)
+
+        registrations = self._source(PassRegistration).filter(
+            loyalty_card__business_customer__business_id=self.business_id
+        )
+        if since:
+            registrations = registrations.filter(updated_at__gte=since)
+        with explicit_timestamps(PassRegistration, "updated_at"):
+            for batch in _batched(registrations.order_by("pk").iterator(chunk_size=self.batch_size), self.batch_size):
+                for registration in batch:
+                    # Auto ids are per database; the natural key identifies the row.
+                    registration.pk = None
+                self._upsert(
+                    PassRegistration,
+                    batch,
+                    unique_fields=["loyalty_card", "device_library_identifier", "pass_type_identifier"],
+                    update_fields=["push_token", "updated_at"],
+                )
+        if since:
+            self._drop_unregistered_devices()
+        self.log(f"{label}: {copied} cards and transactions copied to {self.target}.")
+
+    def _copy_batches(self, model, queryset, immutable=False):
+        copied = 0
+        for batch in _batched(queryset.order_by("pk").iterator(chunk_size=self.batch_size), self.batch_size):
+            if immutable:
+                self._target(model).bulk_create(batch, ignore_conflicts=True)
+            else:
+                self._upsert(model, batch)
+            copied += len(batch)
+        return copied
+
+    def _copy_customers(self, bcs):
+        customer_ids = bcs.values_list("customer_id", flat=True).order_by("customer_id")
+        for batch in _batched(customer_ids.iterator(chunk_size=self.batch_size), self.batch_size):
+            pending = [pk for pk in batch if pk not in self.customer_ids]
+            if not pending:
+                continue
+            customers = list(self._source(Customer).filter(pk__in=pending))
+            existing = dict(
+                self._target(Customer)
+                .filter(phone_number__in=[customer.phone_number for customer in customers])
+                .values_list("phone_number", "pk")
+            )
+            missing = [customer for customer in customers if customer.phone_number not in existing]
+            self._target(Customer).bulk_create(missing, ignore_conflicts=True)
+            for customer in customers:
+                self.customer_ids[customer.pk] = existing.get(customer.phone_number, customer.pk)
+
+    def _drop_unregistered_devices(self):
+        natural_key = ("loyalty_card_id", "device_library_identifier", "pass_type_identifier")
+        source_keys = set(
+            self._source(PassRegistration)
+            .filter(loyalty_card__business_customer__business_id=self.business_id)
+            .values_list(*natural_key)
+        )
+        stale = [
+            pk
+            for pk, *key in self._target(PassRegistration)
+            .filter(loyalty_card__business_customer__business_id=self.business_id)
+            .values_list("pk", *natural_key)
+            if tuple(key) not in source_keys
+        ]
+        for batch in _batched(stale, self.batch_size):
+            self._target(PassRegistration).filter(pk__in=batch).delete()
+
+    def delete_source(self):
+        scope = {
+            PassRegistration: {"loyalty_card__business_customer__business_id": self.business_id},
+            PreparedPass: {"station__business_id": self.business_id},
+            Transaction: {"business_id": self.business_id},
+            Station: {"business_id": self.business_id},
+            LoyaltyCard: {"business_customer__business_id": self.business_id},
+            BusinessCustomer: {"business_id": self.business_id},
+        }
+        for model, filters in scope.items():
+            while True:
+                pks = list(self._source(model).filter(**filters).values_list("pk", flat=True)[: self.batch_size])
+                if not pks:
+                    break
+                with db_transaction.atomic(using=self.source):
+                    self._source(model).filter(pk__in=pks).delete()
+
+        # Deleting through the ORM would cascade into the owner's account on
+        # the default database, so remove the business row directly.
+        connection = connections[self.source]
+        pk_field = Business._meta.pk
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {connection.ops.quote_name(Business._meta.db_table)} "
+                f"WHERE {connection.ops.quote_name(pk_field.column)} = %s",
+                [pk_field.get_db_prep_value(self.business_id, connection)],
+            )
+
+        orphaned = self._source(Customer).filter(
+            pk__in=list(self.customer_ids),
+            businesscustomer__isnull=True,
+        )
+        for batch in _batched(orphaned.values_list("pk", flat=True).iterator(), self.batch_size):
+            self._source(Customer).filter(pk__in=batch).delete()
+        self.log(f"Removed {self.business_id} from {self.source}.")
@@ -0,0 +1,347 @@
+"""
+Deterministic synthetic data for scale testing.
+
+Every business is generated from its own NumPy generator seeded with
+(seed, business index), so the same options always produce the same rows
+(ids included) whether one process or several do the work. Credentials
+are the exception: station api tokens and pass auth tokens come from
+`secrets`, so knowing the seed never lets anyone authenticate. Transaction
+volume is Zipf-distributed: a few businesses and, within each business, a
+few regular customers account for most of the traffic.
+"""
+
+import multiprocessing
+import secrets
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .ids import uuid7_from
+from .models import Business, BusinessCustomer, Customer, LoyaltyCard, PassRegistration, Station, Transaction
+from .sharding import use_shard
+from .utils import explicit_timestamps
+
+FIRST_NAMES = ("Ana", "Ben", "Chloe", "Dev", "Elena", "Femi", "Grace", "Hiro", "Ines", "Jamal", "Kai", "Lena")
+LAST_NAMES = ("Garcia", "Nguyen", "Smith", "Okafor", "Rossi", "Kim", "Patel", "Novak", "Silva", "Cohen")
+
+REWARD_RATE = Decimal("1.000")
+REDEMPTION_POINTS = 100
+REDEMPTION_RATE = Decimal("0.10")
+
+
+@dataclass(frozen=True)
+class DatasetPlan:
+    businesses: int = 20
+    stations_per_business: int = 4
+    cards_per_business: int = 500
+    transactions: int = 100_000
+    span_days: int = 365
+    # Zipf exponent for business and card activity; 0 spreads traffic evenly.
+    skew: float = 1.1
+    redeem_share: float = 0.03
+    wallet_share: float = 0.4
+    batch_size: int = 10_000
+    seed: int = 0
+    # Phone numbers are "+1" followed by phone_start + a running customer index.
+    phone_start: int = 2_000_000_000
+    end: datetime = None
+
+    def zipf_weights(self, size):
+        ranks = np.arange(1, size + 1, dtype=np.float64)
+        weights = ranks ** -self.skew
+        return weights / weights.sum()
+
+    def transactions_per_business(self):
+        shares = self.zipf_weights(self.businesses)
+        counts = np.floor(shares * self.transactions).astype(np.int64)
+        counts[: self.transactions - counts.sum()] += 1
+        return counts
+
+
+@dataclass
+class DatasetSummary:
+    businesses: int = 0
+    stations: int = 0
+    cards: int = 0
+    transactions: int = 0
+    registrations: int = 0
+
+    def add(self, other):
+        for field in ("businesses", "stations", "cards", "transactions", "registrations"):
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+        return self
+
+
+def _uuid4(rng):
+    return uuid.UUID(bytes=rng.bytes(16), version=4)
+
+
+def _uuid7_bits(rng, size):
+    """The random rand_a and rand_b fields of `size` uuid7 ids."""
+    return rng.integers(0, 1 << 12, size=size), rng.integers(0, 1 << 62, size=size, dtype=np.int64)
+
+
+def _datetime(ms):
+    return datetime.fromtimestamp(ms / 1000, tz=dt_timezone.utc)
+
+
+def _cents(value):
+    return Decimal(int(value)).scaleb(-2)
+
+
+def generate_business(plan, index, transaction_count, end_ms):
+    rng = np.random.default_rng([plan.seed, index])
+    business = Business(
+        id=_uuid4(rng),
+        name=f"Synthetic {plan.seed}-{index}",
+        reward_rate=REWARD_RATE,
+        redemption_points=REDEMPTION_POINTS,
+        redemption_rate=REDEMPTION_RATE,
+        logo_url="https://example.com/logo.png",
+    )
+    business.save(force_insert=True)
+    # The rest of the tenant's rows follow the business to its shard.
+    with use_shard(business._state.db):
+        summary = _populate_business(plan, rng, business, index, transaction_count, end_ms)
+    return business, summary
+
+
+def _populate_business(plan, rng, business, index, transaction_count, end_ms):
+    summary = DatasetSummary(businesses=1)
+    span_ms = plan.span_days * 86_400_000
+    start_ms = end_ms - span_ms
+
+    stations = Station.objects.bulk_create(
+        Station(
+            id=_uuid4(rng),
+            business=business,
+            name=f"Register {number + 1}",
+            api_token=secrets.token_hex(32),
+            public_slug=f"synthetic-{business.pk.hex[:12]}-{number + 1}",
+        )
+        for number in range(plan.stations_per_business)
+    )
+    summary.stations = len(stations)
+
+    # Transactions are drawn first so card balances can match their history.
+    cards_count = plan.cards_per_business
+    card_rank = rng.permutation(cards_count)
+    card_index = card_rank[rng.choice(cards_count, size=transaction_count, p=plan.zipf_weights(cards_count))]
+    station_index = rng.integers(0, len(stations), size=transaction_count)
+    created_ms = np.sort(start_ms + rng.integers(0, span_ms, size=transaction_count))
+    cents = np.clip(np.round(rng.lognormal(np.log(1500), 0.6, size=transaction_count)), 100, 50_000).astype(np.int64)
+    earned = cents * int(REWARD_RATE) // 100
+    redeemed = np.where(rng.random(transaction_count) < plan.redeem_share, REDEMPTION_POINTS, 0)
+    final_cents = np.where(redeemed > 0, cents - np.round(cents * float(REDEMPTION_RATE)).astype(np.int64), cents)
+    balances = np.maximum(
+        np.bincount(card_index, weights=earned - redeemed, minlength=cards_count), 0
+    ).astype(np.int64)
+
+    phone_base = plan.phone_start + index * cards_count
+    customers = Customer.objects.bulk_create(
+        (
+            Customer(
+                id=_uuid4(rng),
+                name=f"{FIRST_NAMES[first]} {LAST_NAMES[last]}",
+                phone_number=f"+1{phone_base + number:010d}",
+            )
+            for number, (first, last) in enumerate(
+                zip(rng.integers(0, len(FIRST_NAMES), cards_count), rng.integers(0, len(LAST_NAMES), cards_count))
+            )
+        ),
+        batch_size=plan.batch_size,
+    )
+    business_customers = BusinessCustomer.objects.bulk_create(
+        (BusinessCustomer(id=_uuid4(rng), business=business, customer=customer) for customer in customers),
+        batch_size=plan.batch_size,
+    )
+    card_created_ms = start_ms - rng.integers(0, 30 * 86_400_000, size=cards_count)
+    with explicit_timestamps(LoyaltyCard, "created_at", "updated_at"):
+        cards = LoyaltyCard.objects.bulk_create(
+            (
+                LoyaltyCard(
+                    token=_uuid4(rng),
+                    business_customer=bc,
+                    points_balance=int(balance),
+                    apple_auth_token=secrets.token_hex(32),
+                    created_at=_datetime(ms),
+                    updated_at=_datetime(end_ms),
+                )
+                for bc, balance, ms in zip(business_customers, balances, card_created_ms)
+            ),
+            batch_size=plan.batch_size,
+        )
+    summary.cards = len(cards)
+
+    with_wallet = np.flatnonzero(rng.random(cards_count) < plan.wallet_share)
+    registrations = PassRegistration.objects.bulk_create(
+        (
+            PassRegistration(
+                loyalty_card=cards[number],
+                device_library_identifier=rng.bytes(16).hex(),
+                pass_type_identifier=settings.APPLE_PASS_TYPE_IDENTIFIER,
+                push_token=rng.bytes(32).hex(),
+            )
+            for number in with_wallet
+        ),
+        batch_size=plan.batch_size,
+    )
+    summary.registrations = len(registrations)
+
+    writer = _TransactionWriter(business._state.db)
+    station_values = [writer.prepare("station", station.pk) for station in stations]
+    card_values = [writer.prepare("loyalty_card", card.pk) for card in cards]
+    business_value = writer.prepare("business", business.pk)
+    for start in range(0, transaction_count, plan.batch_size):
+        chunk = slice(start, start + plan.batch_size)
+        rand_a, rand_b = _uuid7_bits(rng, len(created_ms[chunk]))
+        writer.insert(
+            (
+                txn_id,
+                business_value,
+                station_values[station],
+                card_values[card],
+                writer.money(amount),
+                writer.money(final),
+                points,
+                spent,
+                created_at,
+            )
+            for txn_id, created_at, station, card, amount, final, points, spent in zip(
+                writer.ids(created_ms[chunk], rand_a, rand_b),
+                writer.datetimes(created_ms[chunk]),
+                station_index[chunk].tolist(),
+                card_index[chunk].tolist(),
+                cents[chunk].tolist(),
+                final_cents[chunk].tolist(),
+                earned[chunk].tolist(),
+                redeemed[chunk].tolist(),
+            )
+        )
+    summary.transactions = transaction_count
+    return summary
+
+
+class _TransactionWriter:
+    """
+    Insert transaction rows with one prepared statement per batch.
+
+    bulk_create compiles a multi-row INSERT capped by SQLite's parameter
+    limit (about 110 rows per statement here), which made statement
+    compilation the bottleneck at a million rows. Values are still prepared
+    by the model fields, so what lands in the table matches what the ORM
+    would write. The exception is SQLite with UTC connections, where ids
+    and created_at (most of the per-row cost) are formatted in bulk to the
+    same text the fields produce: 32 hex digits and naive UTC datetimes.
+    """
+
+    columns = (
+        "id", "business", "station", "loyalty_card", "amount", "final_amount",
+        "points_earned", "points_redeemed", "created_at",
+    )
+
+    def __init__(self, alias):
+        self.connection = connections[alias]
+        self.fields = {name: Transaction._meta.get_field(name) for name in self.columns}
+        quote = self.connection.ops.quote_name
+        self.sql = "INSERT INTO {} ({}) VALUES ({})".format(
+            quote(Transaction._meta.db_table),
+            ", ".join(quote(self.fields[name].column) for name in self.columns),
+            ", ".join(["%s"] * len(self.columns)),
+        )
+        self._money = {}
+        self.text_values = (
+            self.connection.vendor == "sqlite" and settings.USE_TZ and self.connection.timezone_name == "UTC"
+        )
+
+    def prepare(self, name, value):
+        return self.fields[name].get_db_prep_save(value, self.connection)
+
+    def ids(self, timestamps_ms, rand_a, rand_b):
+        """Prepared uuid7 ids (see api.ids.uuid7_from) for the given fields."""
+        if not self.text_values:
+            return [
+                self.prepare("id", uuid7_from(ms, a, b))
+                for ms, a, b in zip(timestamps_ms.tolist(), rand_a.tolist(), rand_b.tolist())
+            ]
+        # Version 7 after the timestamp, RFC 9562 variant bits over rand_b.
+        rand_b = rand_b.astype(np.uint64) | np.uint64(1 << 63)
+        return [
+            f"{ms:012x}7{a:03x}{b:016x}"
+            for ms, a, b in zip(timestamps_ms.tolist(), rand_a.tolist(), rand_b.tolist())
+        ]
+
+    def datetimes(self, timestamps_ms):
+        """Prepared created_at values for millisecond Unix timestamps."""
+        if not self.text_values:
+            return [self.prepare("created_at", _datetime(ms)) for ms in timestamps_ms.tolist()]
+        # str(datetime) leaves out whole-second microseconds, and so does SQLite's adapter.
+        return [
+            value.replace("T", " ").removesuffix(".000000")
+            for value in np.datetime_as_string(timestamps_ms.astype("datetime64[ms]"), unit="us").tolist()
+        ]
+
+    def money(self, cents):
+        # Amounts repeat a lot, so each distinct value is prepared once.
+        cents = int(cents)
+        value = self._money.get(cents)
+        if value is None:
+            value = self._money[cents] = self.prepare("amount", _cents(cents))
+        return value
+
+    def insert(self, rows):
+        with transaction.atomic(using=self.connection.alias), self.connection.cursor() as cursor:
+            cursor.executemany(self.sql, list(rows))
+
+
+def _end_ms(plan):
+    end = plan.end or timezone.now()
+    return int(end.timestamp() * 1000)
+
+
+def _generate_slice(plan, indices, counts, end_ms):
+    summary = DatasetSummary()
+    for index in indices:
+        summary.add(generate_business(plan, index, int(counts[index]), end_ms)[1])
+    return summary
+
+
+def _generate_in_worker(plan, indices, counts, end_ms):
+    try:
+        return _generate_slice(plan, indices, counts, end_ms)
+    finally:
+        connections.close_all()
+
+
+def generate_dataset(plan, workers=1):
+    """
+    Insert the whole dataset and return a DatasetSummary. With workers > 1
+    the businesses are split across forked processes; SQLite still takes
+    their writes one at a time, but row generation runs in parallel.
+    """
+    counts = plan.transactions_per_business()
+    end_ms = _end_ms(plan)
+    if workers <= 1 or plan.businesses <= 1:
+        return _generate_slice(plan, range(plan.businesses), counts, end_ms)
+
+    # Children must open their own connections rather than share the parent's.
+    connections.close_all()
+    slices = [range(worker, plan.businesses, workers) for worker in range(workers)]
+    context = multiprocessing.get_context("fork")
+    summary = DatasetSummary()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        for part in pool.map(_generate_in_worker, [plan] * workers, slices, [counts] * workers, [end_ms] * workers):
+            summary.add(part)
+    return summary
+
+
+def business_ids(plan):
+    """The ids generate_dataset assigns to the plan's businesses, in index order."""
+    return [_uuid4(np.random.default_rng([plan.seed, index])) for index in range(plan.businesses)]
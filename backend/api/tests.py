@@ -1,15 +1,69 @@
+import json
+import os
+import re
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import tracemalloc
 import uuid
+import zlib
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from pathlib import Path
 from unittest import mock
 from decimal import Decimal
 
+import numpy as np
 from django.conf import settings
-from django.urls import reverse
+from django.contrib.auth.hashers import check_password
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.core.servers.basehttp import WSGIServer
+from django.db import OperationalError, connection, connections
+from django.db.models import Count, Sum
+from django.test import LiveServerTestCase, TransactionTestCase, override_settings
+from django.test.testcases import LiveServerThread
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from django.utils import timezone
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.test import APIClient, APITestCase
 
 from accounts.models import BusinessUser
-from api.models import Business, BusinessCustomer, Customer, LoyaltyCard, Station, PassRegistration, Transaction
-from api.passkit import ensure_card_auth_token, notify_loyalty_card_updated
+from api.apns_stub import ApnsStub, provider_token_problem
+from api.archive import archived_periods, daily_revenue, summarize
+from api.benchmarks import compare_results, run_benchmarks
+from api.device_logs import DeviceLogBuffer, device_log_buffer, fingerprint
+from api.ids import uuid7, uuid7_from, uuid7_timestamp_ms
+from api.issuance import issue_loyalty_card
+from api.loadtest import LoadPlan, run_load
+from api.models import (
+    Business,
+    BusinessCustomer,
+    Customer,
+    DeviceLog,
+    LoyaltyCard,
+    PassRegistration,
+    PreparedPass,
+    Station,
+    TenantShard,
+    Transaction,
+)
+from api.passkit import _build_pass_json, ensure_card_auth_token, list_serial_numbers, notify_loyalty_card_updated
+from api.pass_links import signed_pass_path
+from api.pass_refresh import PassRefreshScheduler, push_card_updates, refresh_business_passes
+from api.prepared import claim_prepared_pass, enqueue_prepared_pass, purge_expired_prepared_passes
+from api.push import AppleWalletPushClient, PassRegistrationPayload
+from api.qr import qr_image, qr_matrix
+from api.sharding import shard_map
+from api.synthetic import DatasetPlan, _TransactionWriter, _datetime, business_ids, generate_dataset
+from api.utils import retry_on_database_lock
+from api.views import LoyaltyCardIssueView, TransactionViewSet
+from server.metrics import EXITED_SNAPSHOT, REGISTRY, Registry, _process_alive
+from server.query_budget import QueryBudgetExceeded, sql_shape, view_budget
+from server.replica import ReplicaRouter, ReplicaRoutingMiddleware, copy_sqlite_database
 
 
 def create_business(name="Primary Biz"):
@@ -28,6 +82,46 @@ def unique_phone():
     return "+1" + str(uuid.uuid4().int)[:10]
 
 
+FULL_SCAN_PATTERN = re.compile(r"\bSCAN (api_\w+)(?! USING)")
+
+
+def explain_query_plan(sql, params=()):
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+# Overrun query budgets fail the test whatever DEBUG says, device logs stay
+# buffered until a test flushes them, and pass refreshes run inline. Test
+# classes take this innermost so their own overrides still win.
+test_settings = override_settings(
+    QUERY_BUDGET_MODE="raise", PASSKIT_LOG_FLUSH_SECONDS=0, PASS_REFRESH_IN_BACKGROUND=False
+)
+
+
+class QueryPlanAssertionsMixin:
+    def assertViewAvoidsFullScans(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        selects = [query["sql"] for query in ctx.captured_queries if query["sql"].startswith("SELECT")]
+        self.assertTrue(selects)
+        for sql in selects:
+            plan = explain_query_plan(sql)
+            scans = [line for line in plan if FULL_SCAN_PATTERN.search(line)]
+            self.assertFalse(scans, f"Full table scan in plan for {sql!r}: {plan}")
+        return selects
+
+    def assertQueryUsesIndex(self, queryset, index_name):
+        plan = explain_query_plan(*queryset.query.sql_with_params())
+        self.assertTrue(
+            any(f"INDEX {index_name} " in line for line in plan),
+            f"Expected {index_name} in plan: {plan}",
+        )
+
+
+@test_settings
 class AuthenticatedBusinessAPITestCase(APITestCase):
     def setUp(self):
         super().setUp()
@@ -46,6 +140,23 @@ class AuthenticatedBusinessAPITestCase(APITestCase):
     def create_station(self, name="Front Counter"):
         return Station.objects.create(business=self.business, name=name)
 
+    def create_installed_passes(self, push_tokens):
+        cards = []
+        for index, push_token in enumerate(push_tokens):
+            card = LoyaltyCard.objects.create(
+                business_customer=BusinessCustomer.objects.create(
+                    business=self.business, customer=self.create_customer(f"Holder {index}")
+                )
+            )
+            PassRegistration.objects.create(
+                loyalty_card=card,
+                device_library_identifier=f"device-{index}",
+                pass_type_identifier=settings.APPLE_PASS_TYPE_IDENTIFIER,
+                push_token=push_token,
+            )
+            cards.append(card)
+        return cards
+
 
 class BusinessViewSetTests(AuthenticatedBusinessAPITestCase):
     def test_list_returns_only_authenticated_business(self):
@@ -58,6 +169,90 @@ class BusinessViewSetTests(AuthenticatedBusinessAPITestCase):
         self.assertEqual(len(response.data["results"]), 1)
         self.assertEqual(response.data["results"][0]["id"], str(self.business.pk))
 
+    def test_branding_change_refreshes_installed_passes(self):
+        cards = self.create_installed_passes(["phone-a", "phone-a", "phone-b"])
+        versions = {card.pk: (card.pass_version, card.updated_at) for card in cards}
+
+        with mock.patch("api.pass_refresh.send_wallet_pass_update") as push_mock, self.captureOnCommitCallbacks(
+            execute=True
+        ) as callbacks:
+            response = self.client.patch(
+                reverse("business-detail", args=[self.business.pk]), {"background_color": "#123456"}, format="json"
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(callbacks), 1)
+        self.assertCountEqual(
+            [payload.push_token for call in push_mock.call_args_list for payload in call.args[0]],
+            ["phone-a", "phone-b"],
+        )
+        for card in cards:
+            card.refresh_from_db()
+            self.assertGreater(card.pass_version, versions[card.pk][0])
+            # Business moves catch up on cards by updated_at.
+            self.assertGreater(card.updated_at, versions[card.pk][1])
+        card = LoyaltyCard.objects.select_related(
+            "business_customer__business", "business_customer__customer"
+        ).get(pk=cards[0].pk)
+        self.assertEqual(_build_pass_json(card)["backgroundColor"], "#123456")
+
+    def test_edits_that_leave_passes_alone_push_nothing(self):
+        self.create_installed_passes(["phone-a"])
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.patch(
+                reverse("business-detail", args=[self.business.pk]),
+                {"logo_url": "https://example.com/new-logo.png"},
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(callbacks, [])
+
+    def test_refresh_paces_pushes_to_the_configured_rate(self):
+        self.create_installed_passes([f"phone-{index}" for index in range(5)])
+        waits = []
+
+        with mock.patch("api.pass_refresh.send_wallet_pass_update") as push_mock:
+            refresh = refresh_business_passes(self.business, chunk_size=2, rate=2, sleep=waits.append)
+
+        self.assertEqual((refresh.cards_updated, refresh.devices_notified), (5, 5))
+        self.assertEqual([len(call.args[0]) for call in push_mock.call_args_list], [2, 2, 1])
+        # The sleeps don't pass time here, so each wait is measured from the start.
+        self.assertEqual(len(waits), 3)
+        self.assertAlmostEqual(waits[-1], 2.5, delta=0.5)
+
+    def test_edits_during_a_refresh_coalesce_into_one_rerun(self):
+        scheduler = PassRefreshScheduler()
+        runs = []
+
+        def refresh(business):
+            runs.append(business.pk)
+            if len(runs) == 1:
+                self.assertFalse(scheduler.schedule(self.business))
+                self.assertFalse(scheduler.schedule(self.business))
+
+        with mock.patch("api.pass_refresh.refresh_business_passes", side_effect=refresh):
+            self.assertTrue(scheduler.schedule(self.business))
+
+        self.assertEqual(runs, [self.business.pk, self.business.pk])
+        self.assertEqual(scheduler._running, set())
+
+    def test_card_fan_outs_scheduled_during_a_job_are_merged(self):
+        scheduler = PassRefreshScheduler()
+        pushed = []
+
+        def push(business, card_ids):
+            pushed.append(card_ids)
+            if len(pushed) == 1:
+                self.assertFalse(scheduler.schedule(self.business, card_ids=[3, 2]))
+                self.assertFalse(scheduler.schedule(self.business, card_ids=[2, 4]))
+
+        with mock.patch("api.pass_refresh.push_card_updates", side_effect=push):
+            self.assertTrue(scheduler.schedule(self.business, card_ids=[1]))
+
+        self.assertEqual(pushed, [[1], [2, 3, 4]])
+
 
 class BusinessCustomerViewSetTests(AuthenticatedBusinessAPITestCase):
     def setUp(self):
@@ -148,6 +343,192 @@ class LoyaltyCardViewSetTests(AuthenticatedBusinessAPITestCase):
         self.assertEqual(response.data["business_customer"]["id"], str(self.business_customer.pk))
         self.assertEqual(response.data["points_balance"], 0)
 
+    def test_edited_cards_are_listed_as_changed_for_their_devices(self):
+        card = self.create_installed_passes(["edit-device"])[0]
+        registration = PassRegistration.objects.get(loyalty_card=card)
+        args = (registration.device_library_identifier, registration.pass_type_identifier)
+        _, tag = list_serial_numbers(*args, None)
+
+        response = self.client.patch(
+            reverse("loyaltycard-detail", args=[card.token]),
+            {"business_customer_id": str(card.business_customer_id)},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        serials, new_tag = list_serial_numbers(*args, tag)
+        self.assertEqual(serials, [str(card.token)])
+        self.assertGreater(int(new_tag), int(tag))
+
+        card.refresh_from_db()
+        card.points_balance = 40
+        card.save()
+        self.assertEqual(list_serial_numbers(*args, new_tag)[0], [str(card.token)])
+        self.assertGreater(card.pass_version, int(new_tag))
+
+    def test_bulk_revoke_updates_cards_and_pushes_once_per_device(self):
+        shared = self.create_installed_passes(["shared-device"] * 3)
+        single = self.create_installed_passes(["single-device"])
+        untouched = self.create_installed_passes(["untouched-device"])
+        other_bc = BusinessCustomer.objects.create(
+            business=create_business("Other Biz"),
+            customer=Customer.objects.create(name="Eve", phone_number=unique_phone()),
+        )
+        foreign = LoyaltyCard.objects.create(business_customer=other_bc)
+        versions = {card.pk: card.pass_version for card in shared + single}
+
+        with mock.patch("api.views.schedule_pass_refresh") as schedule_mock, mock.patch(
+            "api.pass_refresh.send_wallet_pass_update"
+        ) as push_mock:
+            response = self.client.post(
+                reverse("loyaltycard-wallet-status"),
+                {
+                    "wallet_status": "revoked",
+                    "tokens": [str(card.token) for card in shared + single + [foreign]],
+                },
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"cards_updated": 4, "fan_out_queued": True})
+        push_mock.assert_not_called()
+        schedule_mock.assert_called_once()
+        card_ids = schedule_mock.call_args.kwargs["card_ids"]
+        self.assertCountEqual(card_ids, [card.pk for card in shared + single])
+        for card in shared + single:
+            card.refresh_from_db()
+            self.assertEqual(card.wallet_status, "revoked")
+            self.assertGreater(card.pass_version, versions[card.pk])
+        self.assertEqual(LoyaltyCard.objects.get(pk=untouched[0].pk).wallet_status, "active")
+        self.assertEqual(LoyaltyCard.objects.get(pk=foreign.pk).wallet_status, "active")
+
+        waits = []
+        with mock.patch("api.pass_refresh.send_wallet_pass_update") as push_mock:
+            self.assertEqual(push_card_updates(self.business, card_ids, rate=1, sleep=waits.append), 2)
+        self.assertCountEqual(
+            [payload.push_token for call in push_mock.call_args_list for payload in call.args[0]],
+            ["shared-device", "single-device"],
+        )
+        self.assertEqual(len(waits), 2)
+
+        with mock.patch("api.pass_refresh.send_wallet_pass_update") as push_mock:
+            again = self.client.post(
+                reverse("loyaltycard-wallet-status"),
+                {"wallet_status": "revoked", "current_status": "active", "all": True},
+                format="json",
+            )
+        self.assertEqual(again.data, {"cards_updated": 1, "fan_out_queued": True})
+        self.assertEqual([payload.push_token for payload in push_mock.call_args.args[0]], ["untouched-device"])
+
+        unchanged = self.client.post(
+            reverse("loyaltycard-wallet-status"), {"wallet_status": "revoked", "all": True}, format="json"
+        )
+        self.assertEqual(unchanged.data, {"cards_updated": 0, "fan_out_queued": False})
+
+    def test_bulk_status_change_requires_a_filter(self):
+        response = self.client.post(
+            reverse("loyaltycard-wallet-status"), {"wallet_status": "expired"}, format="json"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("all=true", response.data["non_field_errors"][0])
+
+    def test_change_wallet_status_command_works_in_chunks(self):
+        cards = self.create_installed_passes(["kiosk-device"] * 5)
+        LoyaltyCard.objects.filter(pk=cards[0].pk).update(updated_at=timezone.now() + timedelta(days=1))
+        out = StringIO()
+
+        with mock.patch("api.pass_refresh.send_wallet_pass_update"), CaptureQueriesContext(connection) as queries:
+            call_command(
+                "change_wallet_status", str(self.business.pk), "expired",
+                updated_before=(timezone.now() + timedelta(hours=1)).isoformat(), chunk_size=2, stdout=out,
+            )
+
+        self.assertEqual(json.loads(out.getvalue()), {"cards_updated": 4, "devices_notified": 1})
+        updates = [query for query in queries.captured_queries if query["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual(
+            list(LoyaltyCard.objects.filter(business_customer__business=self.business, wallet_status="active")),
+            [cards[0]],
+        )
+
+    def test_voided_cards_build_voided_passes(self):
+        card = LoyaltyCard.objects.select_related("business_customer__business", "business_customer__customer").get(
+            pk=LoyaltyCard.objects.create(business_customer=self.business_customer).pk
+        )
+        self.assertNotIn("voided", _build_pass_json(card))
+
+        card.wallet_status = "expired"
+        self.assertIs(_build_pass_json(card)["voided"], True)
+
+
+class LoyaltyCardQRTests(AuthenticatedBusinessAPITestCase):
+    # Cross-checked against an independent encoder (byte mode, level M, mask 2).
+    LOYALTY_MASK_2 = (
+        "#######.......#######",
+        "#.....#..#.#..#.....#",
+        "#.###.#.#.#.#.#.###.#",
+        "#.###.#.#.#.#.#.###.#",
+        "#.###.#.###.#.#.###.#",
+        "#.....#.##.#..#.....#",
+        "#######.#.#.#.#######",
+        "........##...........",
+        "#.#####....#..#####..",
+        "....#..#..######.#..#",
+        ".###.###.#..#.##.#.#.",
+        "######.###.####..##..",
+        "#.###.#.##..#..###.##",
+        "........###.#...#...#",
+        "#######...##.#...###.",
+        "#.....#.###....#.####",
+        "#.###.#.####.#.....#.",
+        "#.###.#.#.#####.#.#..",
+        "#.###.#.##..#.#..##..",
+        "#.....#..#######.##..",
+        "#######.###.#...#..#.",
+    )
+
+    def setUp(self):
+        super().setUp()
+        bc = BusinessCustomer.objects.create(business=self.business, customer=self.create_customer("Quinn"))
+        self.card = LoyaltyCard.objects.create(business_customer=bc)
+        self.url = reverse("loyaltycard-qr", args=[self.card.token])
+
+    def test_matrix_matches_reference_encoding(self):
+        rendered = ["".join("#" if dark else "." for dark in row) for row in qr_matrix(b"loyalty", mask=2)]
+        self.assertEqual(tuple(rendered), self.LOYALTY_MASK_2)
+        self.assertEqual(len(qr_matrix(str(self.card.token))), 29)
+
+    def test_png_is_rendered_once_and_cached_immutably(self):
+        qr_image.cache_clear()
+        response = self.client.get(f"{self.url}?file_format=png&size=small")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertIn("immutable", response["Cache-Control"])
+
+        png = response.content
+        self.assertEqual(png[:8], b"\x89PNG\r\n\x1a\n")
+        width, height = struct.unpack(">II", png[16:24])
+        self.assertEqual((width, height), ((29 + 8) * 4, (29 + 8) * 4))
+        rows = zlib.decompress(png[png.index(b"IDAT") + 4:png.index(b"IEND") - 8])
+        row_bytes = 1 + (width + 7) // 8
+        # The quiet zone is light and the top-left finder's corner dark.
+        first_dark = 16 * row_bytes + 1 + 16 // 8
+        self.assertEqual(rows[1], 0xFF)
+        self.assertEqual(rows[first_dark] & 0x80, 0)
+
+        self.client.get(f"{self.url}?file_format=png&size=small")
+        self.assertEqual(qr_image.cache_info().hits, 1)
+
+    def test_json_lists_image_urls_and_rejects_unknown_variants(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.data["qr_payload"], str(self.card.token))
+        svg = self.client.get(response.data["images"]["svg"]["large"])
+        self.assertEqual(svg["Content-Type"], "image/svg+xml")
+        self.assertTrue(svg.content.startswith(b"<svg"))
+
+        self.assertEqual(self.client.get(f"{self.url}?file_format=gif").status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(f"{self.url}?file_format=png&size=huge").status_code, status.HTTP_400_BAD_REQUEST)
+
 
 class StationViewSetTests(AuthenticatedBusinessAPITestCase):
     def setUp(self):
@@ -183,7 +564,49 @@ class StationViewSetTests(AuthenticatedBusinessAPITestCase):
         self.assertEqual(station.business, self.business)
         self.assertEqual(len(station.api_token), 64)
 
+    def test_slug_allocation_is_one_query_however_many_collide(self):
+        Station.objects.bulk_create(
+            [Station(business=self.business, name="Register", public_slug="register", api_token="0" * 64)]
+            + [
+                Station(business=self.business, name="Register", public_slug=f"register-{n}", api_token=f"{n:064d}")
+                for n in range(1, 50)
+            ]
+            + [Station(business=self.business, name="Register East", public_slug="register-east", api_token="e" * 64)]
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            station = self.create_station("Register")
+        self.assertEqual(station.public_slug, "register-50")
+        self.assertEqual(len([query for query in queries if query["sql"].startswith("SELECT")]), 1)
+        self.assertEqual(Station.allocate_slugs(["Register", "Register", "Kiosk"]), ["register-51", "register-52", "kiosk"])
+
+    def test_bulk_provisioning_creates_stations_in_a_few_queries(self):
+        self.create_station("Lane")
+        names = ["Lane"] * 3 + [f"Drive Thru {n}" for n in range(200)]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse("station-bulk"), {"names": names}, format="json")
 
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([station["public_slug"] for station in response.data[:3]], ["lane-1", "lane-2", "lane-3"])
+        self.assertEqual(response.data[3]["public_slug"], "drive-thru-0")
+        self.assertEqual(Station.objects.filter(business=self.business).count(), 204)
+        self.assertEqual(len({station["api_token"] for station in response.data}), 203)
+        self.assertLessEqual(len(queries), 5)
+
+        response = self.client.post(reverse("station-bulk"), {"names": ["ok", ""]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_provision_stations_command(self):
+        out = StringIO()
+        call_command("provision_stations", str(self.business.pk), count=3, prefix="Kiosk", stdout=out, stderr=StringIO())
+
+        created = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([station["public_slug"] for station in created], ["kiosk-1", "kiosk-2", "kiosk-3"])
+        self.assertEqual(Station.objects.filter(business=self.business, name__startswith="Kiosk").count(), 3)
+
+
+@test_settings
 class CustomerViewSetPermissionTests(APITestCase):
     def setUp(self):
         super().setUp()
@@ -254,6 +677,22 @@ class LoyaltyCardIssuanceTests(AuthenticatedBusinessAPITestCase):
         self.assertEqual(BusinessCustomer.objects.count(), 1)
         self.assertEqual(LoyaltyCard.objects.count(), 1)
 
+    def test_issue_runs_a_fixed_number_of_queries(self):
+        def issue(name):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(self.url, {"customer_name": name, "phone_number": "555-111-2222"}, format="json")
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            return response.data, len(queries)
+
+        first, new_card_queries = issue("Sam")
+        second, existing_card_queries = issue("Samantha")
+
+        self.assertEqual(second["loyalty_card"]["token"], first["loyalty_card"]["token"])
+        self.assertEqual(second["loyalty_card"]["authentication_token"], first["loyalty_card"]["authentication_token"])
+        self.assertEqual(second["customer"]["name"], "Samantha")
+        self.assertLessEqual(new_card_queries, LoyaltyCardIssueView.query_budget)
+        self.assertEqual(existing_card_queries, new_card_queries + 1)
+
 
 class StationPreparedPassTests(AuthenticatedBusinessAPITestCase):
     def setUp(self):
@@ -276,6 +715,132 @@ class StationPreparedPassTests(AuthenticatedBusinessAPITestCase):
         self.assertIsNone(station.prepared_loyalty_card)
 
 
+class SignedPassLinkTests(AuthenticatedBusinessAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.station = self.create_station()
+        self.client.credentials(HTTP_X_STATION_TOKEN=self.station.api_token)
+        response = self.client.post(
+            reverse("loyaltycard-issue"), {"customer_name": "Lee", "phone_number": "555-333-4444"}, format="json"
+        )
+        self.issued = response.data
+        self.token = response.data["loyalty_card"]["token"]
+        self.client = APIClient()
+
+    def test_issue_hands_out_signed_links_without_the_station_token(self):
+        url = self.issued["prepared_pass_url"]
+        self.assertNotIn(self.station.api_token, json.dumps(self.issued))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["loyalty_card_token"], self.token)
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn(Station._meta.db_table, queries[0]["sql"])
+        max_age = int(response["Cache-Control"].rsplit("=", 1)[1])
+        self.assertTrue(0 < max_age <= settings.PASS_LINK_TTL_SECONDS)
+
+        apple = self.client.get(self.issued["wallet"]["apple"]["download_url"])
+        self.assertEqual(apple["Content-Type"], "application/vnd.apple.pkpass")
+
+    def test_qr_images_are_public_and_immutable_for_link_holders(self):
+        png_url = self.issued["loyalty_card"]["qr_images"]["png"]["small"]
+        self.assertNotIn(self.station.api_token, png_url)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(png_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertEqual(response["Cache-Control"], "public, max-age=31536000, immutable")
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(response.content, qr_image(self.token, "png", "small"))
+
+        svg_url = self.client.get(self.issued["prepared_pass_url"]).data["qr_images"]["svg"]["large"]
+        self.assertTrue(self.client.get(svg_url).content.startswith(b"<svg"))
+        forged = png_url.replace(self.token, str(uuid.uuid4()))
+        self.assertEqual(self.client.get(forged).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_tampered_and_expired_links_are_refused_before_any_query(self):
+        forged = self.issued["prepared_pass_url"].replace(self.token, str(uuid.uuid4()))
+        expired = signed_pass_path(self.station.pk, self.token, expires=int(time.time()) - 1)
+
+        for url, detail in ((forged, "Invalid pass link."), (expired, "Pass link expired.")):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+            self.assertEqual(response.data["detail"], detail)
+            self.assertEqual(len(queries), 0)
+
+
+class PreparedPassQueueTests(QueryPlanAssertionsMixin, AuthenticatedBusinessAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.station = self.create_station()
+        self.client.credentials(HTTP_X_STATION_TOKEN=self.station.api_token)
+        self.public_url = reverse("station-public-pass", args=[self.station.public_slug])
+
+    def issue(self, name, phone):
+        response = self.client.post(
+            reverse("loyaltycard-issue"), {"customer_name": name, "phone_number": phone}, format="json"
+        )
+        return response.data["loyalty_card"]["token"]
+
+    def visit(self, query=""):
+        return self.client.get(f"{self.public_url}{query}")
+
+    def test_visitors_claim_staged_passes_in_order(self):
+        first = self.issue("First", "555-000-0001")
+        second = self.issue("Second", "555-000-0002")
+
+        peek = self.client.get(
+            reverse("station-prepared-pass", args=[self.station.pk]),
+            {"token": self.station.api_token, "clear": "false"},
+        )
+        self.assertEqual(peek.data["loyalty_card_token"], first)
+        self.assertEqual(self.visit("?clear=false").status_code, status.HTTP_400_BAD_REQUEST)
+        claimed = self.visit()
+        self.assertEqual(claimed.data["loyalty_card_token"], first)
+        self.assertEqual(self.visit().data["loyalty_card_token"], second)
+        self.assertEqual(self.visit().status_code, status.HTTP_404_NOT_FOUND)
+
+        again = self.visit(f"?platform=apple&claim={claimed.data['claim']}")
+        self.assertEqual(again.status_code, status.HTTP_200_OK)
+        self.assertEqual(again["Content-Type"], "application/vnd.apple.pkpass")
+        self.assertEqual(self.visit("?claim=unknown").status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIsNone(Station.objects.get(pk=self.station.pk).prepared_loyalty_card)
+
+    @override_settings(PREPARED_PASS_QUEUE_LENGTH=2)
+    def test_queue_is_bounded_and_restaging_moves_a_card_back(self):
+        first = self.issue("First", "555-000-0001")
+        second = self.issue("Second", "555-000-0002")
+        self.issue("First", "555-000-0001")
+        third = self.issue("Third", "555-000-0003")
+
+        self.assertEqual(PreparedPass.objects.count(), 2)
+        self.assertEqual(self.visit().data["loyalty_card_token"], first)
+        self.assertEqual(self.visit().data["loyalty_card_token"], third)
+        self.assertEqual(self.visit().status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(PreparedPass.objects.filter(loyalty_card=second).exists())
+
+    def test_expired_entries_are_skipped_and_purged(self):
+        self.issue("Late", "555-000-0004")
+        PreparedPass.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(self.visit().status_code, status.HTTP_404_NOT_FOUND)
+        self.assertQueryUsesIndex(PreparedPass.objects.filter(expires_at__lte=timezone.now()), "prepared_expires_idx")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(purge_expired_prepared_passes("default"), 1)
+        self.assertEqual(len(queries), 1)
+
+    def test_claims_read_the_station_queue_index(self):
+        self.assertQueryUsesIndex(
+            PreparedPass.objects.filter(
+                station=self.station, claimed_at__isnull=True, expires_at__gt=timezone.now()
+            ).order_by("id"),
+            "prepared_station_queue_idx",
+        )
+
+
 class TransactionFlowTests(AuthenticatedBusinessAPITestCase):
     def setUp(self):
         super().setUp()
@@ -303,6 +868,21 @@ class TransactionFlowTests(AuthenticatedBusinessAPITestCase):
         self.card.refresh_from_db()
         self.assertEqual(self.card.points_balance, 18)
 
+    def test_transaction_records_station_business(self):
+        payload = {"loyalty_card_id": str(self.card.pk), "amount": "3.00"}
+        response = self.client.post(self.url, payload, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        txn = Transaction.objects.get(pk=response.data["id"])
+        self.assertEqual(txn.business_id, self.business.pk)
+
+    def test_guest_transaction_records_station_business(self):
+        response = self.client.post(self.url, {"amount": "4.00"}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        txn = Transaction.objects.get(pk=response.data["id"])
+        self.assertEqual(txn.business_id, self.business.pk)
+
     def test_transaction_redeems_when_requested_and_sufficient_points(self):
         self.card.points_balance = 110
         self.card.save()
@@ -351,8 +931,7 @@ class PassKitEndpointsTests(AuthenticatedBusinessAPITestCase):
         ensure_card_auth_token(self.card)
 
     def test_station_prepared_pass_returns_pkpass(self):
-        self.station.prepared_loyalty_card = self.card
-        self.station.save(update_fields=["prepared_loyalty_card"])
+        enqueue_prepared_pass(self.station, self.card, using="default")
 
         url = reverse("station-prepared-pass", args=[self.station.pk])
         response = self.client.get(f"{url}?token={self.station.api_token}&platform=apple&clear=false")
@@ -391,6 +970,69 @@ class PassKitEndpointsTests(AuthenticatedBusinessAPITestCase):
         self.assertEqual(list_response.status_code, status.HTTP_200_OK)
         self.assertIn(str(self.card.token), list_response.data["serialNumbers"])
 
+    def test_listing_returns_only_passes_changed_since_the_tag(self):
+        pass_type = settings.APPLE_PASS_TYPE_IDENTIFIER
+        device_id = "TAGDEVICE"
+        other = LoyaltyCard.objects.create(
+            business_customer=BusinessCustomer.objects.create(
+                business=self.business, customer=self.create_customer("Lior")
+            )
+        )
+        for card in (self.card, other):
+            PassRegistration.objects.create(
+                loyalty_card=card,
+                device_library_identifier=device_id,
+                pass_type_identifier=pass_type,
+                push_token="push-token",
+            )
+        list_url = reverse("passkit-device-registration-list", args=[device_id, pass_type])
+
+        first = self.client.get(list_url)
+        self.assertCountEqual(first.data["serialNumbers"], [str(self.card.token), str(other.token)])
+        tag = first.data["lastUpdated"]
+        self.assertEqual(int(tag), max(self.card.pass_version, other.pass_version))
+
+        unchanged = self.client.get(list_url, {"passesUpdatedSince": tag})
+        self.assertEqual(unchanged.data["serialNumbers"], [])
+        self.assertEqual(unchanged.data["lastUpdated"], tag)
+
+        response = self.client.post(
+            reverse("transaction-list"),
+            {"loyalty_card_id": str(self.card.pk), "amount": "5.00"},
+            format="json",
+            HTTP_X_STATION_TOKEN=self.station.api_token,
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.card.refresh_from_db()
+        self.assertGreater(self.card.pass_version, int(tag))
+
+        with CaptureQueriesContext(connection) as queries:
+            changed = self.client.get(list_url, {"passesUpdatedSince": tag})
+        self.assertEqual(changed.data["serialNumbers"], [str(self.card.token)])
+        self.assertEqual(changed.data["lastUpdated"], str(self.card.pass_version))
+        self.assertEqual(
+            sum('"api_passregistration"' in query["sql"] for query in queries.captured_queries), 1
+        )
+
+    def test_listing_accepts_timestamp_tags(self):
+        pass_type = settings.APPLE_PASS_TYPE_IDENTIFIER
+        PassRegistration.objects.create(
+            loyalty_card=self.card,
+            device_library_identifier="OLDDEVICE",
+            pass_type_identifier=pass_type,
+            push_token="push-token",
+        )
+        list_url = reverse("passkit-device-registration-list", args=["OLDDEVICE", pass_type])
+        created = datetime.fromtimestamp(self.card.pass_version / 1000, tz=dt_timezone.utc)
+
+        for since, expected in (
+            ((created - timedelta(minutes=1)).isoformat(), [str(self.card.token)]),
+            ((created + timedelta(minutes=1)).isoformat(), []),
+            ((created - timedelta(minutes=1)).replace(tzinfo=None).isoformat(), [str(self.card.token)]),
+        ):
+            response = self.client.get(list_url, {"passesUpdatedSince": since})
+            self.assertEqual(response.data["serialNumbers"], expected, since)
+
     def test_pass_download_requires_authorization(self):
         pass_type = settings.APPLE_PASS_TYPE_IDENTIFIER
         download_url = reverse(
@@ -494,6 +1136,7 @@ class DashboardDetailTests(AuthenticatedBusinessAPITestCase):
         self.assertIn("top_customers", response.data)
 
 
+@test_settings
 class PassNotificationTests(APITestCase):
     def setUp(self):
         super().setUp()
@@ -520,3 +1163,1254 @@ class PassNotificationTests(APITestCase):
 
         self.registration.refresh_from_db()
         self.assertGreater(self.registration.updated_at, original_updated)
+
+
+@test_settings
+class DeviceLogTests(APITestCase):
+    WEB_SERVICE_ERROR = (
+        "[2026-10-18 09:15:02 +0000] Web service error for pass.com.example.placeholder "
+        "(https://localhost/passkit): Response to 'What changed?' request included {} serial numbers "
+        "but the lastUpdated tag ({}) remained the same."
+    )
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(device_log_buffer._lines.clear)
+
+    def test_fingerprint_masks_variable_parts(self):
+        first = fingerprint(self.WEB_SERVICE_ERROR.format(2, "1760000000000"))
+        second = fingerprint(self.WEB_SERVICE_ERROR.format(7, "1760000009999"))
+
+        self.assertEqual(first, second)
+        self.assertTrue(first.startswith("Web service error for pass.com.example.placeholder (<url>)"))
+        self.assertEqual(
+            fingerprint(f"Could not find pass {uuid.uuid4()} (token {'ab12' * 8})"),
+            "Could not find pass <uuid> (token <hex>)",
+        )
+
+    def test_log_endpoint_buffers_without_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse("passkit-log"),
+                {"logs": [self.WEB_SERVICE_ERROR.format(1, "1"), 42, "  ", "x" * 5000]},
+                format="json",
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(len(queries.captured_queries), 0)
+        self.assertEqual(len(device_log_buffer), 2)
+        self.assertIsNone(device_log_buffer._thread)
+
+        self.assertEqual(device_log_buffer.flush(), 2)
+        self.assertEqual(len(device_log_buffer), 0)
+        self.assertEqual(DeviceLog.objects.count(), 2)
+        self.assertEqual(DeviceLog.objects.filter(message="x" * 1000).count(), 1)
+
+    def test_full_buffer_drops_oldest_lines_and_flushes_in_batches(self):
+        buffer = DeviceLogBuffer(capacity=5, batch_size=2, flush_seconds=0)
+        buffer.append([f"line {index}" for index in range(8)])
+
+        self.assertEqual(len(buffer), 5)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(buffer.flush(), 5)
+        self.assertEqual(len(queries.captured_queries), 3)
+        self.assertCountEqual(
+            DeviceLog.objects.values_list("message", flat=True), [f"line {index}" for index in range(3, 8)]
+        )
+
+    def test_report_lists_most_common_errors(self):
+        buffer = DeviceLogBuffer(flush_seconds=0)
+        buffer.append([self.WEB_SERVICE_ERROR.format(count, count * 1000) for count in range(3)])
+        buffer.append(["Pass download failed: 401"])
+        buffer.flush()
+        DeviceLog.objects.create(
+            received_at=timezone.now() - timedelta(days=30), fingerprint="Stale", message="Stale"
+        )
+
+        out = StringIO()
+        call_command("device_log_report", purge=True, stdout=out)
+        report = out.getvalue().splitlines()
+
+        self.assertEqual(report[0], "1 old device logs deleted")
+        self.assertIn("Web service error", report[2])
+        self.assertTrue(report[2].split()[0] == "3")
+        self.assertIn("Pass download failed: <n>", report[4])
+        self.assertFalse(DeviceLog.objects.filter(fingerprint="Stale").exists())
+
+
+class QueryPlanTests(QueryPlanAssertionsMixin, AuthenticatedBusinessAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.station = self.create_station()
+        customer = self.create_customer("Plan Customer")
+        bc = BusinessCustomer.objects.create(business=self.business, customer=customer)
+        self.card = LoyaltyCard.objects.create(business_customer=bc, points_balance=10)
+        Transaction.objects.create(
+            loyalty_card=self.card,
+            station=self.station,
+            amount=Decimal("9.99"),
+            points_earned=9,
+        )
+        PassRegistration.objects.create(
+            loyalty_card=self.card,
+            device_library_identifier="plan-device",
+            pass_type_identifier=settings.APPLE_PASS_TYPE_IDENTIFIER,
+            push_token="plan-push-token",
+        )
+        self.since = timezone.now() - timedelta(days=7)
+
+    def test_dashboard_metrics_avoid_full_scans(self):
+        self.assertViewAvoidsFullScans(reverse("dashboard-metrics"))
+
+    def test_dashboard_detail_avoids_full_scans(self):
+        self.assertViewAvoidsFullScans(reverse("dashboard-data"))
+
+    def test_transaction_list_avoids_full_scans(self):
+        self.assertViewAvoidsFullScans(reverse("transaction-list"))
+
+    def test_business_time_range_filters_use_composite_indexes(self):
+        self.assertQueryUsesIndex(
+            Transaction.objects.filter(station__business=self.business, created_at__gte=self.since),
+            "txn_station_created_idx",
+        )
+        self.assertQueryUsesIndex(
+            Transaction.objects.filter(
+                loyalty_card__business_customer__business=self.business,
+                created_at__gte=self.since,
+            ),
+            "txn_card_created_idx",
+        )
+        self.assertQueryUsesIndex(
+            LoyaltyCard.objects.filter(business_customer__business=self.business, created_at__lt=self.since),
+            "card_bc_created_idx",
+        )
+
+    def test_denormalized_business_filter_uses_index(self):
+        txn = Transaction.objects.get()
+        self.assertEqual(txn.business_id, self.business.pk)
+        self.assertQueryUsesIndex(
+            Transaction.objects.filter(business=self.business, created_at__gte=self.since),
+            "txn_business_created_idx",
+        )
+
+    def test_pass_registration_lookups_use_indexes(self):
+        self.assertQueryUsesIndex(
+            PassRegistration.objects.filter(
+                device_library_identifier="plan-device",
+                pass_type_identifier=settings.APPLE_PASS_TYPE_IDENTIFIER,
+            ),
+            "passreg_device_type_idx",
+        )
+        self.assertQueryUsesIndex(
+            PassRegistration.objects.filter(updated_at__gte=self.since),
+            "passreg_updated_idx",
+        )
+
+
+class ExportTests(AuthenticatedBusinessAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.station = self.create_station()
+        self.other_station = self.create_station("Drive Thru")
+        customer = self.create_customer("Export Customer")
+        bc = BusinessCustomer.objects.create(business=self.business, customer=customer)
+        self.card = LoyaltyCard.objects.create(business_customer=bc, points_balance=30)
+
+    def _export(self, dataset, **params):
+        response = self.client.get(reverse("export", args=[dataset]), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return b"".join(response.streaming_content).decode("utf-8")
+
+    def test_transaction_csv_filters_by_station_and_date(self):
+        kept = Transaction.objects.create(station=self.station, loyalty_card=self.card, amount=Decimal("5.00"))
+        Transaction.objects.create(station=self.other_station, amount=Decimal("6.00"))
+        old = Transaction.objects.create(station=self.station, amount=Decimal("7.00"))
+        Transaction.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=30))
+
+        body = self._export(
+            "transactions",
+            station=str(self.station.pk),
+            start=(timezone.now() - timedelta(days=1)).date().isoformat(),
+        )
+
+        lines = body.strip().splitlines()
+        self.assertEqual(lines[0].split(",")[0], "id")
+        self.assertEqual(len(lines), 2)
+        self.assertIn(str(kept.pk), lines[1])
+        self.assertIn("Export Customer", lines[1])
+
+    def test_loyalty_card_ndjson_export(self):
+        body = self._export("loyaltycards", file_format="ndjson")
+
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["token"], str(self.card.token))
+        self.assertEqual(rows[0]["points_balance"], 30)
+
+    def test_customer_export_is_scoped_to_business(self):
+        other_bc = BusinessCustomer.objects.create(
+            business=create_business("Other Biz"),
+            customer=self.create_customer("Someone Else"),
+        )
+
+        body = self._export("customers")
+
+        self.assertIn("Export Customer", body)
+        self.assertNotIn(str(other_bc.pk), body)
+
+    def test_rejects_unknown_dataset_and_format(self):
+        self.assertEqual(self.client.get(reverse("export", args=["nope"])).status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse("export", args=["transactions"]), {"file_format": "xml"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(reverse("export", args=["transactions"]), {"start": "last week"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_large_export_streams_with_bounded_memory(self):
+        rows = 30000
+        Transaction.objects.bulk_create(
+            Transaction(
+                business=self.business,
+                station=self.station,
+                loyalty_card=self.card,
+                amount=Decimal("12.50"),
+                final_amount=Decimal("12.50"),
+                points_earned=12,
+            )
+            for _ in range(rows)
+        )
+
+        response = self.client.get(reverse("export", args=["transactions"]))
+        tracemalloc.start()
+        try:
+            exported_bytes = 0
+            exported_lines = 0
+            for chunk in response.streaming_content:
+                exported_bytes += len(chunk)
+                exported_lines += chunk.count(b"\n")
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(exported_lines, rows + 1)
+        # The ceiling sits below the export size, so buffering the whole body fails.
+        self.assertGreater(exported_bytes, 6_000_000)
+        self.assertLess(peak, 5_000_000)
+
+
+class CustomerImportTests(AuthenticatedBusinessAPITestCase):
+    def card_for(self, phone):
+        return LoyaltyCard.objects.get(
+            business_customer__business=self.business, business_customer__customer__phone_number=phone
+        )
+
+    def test_csv_import_matches_existing_customers_and_seeds_balances(self):
+        other = create_business(name="Other Import Biz")
+        shared = Customer.objects.create(name="Ana Existing", phone_number="+15550000001")
+        BusinessCustomer.objects.create(business=other, customer=shared)
+        carded = Customer.objects.create(name="Ben", phone_number="+15550000002")
+        existing_card = LoyaltyCard.objects.create(
+            business_customer=BusinessCustomer.objects.create(business=self.business, customer=carded),
+            points_balance=7,
+        )
+        body = "\n".join(
+            [
+                "name,phone_number,points_balance",
+                "Ana,(555) 000-0001,50",
+                "Ben,555-000-0002,10",
+                "Chloe,+1 555 000 0003,25",
+                "Chloe Again,5550000003,1",
+                "No Phone,,5",
+                "Negative,5550000004,-1",
+            ]
+        )
+
+        response = self.client.post(
+            reverse("customer-import") + "?opening_balances=true", data=body, content_type="text/csv"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        summary = response.json()
+        self.assertEqual(
+            {key: summary[key] for key in ("rows", "customers_created", "customers_matched", "cards_created", "cards_existing")},
+            {"rows": 6, "customers_created": 1, "customers_matched": 2, "cards_created": 2, "cards_existing": 1},
+        )
+        self.assertEqual([error["line"] for error in summary["errors"]], [5, 6, 7])
+        self.assertEqual(self.card_for("+15550000001").points_balance, 50)
+        self.assertEqual(self.card_for("+15550000003").points_balance, 25)
+        self.assertTrue(self.card_for("+15550000003").apple_auth_token)
+        existing_card.refresh_from_db()
+        self.assertEqual(existing_card.points_balance, 7)
+        self.assertEqual(Customer.objects.get(phone_number="+15550000001").name, "Ana Existing")
+
+    def test_ndjson_upload_runs_a_fixed_number_of_queries_per_chunk(self):
+        rows = "".join(
+            json.dumps({"name": f"Guest {index}", "phone": f"555{index:07d}"}) + "\n" for index in range(300)
+        )
+
+        def upload():
+            return self.client.post(
+                reverse("customer-import") + "?file_format=ndjson",
+                {"file": SimpleUploadedFile("guests.ndjson", rows.encode())},
+                format="multipart",
+            )
+
+        with CaptureQueriesContext(connection) as queries:
+            response = upload()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["cards_created"], 300)
+        self.assertLess(len(queries), 30)
+
+        again = upload().json()
+        self.assertEqual((again["cards_created"], again["cards_existing"]), (0, 300))
+        self.assertEqual(LoyaltyCard.objects.filter(business_customer__business=self.business).count(), 300)
+
+    def test_command_reports_progress_per_chunk(self):
+        directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = directory / "customers.csv"
+        path.write_text("name,phone_number\n" + "".join(f"Guest {index},555{index:07d}\n" for index in range(25)))
+        out = StringIO()
+
+        call_command("import_customers", str(self.business.pk), str(path), chunk_size=10, stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(json.loads(lines[-1])["cards_created"], 25)
+        with self.assertRaises(CommandError):
+            call_command("import_customers", str(uuid.uuid4()), str(path), stdout=StringIO())
+
+
+class TimeOrderedIdTests(AuthenticatedBusinessAPITestCase):
+    def test_uuid7_layout_and_ordering(self):
+        before_ms = int(time.time() * 1000)
+        ids = [uuid7() for _ in range(5000)]
+        after_ms = int(time.time() * 1000)
+
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual([value.hex for value in ids], sorted(value.hex for value in ids))
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertTrue(all(value.version == 7 for value in ids))
+        self.assertTrue(all(value.variant == uuid.RFC_4122 for value in ids))
+        self.assertLessEqual(before_ms, uuid7_timestamp_ms(ids[0]))
+        self.assertLessEqual(uuid7_timestamp_ms(ids[-1]), after_ms + 1)
+
+    def test_new_transactions_sort_by_id_in_creation_order(self):
+        station = self.create_station()
+        created = [
+            Transaction.objects.create(station=station, amount=Decimal("1.00")).pk
+            for _ in range(20)
+        ]
+
+        self.assertEqual(list(Transaction.objects.order_by("id").values_list("id", flat=True)), created)
+
+    def test_card_tokens_stay_random(self):
+        station = self.create_station()
+        self.client.credentials(HTTP_X_STATION_TOKEN=station.api_token)
+        issued = self.client.post(
+            reverse("loyaltycard-issue"), {"customer_name": "Ari", "phone_number": "555-222-1111"}, format="json"
+        )
+        bc = BusinessCustomer.objects.create(business=self.business, customer=self.create_customer("Bo"))
+        created = LoyaltyCard.objects.create(business_customer=bc)
+
+        self.assertEqual(uuid.UUID(issued.data["loyalty_card"]["token"]).version, 4)
+        self.assertEqual(created.token.version, 4)
+
+
+class TransactionArchiveTests(AuthenticatedBusinessAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.station = self.create_station()
+        self.other_station = self.create_station("Patio")
+
+        self.rows = [
+            (datetime(2024, 1, 5, 12, 0, tzinfo=dt_timezone.utc), self.station, "10.25", 10, 0),
+            (datetime(2024, 1, 20, 9, 30, tzinfo=dt_timezone.utc), self.other_station, "4.75", 4, 100),
+            (datetime(2024, 2, 1, 0, 0, tzinfo=dt_timezone.utc), self.station, "20.00", 20, 0),
+        ]
+        for created_at, station, amount, earned, redeemed in self.rows:
+            txn = Transaction.objects.create(
+                station=station,
+                amount=Decimal(amount),
+                final_amount=Decimal(amount),
+                points_earned=earned,
+                points_redeemed=redeemed,
+            )
+            Transaction.objects.filter(pk=txn.pk).update(created_at=created_at)
+
+    def test_command_archives_closed_months(self):
+        call_command("archive_transactions", root=self.root, stdout=StringIO())
+
+        periods = archived_periods(self.business.pk, root=self.root)
+        self.assertEqual([period.meta["period"] for period in periods], ["2024-01", "2024-02"])
+        self.assertEqual(periods[0].meta["rows"], 2)
+        self.assertIsInstance(periods[0].column("amount_cents"), np.memmap)
+
+    def test_summarize_reads_archive_without_touching_transactions(self):
+        call_command("archive_transactions", root=self.root, stdout=StringIO())
+
+        with self.assertNumQueries(0):
+            totals = summarize(self.business.pk, root=self.root)
+            january = summarize(
+                self.business.pk,
+                start=datetime(2024, 1, 10, tzinfo=dt_timezone.utc),
+                end=datetime(2024, 2, 1, tzinfo=dt_timezone.utc),
+                root=self.root,
+            )
+            per_day = daily_revenue(self.business.pk, root=self.root)
+
+        self.assertEqual(totals["transactions"], 3)
+        self.assertEqual(totals["revenue_cents"], 3500)
+        self.assertEqual(totals["points_earned"], 34)
+        self.assertEqual(totals["points_redeemed"], 100)
+        self.assertEqual(totals["revenue_by_station_cents"][str(self.station.pk)], 3025)
+        self.assertEqual(january["transactions"], 1)
+        self.assertEqual(january["revenue_cents"], 475)
+        self.assertEqual(per_day[date(2024, 1, 5)], 1025)
+        self.assertEqual(per_day[date(2024, 2, 1)], 2000)
+
+    def test_existing_periods_are_skipped_unless_overwritten(self):
+        call_command("archive_transactions", root=self.root, stdout=StringIO())
+        Transaction.objects.create(station=self.station, amount=Decimal("1.00"))
+        late = Transaction.objects.latest("created_at")
+        Transaction.objects.filter(pk=late.pk).update(created_at=datetime(2024, 1, 31, tzinfo=dt_timezone.utc))
+
+        call_command("archive_transactions", root=self.root, stdout=StringIO())
+        self.assertEqual(summarize(self.business.pk, root=self.root)["transactions"], 3)
+
+        call_command("archive_transactions", root=self.root, overwrite=True, stdout=StringIO())
+        self.assertEqual(summarize(self.business.pk, root=self.root)["transactions"], 4)
+
+
+@test_settings
+class SQLiteLoadTestCommandTests(APITestCase):
+    def test_reports_both_profiles(self):
+        out = StringIO()
+        call_command(
+            "sqlite_load_test",
+            writers=2,
+            readers=2,
+            duration=0.2,
+            cards=50,
+            seed_rows=200,
+            stdout=out,
+        )
+
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[1].startswith("default"))
+        self.assertTrue(lines[2].startswith("production"))
+
+
+class ExtraDatabasesMixin:
+    """
+    Register file-backed SQLite aliases for one TransactionTestCase class.
+    They are added after the runner has created the configured test
+    databases, so they are either migrated here or filled by the test.
+    """
+
+    extra_databases = ()
+    migrate_extra_databases = False
+
+    @classmethod
+    def setUpClass(cls):
+        cls.extra_database_dir = tempfile.mkdtemp()
+        for alias in cls.extra_databases:
+            connections.settings[alias] = {
+                **connections.settings["default"],
+                "NAME": str(Path(cls.extra_database_dir) / f"{alias}.sqlite3"),
+            }
+        cls.databases = {"default", *cls.extra_databases}
+        super().setUpClass()
+        if cls.migrate_extra_databases:
+            for alias in cls.extra_databases:
+                call_command("migrate", database=alias, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in cls.extra_databases:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        shutil.rmtree(cls.extra_database_dir, ignore_errors=True)
+
+
+@override_settings(
+    DATABASE_ROUTERS=["server.replica.ReplicaRouter"],
+    MIDDLEWARE=settings.MIDDLEWARE + ["server.replica.ReplicaRoutingMiddleware"],
+    DATABASE_REPLICA_ALIAS="replica",
+)
+class ReadReplicaRoutingTests(ExtraDatabasesMixin, TransactionTestCase):
+    # The replica is filled by copying the primary, as sync_replica does.
+    extra_databases = ("replica",)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.business = create_business("Replica Biz")
+        user = BusinessUser.objects.create_user(username="replica-owner", password="pass1234", business=self.business)
+        self.client.force_authenticate(user=user)
+        self.station = Station.objects.create(business=self.business, name="Replica Counter")
+        bc = BusinessCustomer.objects.create(
+            business=self.business,
+            customer=Customer.objects.create(name="First", phone_number=unique_phone()),
+        )
+        self.card = LoyaltyCard.objects.create(business_customer=bc)
+        copy_sqlite_database("default", "replica")
+
+    def _add_card_on_primary(self):
+        bc = BusinessCustomer.objects.create(
+            business=self.business,
+            customer=Customer.objects.create(name="Later", phone_number=unique_phone()),
+        )
+        return LoyaltyCard.objects.create(business_customer=bc)
+
+    def _card_count(self):
+        response = self.client.get(reverse("loyaltycard-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data["count"]
+
+    def test_safe_reads_use_replica_until_it_is_synced(self):
+        self._add_card_on_primary()
+
+        self.assertEqual(self._card_count(), 1)
+        copy_sqlite_database("default", "replica")
+        self.assertEqual(self._card_count(), 2)
+
+    def test_reads_stick_to_primary_after_a_write(self):
+        self._add_card_on_primary()
+
+        response = self.client.post(
+            reverse("transaction-list"),
+            {"loyalty_card_id": str(self.card.pk), "amount": "2.00"},
+            format="json",
+            HTTP_X_STATION_TOKEN=self.station.api_token,
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn(ReplicaRoutingMiddleware.cookie_name, response.cookies)
+        self.assertEqual(self._card_count(), 2)
+
+        del self.client.cookies[ReplicaRoutingMiddleware.cookie_name]
+        self.assertEqual(self._card_count(), 1)
+
+    def test_public_pass_claims_are_written_to_the_primary(self):
+        enqueue_prepared_pass(self.station, self.card, "default")
+        copy_sqlite_database("default", "replica")
+        public_url = reverse("station-public-pass", args=[self.station.public_slug])
+
+        claimed = self.client.get(public_url)
+        self.assertEqual(claimed.status_code, status.HTTP_200_OK)
+        self.assertEqual(claimed.data["loyalty_card_token"], str(self.card.pk))
+        self.assertTrue(PreparedPass.objects.using("default").filter(claim_token=claimed.data["claim"]).exists())
+        self.assertFalse(PreparedPass.objects.using("replica").exclude(claimed_at=None).exists())
+
+        # The replica still lists the entry as unclaimed; nobody else gets it.
+        self.client.cookies.clear()
+        self.assertEqual(self.client.get(public_url).status_code, status.HTTP_404_NOT_FOUND)
+        self.client.cookies.clear()
+        again = self.client.get(public_url, {"claim": claimed.data["claim"]})
+        self.assertEqual(again.data["loyalty_card_token"], str(self.card.pk))
+
+    def test_router_uses_primary_outside_requests(self):
+        self.assertIsNone(ReplicaRouter().db_for_read(LoyaltyCard))
+        self.assertEqual(ReplicaRouter().db_for_write(LoyaltyCard), "default")
+
+
+@override_settings(
+    DATABASE_ROUTERS=["api.sharding.TenantShardRouter"],
+    MIDDLEWARE=settings.MIDDLEWARE + ["api.sharding.TenantShardMiddleware"],
+    TENANT_SHARDS=["default", "shard_b"],
+    TENANT_DEFAULT_SHARD="default",
+)
+class TenantShardingTests(ExtraDatabasesMixin, TransactionTestCase):
+    extra_databases = ("shard_b",)
+    migrate_extra_databases = True
+
+    def setUp(self):
+        super().setUp()
+        shard_map.forget()
+        self.addCleanup(shard_map.forget)
+        self.client = APIClient()
+
+        self.business = create_business("Shard Biz")
+        self.user = BusinessUser.objects.create_user(username="shard-owner", password="pass1234", business=self.business)
+        self.station = Station.objects.create(business=self.business, name="Shard Counter")
+        self.phone = unique_phone()
+        bc = BusinessCustomer.objects.create(
+            business=self.business,
+            customer=Customer.objects.create(name="Sharded", phone_number=self.phone),
+        )
+        self.card = LoyaltyCard.objects.create(business_customer=bc, points_balance=10)
+        ensure_card_auth_token(self.card)
+        Transaction.objects.create(station=self.station, loyalty_card=self.card, amount=Decimal("3.00"))
+        enqueue_prepared_pass(self.station, self.card, using="default")
+        PassRegistration.objects.create(
+            loyalty_card=self.card,
+            device_library_identifier="shard-device",
+            pass_type_identifier=settings.APPLE_PASS_TYPE_IDENTIFIER,
+            push_token="shard-push",
+        )
+
+    def _move(self):
+        call_command("move_business_shard", str(self.business.pk), "shard_b", wait=0, stdout=StringIO())
+
+    def test_move_copies_rows_and_flips_directory(self):
+        self._move()
+
+        self.assertEqual(TenantShard.objects.get(business_id=self.business.pk).alias, "shard_b")
+        for model in (Business, Customer, BusinessCustomer, LoyaltyCard, Station, Transaction, PassRegistration, PreparedPass):
+            self.assertEqual(model.objects.using("default").count(), 0, model.__name__)
+            self.assertEqual(model.objects.using("shard_b").count(), 1, model.__name__)
+
+        user = BusinessUser.objects.get(pk=self.user.pk)
+        self.assertEqual(user.business.name, "Shard Biz")
+        card = LoyaltyCard.objects.using("shard_b").get()
+        self.assertEqual(card.points_balance, 10)
+        self.assertEqual(card.apple_auth_token, self.card.apple_auth_token)
+
+    def test_requests_follow_the_business_after_a_move(self):
+        self._move()
+        self.client.force_authenticate(user=BusinessUser.objects.get(pk=self.user.pk))
+
+        response = self.client.get(reverse("transaction-list"))
+        self.assertEqual(response.data["count"], 1)
+
+        response = self.client.post(
+            reverse("transaction-list"),
+            {"loyalty_card_id": str(self.card.pk), "amount": "5.00"},
+            format="json",
+            HTTP_X_STATION_TOKEN=self.station.api_token,
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Transaction.objects.using("shard_b").count(), 2)
+        self.assertEqual(Transaction.objects.using("default").count(), 0)
+
+    def test_wallet_endpoints_locate_cards_on_any_shard(self):
+        self._move()
+        self.client.force_authenticate(user=None)
+        pass_type = settings.APPLE_PASS_TYPE_IDENTIFIER
+
+        response = self.client.get(
+            reverse("passkit-pass-download", args=[pass_type, self.card.token]),
+            HTTP_AUTHORIZATION=f"ApplePass {self.card.apple_auth_token}",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(reverse("passkit-device-registration-list", args=["shard-device", pass_type]))
+        self.assertEqual(response.data["serialNumbers"], [str(self.card.token)])
+
+        response = self.client.get(reverse("station-public-pass", args=[self.station.public_slug]))
+        self.assertEqual(response.data["loyalty_card_token"], str(self.card.token))
+        self.assertTrue(PreparedPass.objects.using("shard_b").get().claimed_at)
+
+    def test_move_reuses_customer_with_same_phone_on_target(self):
+        existing = Customer(name="Already There", phone_number=self.phone)
+        existing.save(using="shard_b")
+
+        self._move()
+
+        self.assertEqual(Customer.objects.using("shard_b").filter(phone_number=self.phone).count(), 1)
+        self.assertEqual(BusinessCustomer.objects.using("shard_b").get().customer_id, existing.pk)
+
+    def test_new_business_is_created_on_its_assigned_shard(self):
+        business_id = uuid.uuid4()
+        shard_map.assign(business_id, "shard_b")
+
+        # Model.save() hands the router the instance, so the directory decides.
+        business = Business(
+            id=business_id,
+            name="Born On B",
+            reward_rate=Decimal("1.000"),
+            redemption_points=10,
+            redemption_rate=Decimal("0.10"),
+            logo_url="https://example.com/b.png",
+        )
+        business.save()
+        Station(business=business, name="B Counter").save()
+
+        self.assertTrue(Business.objects.using("shard_b").filter(pk=business_id).exists())
+        self.assertEqual(Station.objects.using("shard_b").filter(business_id=business_id).count(), 1)
+        self.assertFalse(Business.objects.using("default").filter(pk=business_id).exists())
+
+
+class ConcurrentIssuanceTests(ExtraDatabasesMixin, TransactionTestCase):
+    # Threads need their own connections to one file, which the in-memory
+    # test database cannot give them.
+    extra_databases = ("issuance",)
+    migrate_extra_databases = True
+
+    def test_concurrent_issues_for_one_phone_share_one_card(self):
+        business = Business.objects.using("issuance").create(
+            name="Concurrent Biz",
+            reward_rate=Decimal("1.000"),
+            redemption_points=10,
+            redemption_rate=Decimal("0.10"),
+            logo_url="https://example.com/logo.png",
+        )
+        stations = [
+            Station.objects.using("issuance").create(business=business, name=f"Register {index}") for index in range(6)
+        ]
+        barrier = threading.Barrier(len(stations))
+        results, errors = [], []
+
+        def issue(station):
+            try:
+                barrier.wait()
+                results.append(issue_loyalty_card(business, station, name="Rush", phone_number="+15550001111"))
+            except Exception as exc:  # surfaced by the assertions below
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=issue, args=(station,)) for station in stations]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len({result.loyalty_card.token for result in results}), 1)
+        self.assertEqual(sum(result.created for result in results), 1)
+        self.assertEqual(Customer.objects.using("issuance").count(), 1)
+        self.assertEqual(BusinessCustomer.objects.using("issuance").count(), 1)
+        self.assertEqual(LoyaltyCard.objects.using("issuance").count(), 1)
+        card = results[0].loyalty_card
+        self.assertEqual(
+            Station.objects.using("issuance").filter(prepared_loyalty_card=card.token).count(), len(stations)
+        )
+
+    def test_concurrent_claims_hand_each_pass_out_once(self):
+        business = Business.objects.using("issuance").create(
+            name="Claim Biz",
+            reward_rate=Decimal("1.000"),
+            redemption_points=10,
+            redemption_rate=Decimal("0.10"),
+            logo_url="https://example.com/logo.png",
+        )
+        station = Station.objects.using("issuance").create(business=business, name="Busy Counter")
+        staged = [
+            issue_loyalty_card(business, station, name=f"Guest {index}", phone_number=f"+1555000200{index}")
+            .loyalty_card.token
+            for index in range(3)
+        ]
+        barrier = threading.Barrier(6)
+        claimed, errors = [], []
+
+        def claim():
+            try:
+                barrier.wait()
+                entry = claim_prepared_pass(station)
+                claimed.append(entry and entry.loyalty_card_id)
+            except Exception as exc:  # surfaced by the assertions below
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=claim) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(token for token in claimed if token), sorted(staged))
+        self.assertEqual(claimed.count(None), 3)
+
+
+@test_settings
+class DeviceLogFlushThreadTests(TransactionTestCase):
+    def test_background_thread_writes_full_batches(self):
+        buffer = DeviceLogBuffer(capacity=100, batch_size=3, flush_seconds=60)
+        buffer.append(["one", "two", "three"])
+
+        deadline = time.monotonic() + 5
+        while DeviceLog.objects.count() < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(DeviceLog.objects.count(), 3)
+        self.assertTrue(buffer._thread.daemon)
+
+
+@override_settings(REQUEST_METRICS_SAMPLE_RATE=1.0, REQUEST_METRICS_SERVER_TIMING=True)
+class RequestMetricsTests(AuthenticatedBusinessAPITestCase):
+    def test_records_sql_and_emits_server_timing(self):
+        with self.assertLogs("server.instrumentation", level="INFO") as logs:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse("transaction-list"))
+
+        self.assertRegex(response["Server-Timing"], r'^db;dur=[\d.]+;desc="\d+ queries", total;dur=[\d.]+$')
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(record["view"], "transaction-list")
+        self.assertEqual(record["status"], 200)
+        self.assertEqual(record["sql_count"], len(queries))
+        self.assertIn(f'desc="{len(queries)} queries"', response["Server-Timing"])
+        self.assertNotIn("pass_build_ms", record)
+
+    def test_pass_build_time_is_reported(self):
+        station = self.create_station()
+        bc = BusinessCustomer.objects.create(business=self.business, customer=self.create_customer("Timed"))
+        enqueue_prepared_pass(station, LoyaltyCard.objects.create(business_customer=bc), using="default")
+
+        url = reverse("station-prepared-pass", args=[station.pk])
+        with self.assertLogs("server.instrumentation", level="INFO") as logs:
+            response = self.client.get(f"{url}?token={station.api_token}&platform=apple&clear=false")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("pass_build;dur=", response["Server-Timing"])
+        self.assertGreater(json.loads(logs.records[-1].getMessage())["pass_build_ms"], 0)
+
+    @override_settings(REQUEST_METRICS_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_measured(self):
+        response = self.client.get(reverse("transaction-list"))
+        self.assertNotIn("Server-Timing", response)
+
+    @override_settings(REQUEST_METRICS_SERVER_TIMING=False)
+    def test_server_timing_can_stay_off_for_measured_requests(self):
+        with self.assertLogs("server.instrumentation", level="INFO"):
+            response = self.client.get(reverse("transaction-list"))
+        self.assertNotIn("Server-Timing", response)
+
+
+class MetricsEndpointTests(AuthenticatedBusinessAPITestCase):
+    def _sample(self, text, line_prefix):
+        for line in text.splitlines():
+            if line.startswith(line_prefix):
+                return float(line.rsplit(" ", 1)[1])
+        return 0.0
+
+    def test_hot_paths_are_exported(self):
+        station = self.create_station()
+        bc = BusinessCustomer.objects.create(business=self.business, customer=self.create_customer("Metric"))
+        card = LoyaltyCard.objects.create(business_customer=bc)
+        before = REGISTRY.render()
+
+        response = self.client.post(
+            reverse("transaction-list"),
+            {"loyalty_card_id": str(card.pk), "amount": "4.00"},
+            format="json",
+            HTTP_X_STATION_TOKEN=station.api_token,
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.client.get(reverse("dashboard-metrics"))
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        text = response.content.decode()
+        self.assertIn("# TYPE http_request_duration_seconds histogram", text)
+        for prefix in (
+            'http_request_duration_seconds_count{route="transaction-list",method="POST",status="201"}',
+            "transaction_create_seconds_count ",
+            'dashboard_seconds_count{view="metrics"}',
+        ):
+            self.assertEqual(self._sample(text, prefix) - self._sample(before, prefix), 1, prefix)
+
+    def test_histogram_buckets_are_cumulative(self):
+        registry = Registry()
+        histogram = registry.histogram("job_seconds", "Job time.", ("kind",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value, kind="a")
+
+        text = registry.render()
+        self.assertIn('job_seconds_bucket{kind="a",le="0.1"} 1', text)
+        self.assertIn('job_seconds_bucket{kind="a",le="1.0"} 2', text)
+        self.assertIn('job_seconds_bucket{kind="a",le="+Inf"} 3', text)
+        self.assertIn('job_seconds_count{kind="a"} 3', text)
+
+    def _exited_pid(self):
+        return next(pid for pid in range(2**22, 2**22 + 1000) if not _process_alive(pid))
+
+    def test_worker_snapshots_are_added_up(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        registry = Registry()
+        counter = registry.counter("jobs_total", "Jobs.", ("kind",))
+        counter.inc(2, kind="a")
+        other_worker = {
+            "jobs_total": {
+                "type": "counter",
+                "help": "Jobs.",
+                "labelnames": ["kind"],
+                "samples": [[["a"], 3], [["b"], 1]],
+            }
+        }
+        Path(directory, f"{os.getpid()}-{uuid.uuid4().hex}.json").write_text(json.dumps(other_worker))
+
+        with override_settings(METRICS_MULTIPROC_DIR=directory):
+            text = registry.render()
+
+        self.assertIn('jobs_total{kind="a"} 5', text)
+        self.assertIn('jobs_total{kind="b"} 1', text)
+
+    def test_processes_sharing_a_pid_keep_separate_snapshots(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        first, second = Registry(), Registry()
+        first.counter("jobs_total", "Jobs.").inc(2)
+        second.counter("jobs_total", "Jobs.").inc(3)
+
+        with override_settings(METRICS_MULTIPROC_DIR=directory):
+            first.flush()
+            text = second.render()
+
+        self.assertEqual(len(list(Path(directory).glob(f"{os.getpid()}-*.json"))), 2)
+        self.assertIn("jobs_total 5", text)
+
+    def test_exited_worker_snapshots_are_folded_in_once(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        exited = {"jobs_total": {"type": "counter", "help": "Jobs.", "labelnames": [], "samples": [[[], 4]]}}
+        for _ in range(2):
+            Path(directory, f"{self._exited_pid()}-{uuid.uuid4().hex}.json").write_text(json.dumps(exited))
+        registry = Registry()
+        registry.counter("jobs_total", "Jobs.").inc(1)
+
+        with override_settings(METRICS_MULTIPROC_DIR=directory):
+            self.assertIn("jobs_total 9", registry.render())
+            self.assertIn("jobs_total 9", registry.render())
+
+        names = sorted(path.name for path in Path(directory).glob("*.json"))
+        self.assertEqual(len(names), 2)
+        self.assertIn(EXITED_SNAPSHOT, names)
+
+    @override_settings(METRICS_TOKEN="scrape-secret")
+    def test_token_is_required_when_configured(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, status.HTTP_403_FORBIDDEN)
+        wrong = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer guess")
+        self.assertEqual(wrong.status_code, status.HTTP_403_FORBIDDEN)
+        response = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer scrape-secret")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_metrics_are_private_without_a_token(self):
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.user.is_staff = False
+        self.user.save()
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, status.HTTP_403_FORBIDDEN)
+
+        with override_settings(METRICS_PUBLIC=True):
+            self.client.logout()
+            self.assertEqual(self.client.get(reverse("metrics")).status_code, status.HTTP_200_OK)
+
+    def test_lock_retries_are_counted(self):
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise OperationalError("database is locked")
+            return "done"
+
+        prefix = 'db_lock_retries_total{operation="test"}'
+        before = self._sample(REGISTRY.render(), prefix)
+        self.assertEqual(retry_on_database_lock(flaky, operation="test", delay=0), "done")
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(self._sample(REGISTRY.render(), prefix) - before, 1)
+
+        with self.assertRaises(OperationalError):
+            retry_on_database_lock(mock.Mock(side_effect=OperationalError("disk I/O error")), operation="test")
+
+
+def iter_url_patterns(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_url_patterns(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern):
+            yield pattern
+
+
+class QueryBudgetTests(AuthenticatedBusinessAPITestCase):
+    def _transactions(self, count):
+        station = self.create_station()
+        for index in range(count):
+            bc = BusinessCustomer.objects.create(business=self.business, customer=self.create_customer(f"Budget {index}"))
+            card = LoyaltyCard.objects.create(business_customer=bc)
+            Transaction.objects.create(station=station, loyalty_card=card, amount=Decimal("1.00"))
+
+    def test_every_route_declares_a_budget(self):
+        for urlconf in ("api.urls", "api.passkit_urls", "accounts.urls"):
+            for pattern in iter_url_patterns(get_resolver(urlconf).url_patterns):
+                view = pattern.callback
+                actions = getattr(view, "actions", None)
+                methods = actions or [m for m in ("get", "post", "put", "patch", "delete") if hasattr(view.cls, m)]
+                for method in methods:
+                    with self.subTest(route=pattern.name, method=method):
+                        self.assertIsNotNone(view_budget(view, method))
+
+    def test_n_plus_one_blows_the_budget_with_a_report(self):
+        self._transactions(6)
+
+        def unjoined(viewset):
+            return Transaction.objects.filter(business=viewset.request.user.business)
+
+        with mock.patch.object(TransactionViewSet, "get_queryset", unjoined):
+            with self.assertRaises(QueryBudgetExceeded) as raised:
+                self.client.get(reverse("transaction-list"))
+
+        report = str(raised.exception)
+        self.assertIn("transaction-list ran", report)
+        self.assertIn("its budget is 5", report)
+        self.assertRegex(report, r'6x SELECT .* FROM "api_station"')
+
+    def test_list_queries_do_not_grow_with_rows(self):
+        self._transactions(30)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("transaction-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLessEqual(len(queries), TransactionViewSet.query_budget["list"])
+
+    @override_settings(QUERY_BUDGET_MODE="warn", QUERY_BUDGET_SAMPLE_RATE=1.0)
+    def test_warn_mode_logs_and_serves_the_response(self):
+        with mock.patch.object(TransactionViewSet, "query_budget", {"list": 0}):
+            with self.assertLogs("server.query_budget", level="WARNING") as logs:
+                response = self.client.get(reverse("transaction-list"))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("its budget is 0", logs.output[0])
+
+    def test_sql_shape_collapses_in_lists(self):
+        self.assertEqual(
+            sql_shape('SELECT *\n  FROM "t" WHERE "id" IN (%s, %s, %s)'),
+            'SELECT * FROM "t" WHERE "id" IN (...)',
+        )
+
+
+@test_settings
+class BenchmarkSuiteTests(APITestCase):
+    def test_selected_benchmarks_report_timings(self):
+        results = run_benchmarks(names=["pass_json", "transaction_create_redeem"], repeat=2)
+
+        self.assertEqual(set(results), {"pass_json", "transaction_create_redeem"})
+        for summary in results.values():
+            self.assertEqual(summary["rounds"], 2)
+            self.assertLessEqual(summary["min_ms"], summary["median_ms"])
+            self.assertLessEqual(summary["median_ms"], summary["max_ms"])
+
+    def test_refuses_to_flush_a_configured_database(self):
+        business = create_business("Keep Me")
+        with mock.patch.dict(connection.settings_dict, {"NAME": "db.sqlite3"}):
+            with self.assertRaises(ValueError):
+                run_benchmarks(names=["pass_json"], repeat=1)
+        self.assertTrue(Business.objects.filter(pk=business.pk).exists())
+
+    def test_scaled_cases_respect_max_scale(self):
+        results = run_benchmarks(names=["list_serial_numbers"], max_scale=1_000, repeat=1)
+        self.assertEqual(list(results), ["list_serial_numbers[1000]"])
+
+    def test_compare_flags_regressions_beyond_threshold(self):
+        def document(**medians):
+            return {"results": {key: {"median_ms": value} for key, value in medians.items()}}
+
+        baseline = document(fast=10.0, steady=5.0, dropped=1.0)
+        current = document(fast=12.0, steady=5.2, added=3.0)
+        rows = compare_results(baseline["results"], current["results"], threshold=0.10)
+        self.assertEqual([(row[0], row[4]) for row in rows], [("fast", True), ("steady", False)])
+
+        directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        (directory / "baseline.json").write_text(json.dumps(baseline))
+        (directory / "current.json").write_text(json.dumps(current))
+
+        with self.assertRaisesRegex(CommandError, "fast"):
+            call_command("compare_benchmarks", directory / "baseline.json", directory / "current.json", stdout=StringIO())
+        out = StringIO()
+        call_command(
+            "compare_benchmarks", directory / "baseline.json", directory / "current.json", threshold=0.25, stdout=out
+        )
+        self.assertIn("+20.0%", out.getvalue())
+
+
+@test_settings
+class SyntheticDataTests(APITestCase):
+    plan = DatasetPlan(
+        businesses=3,
+        stations_per_business=2,
+        cards_per_business=40,
+        transactions=3_000,
+        span_days=30,
+        wallet_share=0.5,
+        batch_size=500,
+        seed=7,
+        end=datetime(2026, 1, 1, tzinfo=dt_timezone.utc),
+    )
+
+    def _snapshot(self):
+        return (
+            sorted(Transaction.objects.values_list("id", "loyalty_card_id", "amount", "created_at")),
+            sorted(LoyaltyCard.objects.values_list("token", "points_balance")),
+        )
+
+    def test_generates_requested_volume_with_zipf_skew(self):
+        summary = generate_dataset(self.plan)
+
+        self.assertEqual((summary.businesses, summary.stations, summary.cards), (3, 6, 120))
+        self.assertEqual(Transaction.objects.count(), 3_000)
+        self.assertEqual(PassRegistration.objects.count(), summary.registrations)
+        self.assertTrue(0 < summary.registrations < 120)
+
+        ids = business_ids(self.plan)
+        per_business = [Transaction.objects.filter(business_id=business_id).count() for business_id in ids]
+        self.assertEqual(per_business, sorted(per_business, reverse=True))
+        busiest_card = (
+            Transaction.objects.filter(business_id=ids[0]).values("loyalty_card").annotate(n=Count("id")).order_by("-n")
+        )[0]["n"]
+        self.assertGreater(busiest_card, per_business[0] / 40 * 3)
+
+        start = self.plan.end - timedelta(days=30)
+        self.assertFalse(Transaction.objects.exclude(created_at__range=(start, self.plan.end)).exists())
+        for card in LoyaltyCard.objects.filter(business_customer__business_id=ids[1])[:10]:
+            totals = card.transaction_set.aggregate(earned=Sum("points_earned"), spent=Sum("points_redeemed"))
+            self.assertEqual(card.points_balance, max((totals["earned"] or 0) - (totals["spent"] or 0), 0))
+
+    def test_same_seed_reproduces_the_same_rows(self):
+        generate_dataset(self.plan)
+        first = self._snapshot()
+        first_credentials = set(Station.objects.values_list("api_token", flat=True))
+        first_credentials |= set(LoyaltyCard.objects.values_list("apple_auth_token", flat=True))
+
+        Business.objects.all().delete()
+        Customer.objects.all().delete()
+        generate_dataset(self.plan)
+
+        self.assertEqual(self._snapshot(), first)
+        # Credentials never follow from the seed.
+        self.assertFalse(first_credentials & set(Station.objects.values_list("api_token", flat=True)))
+        self.assertFalse(first_credentials & set(LoyaltyCard.objects.values_list("apple_auth_token", flat=True)))
+
+    def test_bulk_formatted_values_match_the_model_fields(self):
+        writer = _TransactionWriter("default")
+        self.assertTrue(writer.text_values)
+        timestamps_ms = np.array([1_767_225_600_000, 1_767_225_600_001, 1_700_000_123_456])
+        rand_a = np.array([0, 4095, 1234])
+        rand_b = np.array([0, (1 << 62) - 1, 987_654_321_012], dtype=np.int64)
+        fields = zip(timestamps_ms.tolist(), rand_a.tolist(), rand_b.tolist())
+
+        self.assertEqual(
+            writer.ids(timestamps_ms, rand_a, rand_b),
+            [writer.prepare("id", uuid7_from(ms, a, b)) for ms, a, b in fields],
+        )
+        self.assertEqual(
+            writer.datetimes(timestamps_ms),
+            [writer.prepare("created_at", _datetime(ms)) for ms in timestamps_ms.tolist()],
+        )
+
+    def test_command_reports_what_it_created(self):
+        out = StringIO()
+        call_command(
+            "generate_synthetic_data",
+            businesses=2,
+            cards=10,
+            transactions=200,
+            seed=3,
+            end="2026-01-01T00:00:00+00:00",
+            stdout=out,
+        )
+        self.assertIn("2 businesses", out.getvalue())
+        self.assertIn("200 transactions", out.getvalue())
+
+        with self.assertRaisesRegex(CommandError, "--phone-start"):
+            call_command("generate_synthetic_data", businesses=1, cards=10, transactions=10, seed=3, stdout=StringIO())
+
+
+# The live server shares the test database connection between its request
+# threads, so per-request query counts would include each other's queries.
+class _SerialWSGIServer(WSGIServer):
+    def __init__(self, *args, connections_override=None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+
+class _SerialLiveServerThread(LiveServerThread):
+    # The in-memory test database is one connection the server shares with
+    # the test, so requests are served one at a time.
+    server_class = _SerialWSGIServer
+
+
+@override_settings(QUERY_BUDGET_MODE="off")
+@test_settings
+class LoadTestTests(LiveServerTestCase):
+    server_thread_class = _SerialLiveServerThread
+
+    def test_virtual_users_exercise_every_role(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        plan = LoadPlan(
+            businesses=1, stations=1, devices=1, owners=1, duration=1.5,
+            station_rate=0, device_rate=5, owner_rate=5, cards=2, passes_per_device=2,
+        )
+
+        with ApnsStub() as stub, override_settings(**stub.settings(directory)), mock.patch(
+            "django.contrib.auth.base_user.check_password", wraps=check_password
+        ) as password_checks:
+            summary, statuses, _ = run_load(self.live_server_url, plan, settings.APPLE_PASS_TYPE_IDENTIFIER)
+
+        # One login per tenant; virtual users reuse its session instead of hashing on every request.
+        self.assertEqual(password_checks.call_count, plan.businesses)
+
+        self.assertEqual(summary["all"].errors, 0, statuses)
+        for operation in (
+            "station.transaction",
+            "device.register",
+            "device.list_updates",
+            "device.download_pass",
+            "owner.dashboard-metrics",
+        ):
+            self.assertGreater(summary[operation].requests, 0, operation)
+        self.assertEqual(summary["device.register"].requests, 2)
+        self.assertTrue(stub.received)
+        self.assertEqual(stub.received[0].topic, settings.APNS_TOPIC)
+        self.assertTrue(stub.received[0].authorization.startswith("bearer "))
+
+
+@test_settings
+class ApnsStubTests(APITestCase):
+    device_token = "ab" * 32
+
+    def stub(self, **options):
+        stub = ApnsStub(topic=settings.APNS_TOPIC, seed=1, **options).start()
+        self.addCleanup(stub.stop)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        overrides = override_settings(**stub.settings(directory))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        return stub
+
+    def push(self, device_token=None):
+        payload = PassRegistrationPayload(push_token=device_token or self.device_token, serial_number="serial")
+        return AppleWalletPushClient().send_pass_update(payload)
+
+    def test_push_client_talks_http2_to_the_endpoint_override(self):
+        stub = self.stub()
+
+        self.assertTrue(self.push())
+
+        [received] = stub.received
+        self.assertEqual((received.status, received.device_token), (200, self.device_token))
+        self.assertEqual((received.topic, received.push_type), (settings.APNS_TOPIC, "background"))
+
+    def test_requests_are_validated_like_apns(self):
+        stub = self.stub()
+
+        self.assertFalse(self.push(device_token="not-hex"))
+        with override_settings(APNS_TOPIC="pass.com.example.other"):
+            self.assertFalse(self.push())
+
+        self.assertEqual(
+            [(push.status, push.reason) for push in stub.received],
+            [(400, "BadDeviceToken"), (400, "TopicDisallowed")],
+        )
+        self.assertEqual(provider_token_problem(""), "MissingProviderToken")
+        self.assertEqual(provider_token_problem("bearer not.a.jwt"), "InvalidProviderToken")
+
+    def test_injected_failures_and_latency(self):
+        stub = self.stub(throttle_rate=1.0)
+        self.assertFalse(self.push())
+        stub.throttle_rate, stub.unregistered_rate, stub.latency_ms = 0.0, 1.0, 150
+        started = time.perf_counter()
+        self.assertFalse(self.push())
+
+        self.assertGreaterEqual(time.perf_counter() - started, 0.15)
+        self.assertEqual([push.reason for push in stub.received], ["TooManyRequests", "Unregistered"])
+        self.assertEqual(stub.counts(), {429: 1, 410: 1})
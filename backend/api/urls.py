@@ -1,5 +1,5 @@
 from django.urls import path, include
-from rest_framework.routers import DefaultRouter
+from rest_framework.routers import APIRootView, DefaultRouter
 from .views import (
     BusinessViewSet,
     CustomerViewSet,
@@ -11,11 +11,20 @@ from .views import (
     StationPreparedPassView,
     StationPublicPassView,
     LoyaltyCardQRView,
+    SignedPassView,
+    SignedPassQRView,
     DashboardMetricsView,
     DashboardDetailView,
+    ExportView,
+    CustomerImportView,
 )
 
+class RouterRootView(APIRootView):
+    query_budget = 2
+
+
 router = DefaultRouter()
+router.APIRootView = RouterRootView
 
 router.register(r'businesses', BusinessViewSet)
 router.register(r'customers', CustomerViewSet)
@@ -30,7 +39,11 @@ urlpatterns = [
     path('loyaltycards/<uuid:token>/qr/', LoyaltyCardQRView.as_view(), name='loyaltycard-qr'),
     path('stations/<uuid:pk>/prepared-pass/', StationPreparedPassView.as_view(), name='station-prepared-pass'),
     path('stations/public/<slug:slug>/prepared-pass/', StationPublicPassView.as_view(), name='station-public-pass'),
+    path('stations/<uuid:station_id>/passes/<uuid:token>/', SignedPassView.as_view(), name='station-signed-pass'),
+    path('stations/<uuid:station_id>/passes/<uuid:token>/qr/', SignedPassQRView.as_view(), name='station-signed-pass-qr'),
     path('dashboard-metrics/', DashboardMetricsView.as_view(), name='dashboard-metrics'),
     path('dashboard-data/', DashboardDetailView.as_view(), name='dashboard-data'),
+    path('exports/<str:dataset>/', ExportView.as_view(), name='export'),
+    path('imports/customers/', CustomerImportView.as_view(), name='customer-import'),
     path('', include(router.urls)),
 ]
@@ -1,7 +1,16 @@
 import re
+import time
+from contextlib import contextmanager
+
+from django.db import OperationalError
 from rest_framework.exceptions import AuthenticationFailed, NotAuthenticated
+
+from server.metrics import db_lock_retries
 from .models import Station
 
+LOCK_RETRY_ATTEMPTS = 3
+LOCK_RETRY_DELAY = 0.05
+
 def resolve_station_from_request(request):
     token = request.headers.get("X-Station-Token")
     if not token:
@@ -25,3 +34,34 @@ def normalize_phone_number(value: str) -> str:
     if len(digits) == 10:
         digits = f"1{digits}"
     return f"+{digits}"
+
+
+@contextmanager
+def explicit_timestamps(model, *field_names):
+    """
+    Let bulk inserts keep caller-provided values for auto_now/auto_now_add fields.
+    """
+    fields = [model._meta.get_field(name) for name in field_names]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def retry_on_database_lock(func, operation, attempts=LOCK_RETRY_ATTEMPTS, delay=LOCK_RETRY_DELAY):
+    """
+    Run `func` (which should open its own atomic block) again when SQLite
+    gives up waiting for the write lock, backing off a little each time.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return func()
+        except OperationalError as exc:
+            if "locked" not in str(exc) or attempt == attempts:
+                raise
+            db_lock_retries.inc(operation=operation)
+            time.sleep(delay * attempt)
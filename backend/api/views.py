@@ -1,15 +1,18 @@
+import time
 from datetime import timedelta
 from decimal import Decimal, ROUND_DOWN, ROUND_HALF_UP
 
+from django.conf import settings
 from django.db import transaction as db_transaction
 from django.db.models import Count, Sum, Max, Q
 from django.db.models.functions import TruncDate
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework import status, viewsets
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
 from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -22,6 +25,7 @@ from .models import (
     PassRegistration,
     Station,
     Transaction,
+    next_pass_version,
 )
 from .serializers import (
     BusinessSerializer,
@@ -31,35 +35,61 @@ from .serializers import (
     StationSerializer,
     TransactionSerializer,
     LoyaltyCardIssueSerializer,
+    WalletStatusChangeSerializer,
 )
-from .utils import resolve_station_from_request
+from .exports import EXPORT_FORMATS, EXPORTS
+from .imports import IMPORT_FORMATS, import_customers
+from .issuance import issue_loyalty_card
+from .sharding import locate_or_404
+from .utils import resolve_station_from_request, retry_on_database_lock
+from .pass_links import pass_link_problem, signed_pass_path
+from .prepared import claim_prepared_pass, claimed_prepared_pass, next_prepared_pass
+from .provisioning import MAX_PROVISIONED_STATIONS, provision_stations
+from .pass_refresh import schedule_pass_refresh
+from .qr import QR_IMAGE_FORMATS, QR_SIZES, qr_image
+from .wallet_status import change_wallet_status
 from .passkit import (
     build_pkpass,
-    ensure_card_auth_token,
     notify_loyalty_card_updated,
+    pass_branding,
 )
+from server.metrics import REGISTRY
+
+transaction_create_seconds = REGISTRY.histogram(
+    "transaction_create_seconds", "Time spent recording a transaction, including the card update."
+)
+dashboard_seconds = REGISTRY.histogram("dashboard_seconds", "Time spent building dashboard responses.", ("view",))
 
 
 class BusinessViewSet(viewsets.ModelViewSet):
     queryset = Business.objects.all().order_by("name")
     serializer_class = BusinessSerializer
+    query_budget = {"list": 5, "retrieve": 4, "create": 6, "update": 7, "partial_update": 7, "destroy": 12}
 
     def get_queryset(self):
         biz = self.request.user.business
         return Business.objects.filter(pk = biz.id)
 
+    def perform_update(self, serializer):
+        branding = pass_branding(serializer.instance)
+        business = serializer.save()
+        if pass_branding(business) != branding:
+            db_transaction.on_commit(lambda: schedule_pass_refresh(business), using=business._state.db)
+
 class CustomerViewSet(viewsets.ModelViewSet):
     queryset = Customer.objects.all().order_by("name")
     serializer_class = CustomerSerializer
     permission_classes = [IsAdminUser]
+    query_budget = {"list": 4, "retrieve": 3, "create": 5, "update": 6, "partial_update": 6, "destroy": 10}
 
 class BusinessCustomerViewSet(viewsets.ModelViewSet):
     queryset = BusinessCustomer.objects.all().order_by("customer__name")
     serializer_class = BusinessCustomerSerializer
+    query_budget = {"list": 5, "retrieve": 4, "create": 7, "update": 7, "partial_update": 7, "destroy": 14}
 
     def get_queryset(self):
         biz = self.request.user.business
-        return BusinessCustomer.objects.filter(business = biz)
+        return BusinessCustomer.objects.filter(business = biz).select_related("business", "customer")
 
     def perform_create(self, serializer):
         biz = self.request.user.business
@@ -74,40 +104,87 @@ class BusinessCustomerViewSet(viewsets.ModelViewSet):
 class LoyaltyCardViewSet(viewsets.ModelViewSet):
     queryset = LoyaltyCard.objects.all().order_by("-created_at")
     serializer_class = LoyaltyCardSerializer
+    query_budget = {
+        "list": 5, "retrieve": 4, "create": 7, "update": 7, "partial_update": 7, "destroy": 10, "wallet_status": 3,
+    }
 
     def get_queryset(self):
         biz = self.request.user.business
-        return LoyaltyCard.objects.filter(business_customer__business = biz)
+        return LoyaltyCard.objects.filter(business_customer__business = biz).select_related(
+            "business_customer__business", "business_customer__customer"
+        )
 
     def perform_create(self, serializer):
         biz = self.request.user.business
         bc = serializer.validated_data.get("business_customer")
 
-        if bc.business != biz:
+        if bc.business_id != biz.pk:
             raise PermissionDenied("Cannot create card for another business's customer.")
 
         serializer.save()
 
+    @action(detail=False, methods=["post"], url_path="wallet-status")
+    def wallet_status(self, request):
+        """
+        Revoke, expire or reinstate many cards at once, e.g.
+        {"wallet_status": "revoked", "tokens": [...]} or
+        {"wallet_status": "expired", "updated_before": "2025-01-01T00:00:00Z"}.
+        """
+        serializer = WalletStatusChangeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        business = request.user.business
+        change = change_wallet_status(business, serializer.validated_data["wallet_status"], **serializer.filters())
+        # Pushing thousands of devices takes minutes; it runs paced in the background.
+        fan_out_queued = bool(change.card_ids)
+        if fan_out_queued:
+            schedule_pass_refresh(business, card_ids=change.card_ids)
+        return Response({**change.as_dict(), "fan_out_queued": fan_out_queued})
+
 class StationViewSet(viewsets.ModelViewSet):
     queryset = Station.objects.all().order_by("name")
     serializer_class = StationSerializer
+    query_budget = {
+        "list": 5, "retrieve": 4, "create": 7, "update": 7, "partial_update": 7, "destroy": 8, "bulk": 4,
+    }
 
     def get_queryset(self):
         biz = self.request.user.business
-        return Station.objects.filter(business = biz)
+        return Station.objects.filter(business = biz).select_related("business")
 
     def perform_create(self, serializer):
         biz = self.request.user.business
         serializer.save(business = biz)
 
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        """Create up to MAX_PROVISIONED_STATIONS stations from {"names": [...]}."""
+        names = request.data.get("names")
+        max_length = Station._meta.get_field("name").max_length
+        if (
+            not isinstance(names, list)
+            or not 0 < len(names) <= MAX_PROVISIONED_STATIONS
+            or not all(isinstance(name, str) and 0 < len(name.strip()) <= max_length for name in names)
+        ):
+            raise ValidationError(
+                {"names": f"Send 1 to {MAX_PROVISIONED_STATIONS} station names of at most {max_length} characters."}
+            )
+        stations = provision_stations(request.user.business, names)
+        return Response(self.get_serializer(stations, many=True).data, status=status.HTTP_201_CREATED)
+
 class TransactionViewSet(viewsets.ModelViewSet):
     queryset = Transaction.objects.all().order_by("-created_at")
     serializer_class = TransactionSerializer
+    query_budget = {"list": 5, "retrieve": 4, "create": 16, "update": 8, "partial_update": 8, "destroy": 6}
 
     def get_queryset(self):
         biz = self.request.user.business
-        return Transaction.objects.filter(station__business=biz)
+        return Transaction.objects.filter(business=biz).select_related(
+            "station__business",
+            "loyalty_card__business_customer__business",
+            "loyalty_card__business_customer__customer",
+        )
 
+    @transaction_create_seconds.time()
     def perform_create(self, serializer):
         biz = self.request.user.business
         redeem_requested = serializer.validated_data.pop("redeem", False)
@@ -119,49 +196,66 @@ class TransactionViewSet(viewsets.ModelViewSet):
             raise PermissionDenied("Station does not belong to your business.")
 
         if loyalty_card:
-            if loyalty_card.business_customer.business != biz:
+            if loyalty_card.business_customer.business_id != biz.pk:
                 raise PermissionDenied("Cannot create a transaction for a loyalty card outside your business.")
 
-            with db_transaction.atomic():
-                card = LoyaltyCard.objects.select_for_update().get(pk=loyalty_card.pk)
-                points_earned = int(
-                    (amount * biz.reward_rate).quantize(Decimal("1"), rounding=ROUND_DOWN)
-                )
-                new_balance = card.points_balance + points_earned
-                points_redeemed = 0
-                final_amount = amount.quantize(Decimal("0.01"))
-
-                if redeem_requested and new_balance >= biz.redemption_points:
-                    points_redeemed = biz.redemption_points
-                    new_balance -= points_redeemed
-                    discount = (amount * biz.redemption_rate).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-                    final_amount = (amount - discount).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-                    if final_amount < Decimal("0.00"):
-                        final_amount = Decimal("0.00")
-
-                card.points_balance = new_balance
-                card.save(update_fields=["points_balance", "updated_at"])
-
-                serializer.save(
-                    station=station,
-                    loyalty_card=card,
-                    points_earned=points_earned,
-                    points_redeemed=points_redeemed,
-                    final_amount=final_amount,
-                )
+            def credit_card():
+                # A retried attempt must insert again rather than update.
+                serializer.instance = None
+                with db_transaction.atomic():
+                    card = LoyaltyCard.objects.select_for_update().get(pk=loyalty_card.pk)
+                    points_earned = int(
+                        (amount * biz.reward_rate).quantize(Decimal("1"), rounding=ROUND_DOWN)
+                    )
+                    new_balance = card.points_balance + points_earned
+                    points_redeemed = 0
+                    final_amount = amount.quantize(Decimal("0.01"))
+
+                    if redeem_requested and new_balance >= biz.redemption_points:
+                        points_redeemed = biz.redemption_points
+                        new_balance -= points_redeemed
+                        discount = (amount * biz.redemption_rate).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+                        final_amount = (amount - discount).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+                        if final_amount < Decimal("0.00"):
+                            final_amount = Decimal("0.00")
+
+                    card.points_balance = new_balance
+                    card.updated_at = timezone.now()
+                    LoyaltyCard.objects.filter(pk=card.pk).update(
+                        points_balance=new_balance,
+                        updated_at=card.updated_at,
+                        pass_version=next_pass_version(),
+                    )
+
+                    serializer.save(
+                        station=station,
+                        business=biz,
+                        loyalty_card=card,
+                        points_earned=points_earned,
+                        points_redeemed=points_redeemed,
+                        final_amount=final_amount,
+                    )
+                return card
+
+            card = retry_on_database_lock(credit_card, operation="transaction_create")
             notify_loyalty_card_updated(card)
         else:
-            serializer.save(
-                station=station,
-                loyalty_card=None,
-                points_earned=0,
-                points_redeemed=0,
-                final_amount=amount.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP),
+            retry_on_database_lock(
+                lambda: serializer.save(
+                    station=station,
+                    business=biz,
+                    loyalty_card=None,
+                    points_earned=0,
+                    points_redeemed=0,
+                    final_amount=amount.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP),
+                ),
+                operation="transaction_create",
             )
 
 
 class LoyaltyCardIssueView(APIView):
     permission_classes = [IsAuthenticated]
+    query_budget = 10
 
     def post(self, request):
         serializer = LoyaltyCardIssueSerializer(data=request.data)
@@ -169,43 +263,31 @@ class LoyaltyCardIssueView(APIView):
 
         biz = request.user.business
         station = resolve_station_from_request(request)
-        if station.business != biz:
+        if station.business_id != biz.pk:
             raise PermissionDenied("Station does not belong to your business.")
 
-        phone = serializer.validated_data["phone_number"]
-        name = serializer.validated_data["customer_name"]
-
-        customer, created = Customer.objects.get_or_create(
-            phone_number=phone,
-            defaults={"name": name},
-        )
-        if not created and name and customer.name != name:
-            customer.name = name
-            customer.save(update_fields=["name"])
-
-        business_customer, _ = BusinessCustomer.objects.get_or_create(
-            business=biz,
-            customer=customer,
+        issued = issue_loyalty_card(
+            biz,
+            station,
+            name=serializer.validated_data["customer_name"],
+            phone_number=serializer.validated_data["phone_number"],
         )
-        loyalty_card, _ = LoyaltyCard.objects.get_or_create(
-            business_customer=business_customer,
+        customer = issued.customer
+        business_customer = issued.business_customer
+        loyalty_card = issued.loyalty_card
+
+        expires = int(time.time()) + settings.PASS_LINK_TTL_SECONDS
+        prepared_url = request.build_absolute_uri(signed_pass_path(station.pk, loyalty_card.token, expires))
+        qr_url = request.build_absolute_uri(
+            signed_pass_path(station.pk, loyalty_card.token, expires, url_name="station-signed-pass-qr")
         )
-        ensure_card_auth_token(loyalty_card)
-
-        station.prepared_loyalty_card = loyalty_card
-        station.prepared_at = timezone.now()
-        station.save(update_fields=["prepared_loyalty_card", "prepared_at"])
-
-        prepared_url = request.build_absolute_uri(
-            reverse("station-prepared-pass", args=[station.pk])
-        )
-        prepared_url = f"{prepared_url}?token={station.api_token}"
         public_pass_url = request.build_absolute_uri(
             reverse("station-public-pass", args=[station.public_slug])
         )
 
         loyalty_card_data = LoyaltyCardSerializer(loyalty_card, context={"request": request}).data
         loyalty_card_data["qr_payload"] = str(loyalty_card.token)
+        loyalty_card_data["qr_images"] = qr_image_urls(qr_url)
         loyalty_card_data["authentication_token"] = loyalty_card.apple_auth_token
 
         return Response(
@@ -225,61 +307,156 @@ class LoyaltyCardIssueView(APIView):
         )
 
 
-def serve_station_prepared_pass(request, station, default_clear=True):
-    card = station.prepared_loyalty_card
-    if not card:
+def serve_station_prepared_pass(request, station, allow_peek=False):
+    """
+    Hand out the station's next prepared pass. Claiming (the default)
+    takes it off the queue for this caller, and claim=<token> fetches a
+    pass this caller already claimed. clear=false only looks at the next
+    pass without claiming it, which only callers holding the station token
+    (`allow_peek`) may do: anyone else could read every queued customer's
+    pass that way.
+    """
+    claim_token = request.query_params.get("claim")
+    clear_param = request.query_params.get("clear")
+    clear = clear_param is None or clear_param.lower() != "false"
+    if not clear and not allow_peek:
+        raise ValidationError({"clear": "Peeking at the queue needs the station token."})
+
+    if claim_token:
+        entry = claimed_prepared_pass(station, claim_token)
+    elif clear:
+        entry = claim_prepared_pass(station)
+    else:
+        entry = next_prepared_pass(station)
+    if entry is None:
         return Response({"detail": "No pass prepared."}, status=status.HTTP_404_NOT_FOUND)
+    return pass_response(request, entry.loyalty_card, claim=entry.claim_token, expires_at=entry.expires_at.isoformat())
 
-    platform = request.query_params.get("platform", "json").lower()
-    clear_param = request.query_params.get("clear")
-    clear = default_clear
-    if clear_param is not None:
-        clear = clear_param.lower() != "false"
 
+def pass_response(request, card, **details):
+    """The card as a .pkpass for ?platform=apple, otherwise as JSON with `details`."""
+    platform = request.query_params.get("platform", "json").lower()
     if platform == "apple":
         pkpass_bytes = build_pkpass(card)
         response = HttpResponse(pkpass_bytes, content_type="application/vnd.apple.pkpass")
         response["Content-Disposition"] = f'attachment; filename="{card.token}.pkpass"'
-    else:
-        payload = {
+        return response
+    return Response(
+        {
             "loyalty_card_token": str(card.token),
             "qr_payload": str(card.token),
             "apple_wallet_available": True,
+            **details,
         }
-        response = Response(payload)
-
-    if clear:
-        station.prepared_loyalty_card = None
-        station.prepared_at = None
-        station.save(update_fields=["prepared_loyalty_card", "prepared_at"])
-
-    return response
+    )
 
 
 class StationPreparedPassView(APIView):
     authentication_classes = []
     permission_classes = []
+    query_budget = 5
 
     def get(self, request, pk):
-        station = get_object_or_404(Station, pk=pk)
+        station = locate_or_404(Station.objects.all(), pk=pk)
         token = request.query_params.get("token")
         if token != station.api_token:
             raise PermissionDenied("Invalid station token.")
 
-        return serve_station_prepared_pass(request, station, default_clear=True)
+        return serve_station_prepared_pass(request, station, allow_peek=True)
 
 
 class StationPublicPassView(APIView):
     authentication_classes = []
     permission_classes = []
+    query_budget = 5
 
     def get(self, request, slug):
-        station = get_object_or_404(Station, public_slug=slug)
-        return serve_station_prepared_pass(request, station, default_clear=False)
+        station = locate_or_404(Station.objects.all(), public_slug=slug)
+        return serve_station_prepared_pass(request, station)
+
+
+class SignedPassView(APIView):
+    """
+    Download a card through a link minted by the issue view. The signature
+    is checked before any query, and only the card is loaded.
+    """
+
+    authentication_classes = []
+    permission_classes = []
+    query_budget = 2
+
+    def get(self, request, station_id, token):
+        expires = request.query_params.get("expires")
+        problem = pass_link_problem(station_id, token, expires, request.query_params.get("signature"))
+        if problem:
+            raise PermissionDenied(problem)
+
+        card = locate_or_404(
+            LoyaltyCard.objects.select_related("business_customer__business", "business_customer__customer"),
+            token=token,
+        )
+        qr_url = request.build_absolute_uri(
+            signed_pass_path(station_id, token, int(expires), url_name="station-signed-pass-qr")
+        )
+        response = pass_response(request, card, qr_images=qr_image_urls(qr_url))
+        # The URL names one card and stops working at `expires`.
+        response["Cache-Control"] = f"private, max-age={max(int(expires) - int(time.time()), 0)}"
+        return response
+
+
+class SignedPassQRView(APIView):
+    """
+    The QR code of a card, for holders of its signed pass link (the same
+    expires and signature, plus ?file_format=png|svg and ?size). The image
+    only encodes the card token that is already in the URL, so nothing is
+    loaded and shared caches may keep it for good.
+    """
+
+    authentication_classes = []
+    permission_classes = []
+    query_budget = 0
+
+    def get(self, request, station_id, token):
+        problem = pass_link_problem(
+            station_id, token, request.query_params.get("expires"), request.query_params.get("signature")
+        )
+        if problem:
+            raise PermissionDenied(problem)
+        return qr_image_response(request, str(token), "public, max-age=31536000, immutable")
+
+
+def qr_image_urls(url):
+    """{file_format: {size: url}} for every rendering of the QR code served at `url`."""
+    separator = "&" if "?" in url else "?"
+    return {
+        image_format: {size: f"{url}{separator}file_format={image_format}&size={size}" for size in QR_SIZES}
+        for image_format in QR_IMAGE_FORMATS
+    }
+
+
+def qr_image_response(request, payload, cache_control):
+    """`payload` rendered as the ?file_format and ?size the request asks for."""
+    file_format = request.query_params.get("file_format", "png").lower()
+    if file_format not in QR_IMAGE_FORMATS:
+        raise ValidationError({"file_format": f"Choose one of: {', '.join(QR_IMAGE_FORMATS)}."})
+    size = request.query_params.get("size", "medium").lower()
+    if size not in QR_SIZES:
+        raise ValidationError({"size": f"Choose one of: {', '.join(QR_SIZES)}."})
+
+    response = HttpResponse(qr_image(payload, file_format, size), content_type=QR_IMAGE_FORMATS[file_format])
+    response["Cache-Control"] = cache_control
+    return response
 
 
 class LoyaltyCardQRView(APIView):
+    """
+    The card's QR payload, or with ?file_format=png|svg (and optionally
+    ?size=small|medium|large) the rendered QR code. A card's payload never
+    changes, so images are cached in-process and marked immutable.
+    """
+
     permission_classes = [IsAuthenticated]
+    query_budget = 4
 
     def get(self, request, token):
         card = get_object_or_404(
@@ -287,12 +464,76 @@ class LoyaltyCardQRView(APIView):
             token=token,
             business_customer__business=request.user.business,
         )
-        return Response({"qr_payload": str(card.token)})
+        payload = str(card.token)
+
+        if "file_format" not in request.query_params:
+            url = request.build_absolute_uri(reverse("loyaltycard-qr", args=[card.token]))
+            return Response({"qr_payload": payload, "images": qr_image_urls(url)})
+
+        # Private: the URL is only served to the card's business. Customers
+        # get the public copy behind their signed pass link (SignedPassQRView).
+        return qr_image_response(request, payload, "private, max-age=31536000, immutable")
+
+
+class ExportView(APIView):
+    permission_classes = [IsAuthenticated]
+    query_budget = 4
+
+    def get(self, request, dataset):
+        build_rows = EXPORTS.get(dataset)
+        if build_rows is None:
+            raise NotFound("Unknown export.")
+
+        file_format = request.query_params.get("file_format", "csv").lower()
+        if file_format not in EXPORT_FORMATS:
+            raise ValidationError({"file_format": f"Choose one of: {', '.join(EXPORT_FORMATS)}."})
+        stream, content_type = EXPORT_FORMATS[file_format]
+
+        queryset, columns = build_rows(request.user.business, request.query_params)
+        response = StreamingHttpResponse(stream(queryset, columns), content_type=content_type)
+        filename = f"{dataset}-{timezone.now():%Y%m%d}.{file_format}"
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+
+class CustomerImportView(APIView):
+    """
+    Import customers and cards from the request body (CSV or NDJSON) or
+    from a multipart upload named "file". ?opening_balances=true seeds new
+    cards from the points_balance column.
+    """
+
+    permission_classes = [IsAuthenticated]
+    # Every chunk of rows adds its own allowance (see api.imports).
+    query_budget = 4
+
+    def post(self, request):
+        content_type = request.content_type or ""
+        file_format = request.query_params.get("file_format", "ndjson" if "ndjson" in content_type else "csv").lower()
+        if file_format not in IMPORT_FORMATS:
+            raise ValidationError({"file_format": f"Choose one of: {', '.join(IMPORT_FORMATS)}."})
+
+        if content_type.startswith("multipart/form-data"):
+            lines = request.FILES.get("file")
+            if lines is None:
+                raise ValidationError({"file": "Upload the rows as a file named 'file'."})
+        else:
+            lines = request.stream or ()
+
+        opening_balances = request.query_params.get("opening_balances", "").lower() in ("1", "true", "yes")
+        summary = import_customers(
+            request.user.business,
+            IMPORT_FORMATS[file_format](lines),
+            opening_balances=opening_balances,
+        )
+        return Response(summary.as_dict(), status=status.HTTP_200_OK)
 
 
 class DashboardMetricsView(APIView):
     permission_classes = [IsAuthenticated]
+    query_budget = 12
 
+    @dashboard_seconds.time(view="metrics")
     def get(self, request):
         biz = request.user.business
 
@@ -336,7 +577,7 @@ class DashboardMetricsView(APIView):
 
         points_redeemed = (
             Transaction.objects.filter(
-                loyalty_card__business_customer__business=biz,
+                business=biz,
                 created_at__gte=seven_days_ago,
             ).aggregate(total=Sum("points_redeemed"))["total"]
             or 0
@@ -344,7 +585,7 @@ class DashboardMetricsView(APIView):
 
         points_redeemed_prev = (
             Transaction.objects.filter(
-                loyalty_card__business_customer__business=biz,
+                business=biz,
                 created_at__gte=previous_period_start,
                 created_at__lt=seven_days_ago,
             ).aggregate(total=Sum("points_redeemed"))["total"]
@@ -378,14 +619,16 @@ class DashboardMetricsView(APIView):
 
 class DashboardDetailView(APIView):
     permission_classes = [IsAuthenticated]
+    query_budget = 9
 
+    @dashboard_seconds.time(view="detail")
     def get(self, request):
         biz = request.user.business
         now = timezone.now()
 
         station_activity = {
             item["station_id"]: item["last_activity"]
-            for item in Transaction.objects.filter(station__business=biz)
+            for item in Transaction.objects.filter(business=biz)
             .values("station_id")
             .annotate(last_activity=Max("created_at"))
         }
@@ -428,7 +671,7 @@ class DashboardDetailView(APIView):
         start_date = now - timedelta(days=90)
         revenue_rows = (
             Transaction.objects.filter(
-                station__business=biz,
+                business=biz,
                 created_at__gte=start_date,
             )
             .annotate(day=TruncDate("created_at"))
@@ -443,7 +686,7 @@ class DashboardDetailView(APIView):
 
         recent_transactions = []
         txn_qs = (
-            Transaction.objects.filter(station__business=biz)
+            Transaction.objects.filter(business=biz)
             .select_related(
                 "loyalty_card__business_customer__customer",
                 "station",
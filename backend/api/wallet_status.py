@@ -0,0 +1,68 @@
+"""
+Bulk wallet status changes: revoking, expiring or reinstating many
+loyalty cards of one business in one job.
+
+Matching cards are walked in token order, WALLET_STATUS_CHUNK_SIZE at a
+time: one query reads the next chunk of tokens and one UPDATE sets the new
+status and a fresh pass_version on it, so each write is short and the
+query count grows with chunks, not cards. The devices holding the changed
+cards are not pushed here: callers hand change.card_ids to one paced
+fan-out (api/pass_refresh.py), and the passes those devices fetch come
+back voided.
+"""
+
+from dataclasses import dataclass, field
+
+from django.utils import timezone
+
+from server.query_budget import extend_query_budget
+
+from .models import LoyaltyCard, next_pass_version
+
+WALLET_STATUS_CHUNK_SIZE = 500
+
+
+@dataclass
+class WalletStatusChange:
+    cards_updated: int = 0
+    card_ids: list = field(default_factory=list)
+
+    def as_dict(self):
+        return {"cards_updated": self.cards_updated}
+
+
+def matching_cards(business, tokens=None, current_status=None, created_before=None, updated_before=None):
+    """`business`'s cards narrowed by whichever filters are given."""
+    cards = LoyaltyCard.objects.filter(business_customer__business=business)
+    if tokens is not None:
+        cards = cards.filter(token__in=tokens)
+    if current_status is not None:
+        cards = cards.filter(wallet_status=current_status)
+    if created_before is not None:
+        cards = cards.filter(created_at__lt=created_before)
+    if updated_before is not None:
+        cards = cards.filter(updated_at__lt=updated_before)
+    return cards
+
+
+def change_wallet_status(business, wallet_status, chunk_size=WALLET_STATUS_CHUNK_SIZE, **filters):
+    """
+    Move the cards matching `filters` (see matching_cards) to `wallet_status`.
+    Cards already there are left alone. Returns a WalletStatusChange whose
+    card_ids still need their devices pushed.
+    """
+    pending = matching_cards(business, **filters).exclude(wallet_status=wallet_status).order_by("token")
+    change = WalletStatusChange()
+    last_token = None
+    while True:
+        chunk = pending if last_token is None else pending.filter(token__gt=last_token)
+        tokens = list(chunk.values_list("token", flat=True)[:chunk_size])
+        if not tokens:
+            break
+        extend_query_budget(2)
+        change.cards_updated += LoyaltyCard.objects.filter(pk__in=tokens).exclude(
+            wallet_status=wallet_status
+        ).update(wallet_status=wallet_status, pass_version=next_pass_version(), updated_at=timezone.now())
+        change.card_ids += tokens
+        last_token = tokens[-1]
+    return change
@@ -0,0 +1,139 @@
+import contextvars
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import connections
+
+from .metrics import http_request_duration
+
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+
+@dataclass
+class RequestMetrics:
+    sql_count: int = 0
+    sql_ms: float = 0.0
+    # Named sections of the request, e.g. "pass_build" and "push".
+    timers: dict = field(default_factory=dict)
+
+    def add(self, name, elapsed_ms):
+        self.timers[name] = self.timers.get(name, 0.0) + elapsed_ms
+
+
+def current_metrics():
+    """The metrics of the sampled request running in this context, if any."""
+    return _current.get()
+
+
+@contextmanager
+def timed(name):
+    """
+    Add the time spent in the block (or decorated function) to the current
+    request's `name` timer. Does nothing outside a sampled request.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(name, (time.perf_counter() - started) * 1000)
+
+
+def _count_queries(metrics):
+    def wrapper(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            metrics.sql_count += 1
+            metrics.sql_ms += (time.perf_counter() - started) * 1000
+
+    return wrapper
+
+
+def _view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return None
+    return match.view_name or match._func_path
+
+
+def server_timing(metrics, total_ms):
+    entries = [f'db;dur={metrics.sql_ms:.1f};desc="{metrics.sql_count} queries"']
+    entries.extend(f"{name};dur={elapsed:.1f}" for name, elapsed in sorted(metrics.timers.items()))
+    entries.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(entries)
+
+
+class RequestMetricsMiddleware:
+    """
+    Measure a sample of requests: SQL query count and time on every
+    configured database, the named timers recorded with `timed`, and the
+    total time. Results go out as one JSON log line per request on the
+    "server.instrumentation" logger, and as a Server-Timing header when
+    REQUEST_METRICS_SERVER_TIMING is on. Every request, sampled or not, is
+    added to the per-route latency histogram.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        rate = getattr(settings, "REQUEST_METRICS_SAMPLE_RATE", 0.01)
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            response = self.get_response(request)
+            self._observe(request, response, time.perf_counter() - started)
+            return response
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with ExitStack() as stack:
+                wrapper = _count_queries(metrics)
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(wrapper))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        elapsed = time.perf_counter() - started
+        self._observe(request, response, elapsed)
+        total_ms = elapsed * 1000
+
+        if getattr(settings, "REQUEST_METRICS_SERVER_TIMING", False):
+            response["Server-Timing"] = server_timing(metrics, total_ms)
+        logger.info(
+            json.dumps(
+                {
+                    "view": _view_name(request),
+                    "method": request.method,
+                    "path": request.path,
+                    "status": response.status_code,
+                    "sql_count": metrics.sql_count,
+                    "sql_ms": round(metrics.sql_ms, 2),
+                    **{f"{name}_ms": round(ms, 2) for name, ms in metrics.timers.items()},
+                    "total_ms": round(total_ms, 2),
+                },
+                sort_keys=True,
+            )
+        )
+        return response
+
+    def _observe(self, request, response, elapsed):
+        http_request_duration.observe(
+            elapsed,
+            route=_view_name(request) or "unmatched",
+            method=request.method,
+            status=response.status_code,
+        )
@@ -0,0 +1,331 @@
+"""
+A small in-process metrics registry rendered in the Prometheus text format.
+
+Each process keeps its own counters and histograms. When
+METRICS_MULTIPROC_DIR is set (one directory shared by all gunicorn workers,
+emptied before the server starts), a daemon thread in every process writes
+a snapshot of its values to `<pid>-<uuid>.json` there every
+METRICS_FLUSH_SECONDS, and again at exit. The uuid is drawn per process,
+so a worker that inherits a dead worker's pid never overwrites its file.
+`/metrics` adds up the snapshots of all workers. Snapshots of exited
+workers are folded into `exited.json` and deleted, under a file lock, so
+the directory stays small and counters never go backwards.
+"""
+
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def describe(self):
+        return {"type": self.kind, "help": self.documentation, "labelnames": list(self.labelnames)}
+
+    def snapshot(self):
+        with self._lock:
+            return {**self.describe(), "samples": [[list(key), self._copy(value)] for key, value in self._values.items()]}
+
+    def _copy(self, value):
+        return value
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self.registry.ensure_flusher()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames, buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def describe(self):
+        return {**super().describe(), "buckets": list(self.buckets)}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        # Counts are kept per bucket (the last one is +Inf) and made cumulative on output.
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {"buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            entry["buckets"][index] += 1
+            entry["sum"] += value
+            entry["count"] += 1
+        self.registry.ensure_flusher()
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block or decorated function in seconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _copy(self, value):
+        return {"buckets": list(value["buckets"]), "sum": value["sum"], "count": value["count"]}
+
+
+EXITED_SNAPSHOT = "exited.json"
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+        # Both are per process: a forked child draws its own id and starts its own flusher.
+        self._process = (None, None)
+        self._flusher_pid = None
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(self, name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}.")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def snapshot(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def _directory(self):
+        directory = getattr(settings, "METRICS_MULTIPROC_DIR", "")
+        return Path(directory) if directory else None
+
+    def _snapshot_name(self):
+        pid = os.getpid()
+        if self._process[0] != pid:
+            self._process = (pid, uuid.uuid4().hex)
+        return f"{pid}-{self._process[1]}.json"
+
+    def flush(self):
+        directory = self._directory()
+        if directory is None:
+            return
+        directory.mkdir(parents=True, exist_ok=True)
+        target = directory / self._snapshot_name()
+        staging = target.with_suffix(".tmp")
+        staging.write_text(json.dumps(self.snapshot()))
+        os.replace(staging, target)
+
+    def ensure_flusher(self):
+        """Start this process's snapshot thread; a cheap check after the first call."""
+        if self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_periodically, name="metrics-flush", daemon=True).start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(getattr(settings, "METRICS_FLUSH_SECONDS", 5))
+            try:
+                self.flush()
+            except OSError:
+                pass
+
+    def _compact(self, directory):
+        """Fold the snapshots of exited workers into EXITED_SNAPSHOT and delete them."""
+        archive_path = directory / EXITED_SNAPSHOT
+        with open(directory / ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                archive = json.loads(archive_path.read_text())
+            except (OSError, ValueError):
+                archive = {"metrics": {}, "folded": []}
+            # Names already folded in are deleted without counting them again,
+            # in case a previous compaction stopped before deleting them.
+            folded = set(archive["folded"])
+            exited = []
+            for path in directory.glob("*-*.json"):
+                if path.name not in folded:
+                    pid = path.name.split("-", 1)[0]
+                    if not pid.isdigit() or _process_alive(int(pid)):
+                        continue
+                    try:
+                        _merge(archive["metrics"], json.loads(path.read_text()))
+                    except (OSError, ValueError):
+                        continue
+                exited.append(path)
+            if not exited:
+                return
+            archive["folded"] = [path.name for path in exited]
+            staging = archive_path.with_suffix(".tmp")
+            staging.write_text(json.dumps(archive))
+            os.replace(staging, archive_path)
+            for path in exited:
+                path.unlink(missing_ok=True)
+
+    def collect(self):
+        """Values of this process, or of every worker in multiprocess mode."""
+        directory = self._directory()
+        if directory is None:
+            return self.snapshot()
+        self.flush()
+        self._compact(directory)
+        merged = {}
+        for path in sorted(directory.glob("*.json")):
+            try:
+                snapshot = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            _merge(merged, snapshot["metrics"] if path.name == EXITED_SNAPSHOT else snapshot)
+        return merged
+
+    def render(self):
+        return render(self.collect())
+
+
+def _merge(merged, snapshot):
+    for name, metric in snapshot.items():
+        target = merged.setdefault(name, {**metric, "samples": []})
+        samples = {tuple(labels): value for labels, value in target["samples"]}
+        for labels, value in metric["samples"]:
+            key = tuple(labels)
+            current = samples.get(key)
+            if current is None:
+                samples[key] = value
+            elif metric["type"] == "histogram":
+                samples[key] = {
+                    "buckets": [a + b for a, b in zip(current["buckets"], value["buckets"])],
+                    "sum": current["sum"] + value["sum"],
+                    "count": current["count"] + value["count"],
+                }
+            else:
+                samples[key] = current + value
+        target["samples"] = [[list(key), value] for key, value in samples.items()]
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def render(snapshot):
+    lines = []
+    for name in sorted(snapshot):
+        metric = snapshot[name]
+        names = metric["labelnames"]
+        lines.append(f"# HELP {name} {_escape(metric['help'])}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for values, value in sorted(metric["samples"], key=lambda sample: sample[0]):
+            if metric["type"] == "histogram":
+                cumulative = 0
+                bounds = [_number(float(bound)) for bound in metric["buckets"]] + ["+Inf"]
+                for bound, count in zip(bounds, value["buckets"]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(names, values, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{_labels(names, values)} {_number(value['sum'])}")
+                lines.append(f"{name}_count{_labels(names, values)} {value['count']}")
+            else:
+                lines.append(f"{name}{_labels(names, values)} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+atexit.register(REGISTRY.flush)
+
+http_request_duration = REGISTRY.histogram(
+    "http_request_duration_seconds",
+    "Time spent serving a request, by route.",
+    ("route", "method", "status"),
+)
+db_lock_retries = REGISTRY.counter(
+    "db_lock_retries_total",
+    "Writes retried after SQLite reported the database as locked.",
+    ("operation",),
+)
+
+
+def _may_scrape(request):
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if token:
+        supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+        if constant_time_compare(supplied, token):
+            return True
+    return request.user.is_authenticated and request.user.is_staff
+
+
+def metrics_view(request):
+    """
+    Scrapers send METRICS_TOKEN as a bearer token; logged-in staff can look
+    too. METRICS_PUBLIC opens the endpoint to anyone, for deployments that
+    keep it on an internal network.
+    """
+    if not getattr(settings, "METRICS_PUBLIC", False) and not _may_scrape(request):
+        return HttpResponseForbidden("Metrics need the metrics token or a staff login.")
+    return HttpResponse(REGISTRY.render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,158 @@
+"""
+Per-view query budgets.
+
+Views declare the most queries one request may run, either with the
+`query_budget` decorator on a function view or handler method, or with a
+`query_budget` class attribute. On a viewset the attribute may be a dict
+keyed by action ("list", "retrieve", ...). Budgets count every query of the
+request, including session and user lookups, so they stay fixed as the data
+grows and an N+1 pattern shows up as a blown budget. Views that process
+input in chunks add a fixed allowance per chunk with `extend_query_budget`.
+
+QUERY_BUDGET_MODE decides what happens then: "raise" (tests and DEBUG)
+fails the request with QueryBudgetExceeded, "warn" logs a sample of
+offending requests, and "off" skips the check.
+"""
+
+import contextvars
+import logging
+import random
+import re
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .metrics import REGISTRY
+
+
+logger = logging.getLogger(__name__)
+
+query_budget_exceeded = REGISTRY.counter(
+    "query_budget_exceeded_total",
+    "Requests that ran more queries than their view's budget.",
+    ("route",),
+)
+
+_IN_LIST = re.compile(r"\((?:%s, )+%s\)")
+_REPORTED_SHAPES = 5
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(limit):
+    """Declare the query budget of a function view or a view handler method."""
+
+    def decorate(func):
+        func.query_budget = limit
+        return func
+
+    return decorate
+
+
+def extend_query_budget(queries):
+    """
+    Let the current request run `queries` more than its view declared. For
+    views whose work comes in batches: each batch grants a fixed allowance,
+    so the budget still catches queries that grow per row.
+    """
+    state = _state.get()
+    if state is not None and state.budget is not None:
+        state.budget += queries
+
+
+def view_budget(view_func, method):
+    """The budget declared for `view_func` when called with `method`, or None."""
+    budget = getattr(view_func, "query_budget", None)
+    if budget is not None:
+        return budget
+
+    cls = getattr(view_func, "cls", None) or getattr(view_func, "view_class", None)
+    if cls is None:
+        return None
+    actions = getattr(view_func, "actions", None)
+    handler_name = actions.get(method.lower()) if actions else method.lower()
+    handler = getattr(cls, handler_name, None) if handler_name else None
+    budget = getattr(handler, "query_budget", None)
+    if budget is not None:
+        return budget
+
+    budget = getattr(cls, "query_budget", None)
+    if isinstance(budget, dict):
+        return budget.get(handler_name)
+    return budget
+
+
+def sql_shape(sql):
+    return _IN_LIST.sub("(...)", " ".join(sql.split()))
+
+
+def budget_report(route, budget, statements):
+    shapes = Counter(sql_shape(sql) for sql in statements)
+    lines = [f"{route} ran {len(statements)} queries; its budget is {budget}."]
+    repeated = [(count, shape) for shape, count in shapes.most_common(_REPORTED_SHAPES) if count > 1]
+    if repeated:
+        lines.append("Repeated query shapes:")
+        lines.extend(f"  {count}x {shape}" for count, shape in repeated)
+    return "\n".join(lines)
+
+
+_state = contextvars.ContextVar("query_budget_state", default=None)
+
+
+class _BudgetState:
+    def __init__(self):
+        self.budget = None
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.statements.append(sql)
+        return execute(sql, params, many, context)
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def _mode(self):
+        mode = getattr(settings, "QUERY_BUDGET_MODE", "off")
+        if mode == "warn" and random.random() >= getattr(settings, "QUERY_BUDGET_SAMPLE_RATE", 1.0):
+            return "off"
+        return mode
+
+    def __call__(self, request):
+        mode = self._mode()
+        if mode == "off":
+            return self.get_response(request)
+
+        state = _BudgetState()
+        token = _state.set(state)
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(state))
+                response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        # A failed request already reports its own error; the queries its
+        # error page ran are not the view's.
+        if state.budget is None or len(state.statements) <= state.budget or response.status_code >= 500:
+            return response
+
+        match = getattr(request, "resolver_match", None)
+        route = (match.view_name if match else None) or request.path
+        report = budget_report(route, state.budget, state.statements)
+        if mode == "raise":
+            raise QueryBudgetExceeded(report)
+        query_budget_exceeded.inc(route=route)
+        logger.warning(report)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _state.get()
+        if state is not None:
+            state.budget = view_budget(view_func, request.method)
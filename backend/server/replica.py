@@ -0,0 +1,110 @@
+import contextvars
+import time
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.signing import BadSignature
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+@dataclass
+class _RoutingState:
+    use_replica: bool = False
+    wrote: bool = False
+
+
+_state = contextvars.ContextVar("replica_routing_state", default=None)
+
+
+def _replica_alias():
+    return getattr(settings, "DATABASE_REPLICA_ALIAS", "replica")
+
+
+class ReplicaRouter:
+    """
+    Send reads of REPLICA_ROUTED_APPS models to the replica while the current
+    request allows it. Writes always go to the primary, and the first write in
+    a request moves the rest of that request's reads back to the primary too.
+    Outside a request (shell, commands, tests) everything uses the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.use_replica:
+            return None
+        if model._meta.app_label not in getattr(settings, "REPLICA_ROUTED_APPS", ("api",)):
+            return None
+        return _replica_alias()
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+            state.use_replica = False
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica is a copy of the primary, so rows from either side relate.
+        return True
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Route safe-method requests to the replica unless the client wrote
+    recently. After a write, a signed cookie pins that client's reads to the
+    primary for REPLICA_STICKY_SECONDS so it reads its own writes.
+    """
+
+    cookie_name = "db_primary_until"
+    cookie_salt = "server.replica"
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = _RoutingState(use_replica=request.method in SAFE_METHODS and not self._pinned(request))
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote or request.method not in SAFE_METHODS:
+            window = getattr(settings, "REPLICA_STICKY_SECONDS", 5)
+            response.set_signed_cookie(
+                self.cookie_name,
+                str(time.time() + window),
+                salt=self.cookie_salt,
+                max_age=window,
+                httponly=True,
+                samesite=settings.SESSION_COOKIE_SAMESITE,
+                secure=settings.SESSION_COOKIE_SECURE,
+            )
+        return response
+
+    def _pinned(self, request):
+        try:
+            until = request.get_signed_cookie(self.cookie_name, salt=self.cookie_salt)
+        except (KeyError, BadSignature):
+            return False
+        try:
+            return float(until) > time.time()
+        except ValueError:
+            return False
+
+
+def copy_sqlite_database(source_alias=DEFAULT_DB_ALIAS, target_alias=None):
+    """
+    Copy-based "replication" for SQLite: snapshot the source into the target
+    with the online backup API. Readers on the target see the old snapshot
+    until the copy finishes.
+    """
+    target_alias = target_alias or _replica_alias()
+    source = connections[source_alias]
+    target = connections[target_alias]
+    source.ensure_connection()
+    target.ensure_connection()
+    source.connection.backup(target.connection)
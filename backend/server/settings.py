@@ -66,6 +66,8 @@ AUTH_USER_MODEL = "accounts.BusinessUser"
 LOGIN_REDIRECT_URL = '/admin/'
 
 MIDDLEWARE = [
+    "server.instrumentation.RequestMetricsMiddleware",
+    "server.query_budget.QueryBudgetMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -103,6 +105,100 @@ DATABASES = {
     }
 }
 
+# "production" turns on WAL and the pragmas below for every new SQLite
+# connection, keeps connections open between requests, and starts write
+# transactions with BEGIN IMMEDIATE so concurrent checkouts queue on the
+# busy timeout instead of failing a read-to-write lock upgrade.
+DJANGO_DB_PROFILE = os.getenv("DJANGO_DB_PROFILE", "development")
+SQLITE_PRODUCTION_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": int(os.getenv("DJANGO_SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.getenv("DJANGO_SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": -int(os.getenv("DJANGO_SQLITE_CACHE_KIB", str(64 * 1024))),
+    "temp_store": "MEMORY",
+}
+
+if DJANGO_DB_PROFILE == "production":
+    DATABASES["default"].update(
+        {
+            "CONN_MAX_AGE": int(os.getenv("DJANGO_DB_CONN_MAX_AGE", "600")),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {
+                "init_command": ";".join(
+                    f"PRAGMA {name}={value}" for name, value in SQLITE_PRODUCTION_PRAGMAS.items()
+                ),
+                "transaction_mode": "IMMEDIATE",
+                "timeout": SQLITE_PRODUCTION_PRAGMAS["busy_timeout"] / 1000,
+            },
+        }
+    )
+
+DATABASE_ROUTERS = []
+
+# Tenant sharding (see api/sharding.py). DJANGO_TENANT_SHARDS adds shard
+# databases as "alias=/path/to/file.sqlite3,alias2=..."; businesses without a
+# TenantShard entry live on TENANT_DEFAULT_SHARD.
+TENANT_SHARDS = ["default"]
+TENANT_DEFAULT_SHARD = os.getenv("DJANGO_TENANT_DEFAULT_SHARD", "default")
+TENANT_SHARD_CACHE_SECONDS = int(os.getenv("DJANGO_TENANT_SHARD_CACHE_SECONDS", "30"))
+for shard_entry in filter(None, os.getenv("DJANGO_TENANT_SHARDS", "").split(",")):
+    shard_alias, _, shard_name = shard_entry.partition("=")
+    DATABASES[shard_alias.strip()] = {**DATABASES["default"], "NAME": shard_name.strip()}
+    TENANT_SHARDS.append(shard_alias.strip())
+
+if len(TENANT_SHARDS) > 1:
+    DATABASE_ROUTERS.append("api.sharding.TenantShardRouter")
+    MIDDLEWARE.append("api.sharding.TenantShardMiddleware")
+
+# Optional read replica. Set DJANGO_DB_REPLICA_NAME to a second SQLite file
+# kept up to date with `manage.py sync_replica`; safe-method requests then
+# read api models from it (see server/replica.py).
+DATABASE_REPLICA_ALIAS = "replica"
+DATABASE_REPLICA_NAME = os.getenv("DJANGO_DB_REPLICA_NAME", "")
+REPLICA_ROUTED_APPS = ("api",)
+REPLICA_STICKY_SECONDS = int(os.getenv("DJANGO_REPLICA_STICKY_SECONDS", "5"))
+
+if DATABASE_REPLICA_NAME:
+    DATABASES[DATABASE_REPLICA_ALIAS] = {**DATABASES["default"], "NAME": DATABASE_REPLICA_NAME}
+    DATABASE_ROUTERS.append("server.replica.ReplicaRouter")
+    MIDDLEWARE.append("server.replica.ReplicaRoutingMiddleware")
+
+# Per-request SQL/pass build/push timings (see server/instrumentation.py).
+# A small fraction of requests is measured; each one gets a JSON log line,
+# printed when DJANGO_REQUEST_METRICS_LOG is set. The Server-Timing header
+# shows clients query counts and timings, so it is only on under DEBUG.
+REQUEST_METRICS_SAMPLE_RATE = float(os.getenv("DJANGO_REQUEST_METRICS_SAMPLE_RATE", "0.01"))
+REQUEST_METRICS_SERVER_TIMING = os.getenv("DJANGO_REQUEST_METRICS_SERVER_TIMING", str(DEBUG)) == "True"
+
+# Prometheus-format /metrics (see server/metrics.py). Under gunicorn, point
+# DJANGO_METRICS_MULTIPROC_DIR at an empty directory shared by the workers.
+# Scrapers send DJANGO_METRICS_TOKEN as a bearer token, staff can log in;
+# everyone else is refused unless DJANGO_METRICS_PUBLIC=True.
+METRICS_MULTIPROC_DIR = os.getenv("DJANGO_METRICS_MULTIPROC_DIR", "")
+METRICS_FLUSH_SECONDS = float(os.getenv("DJANGO_METRICS_FLUSH_SECONDS", "5"))
+METRICS_TOKEN = os.getenv("DJANGO_METRICS_TOKEN", "")
+METRICS_PUBLIC = os.getenv("DJANGO_METRICS_PUBLIC", "False") == "True"
+
+# Per-view query budgets (see server/query_budget.py): "raise" fails requests
+# that exceed their view's budget, "warn" logs a sample of them, "off" skips
+# the check. DEBUG raises (as do the test classes); production warns.
+QUERY_BUDGET_MODE = os.getenv("DJANGO_QUERY_BUDGET_MODE", "raise" if DEBUG else "warn")
+QUERY_BUDGET_SAMPLE_RATE = float(os.getenv("DJANGO_QUERY_BUDGET_SAMPLE_RATE", "0.1"))
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {
+        "server.instrumentation": {
+            "handlers": ["console"],
+            "level": "INFO" if os.getenv("DJANGO_REQUEST_METRICS_LOG", "False") == "True" else "WARNING",
+            "propagate": False,
+        },
+    },
+}
+
 STATIC_URL = "static/"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
@@ -152,3 +248,34 @@ APNS_KEY_ID = os.getenv("APNS_KEY_ID", "")
 APNS_TEAM_ID = os.getenv("APNS_TEAM_ID", APPLE_PASS_TEAM_ID)
 APNS_TOPIC = os.getenv("APNS_TOPIC", APPLE_PASS_TYPE_IDENTIFIER)
 APNS_ENV = os.getenv("APNS_ENV", "production")
+# Overrides the host APNS_ENV picks, e.g. to send pushes to api.apns_stub.
+APNS_ENDPOINT = os.getenv("APNS_ENDPOINT", "")
+
+# Prepared pass queue per station (see api/prepared.py): how many unclaimed
+# passes a station holds, how long they wait, and how long a claimed pass
+# can be downloaded again with its claim token.
+PREPARED_PASS_QUEUE_LENGTH = int(os.getenv("DJANGO_PREPARED_PASS_QUEUE_LENGTH", "5"))
+PREPARED_PASS_TTL_SECONDS = int(os.getenv("DJANGO_PREPARED_PASS_TTL_SECONDS", "900"))
+PREPARED_PASS_CLAIM_SECONDS = int(os.getenv("DJANGO_PREPARED_PASS_CLAIM_SECONDS", "300"))
+
+# Apple Wallet device logs (api/device_logs.py): lines kept in memory per
+# process, lines per write, seconds between background writes (0 runs no
+# writer thread; tests set it), lines accepted per request and days kept.
+PASSKIT_LOG_BUFFER_SIZE = int(os.getenv("DJANGO_PASSKIT_LOG_BUFFER_SIZE", "10000"))
+PASSKIT_LOG_BATCH_SIZE = int(os.getenv("DJANGO_PASSKIT_LOG_BATCH_SIZE", "300"))
+PASSKIT_LOG_FLUSH_SECONDS = float(os.getenv("DJANGO_PASSKIT_LOG_FLUSH_SECONDS", "5"))
+PASSKIT_LOG_MAX_LINES = int(os.getenv("DJANGO_PASSKIT_LOG_MAX_LINES", "100"))
+PASSKIT_LOG_RETENTION_DAYS = int(os.getenv("DJANGO_PASSKIT_LOG_RETENTION_DAYS", "14"))
+
+# Lifetime of the signed pass links the issue view hands out (api/pass_links.py).
+PASS_LINK_TTL_SECONDS = int(os.getenv("DJANGO_PASS_LINK_TTL_SECONDS", "600"))
+
+# Pass refresh after a business changes its branding (api/pass_refresh.py):
+# cards and registrations per query, the push rate devices refetch at, and
+# whether the job runs on a background thread (tests run it inline).
+PASS_REFRESH_CHUNK_SIZE = int(os.getenv("DJANGO_PASS_REFRESH_CHUNK_SIZE", "500"))
+PASS_REFRESH_PUSHES_PER_SECOND = float(os.getenv("DJANGO_PASS_REFRESH_PUSHES_PER_SECOND", "200"))
+PASS_REFRESH_IN_BACKGROUND = os.getenv("DJANGO_PASS_REFRESH_IN_BACKGROUND", "True") == "True"
+
+# Columnar transaction archive written by `manage.py archive_transactions`
+TRANSACTION_ARCHIVE_DIR = os.getenv("TRANSACTION_ARCHIVE_DIR", str(BASE_DIR / "archive"))
@@ -31,8 +31,11 @@ export default function PassDownloadPage() {
     process.env.NEXT_PUBLIC_PASS_API_BASE_URL?.replace(/\/$/, "") || API_BASE
 
   const passEndpoint = slugParam
-    ? `${passApiBase}/api/stations/public/${slugParam}/prepared-pass/?platform=apple&clear=false`
+    ? `${passApiBase}/api/stations/public/${slugParam}/prepared-pass/`
     : ""
+  // Claiming takes the next pass off the station's queue; the claim token
+  // lets this visitor download the same pass again if the prompt is missed.
+  const claimRef = React.useRef<string | null>(null)
 
   async function handleDownload() {
     if (!passEndpoint) {
@@ -42,15 +45,18 @@ export default function PassDownloadPage() {
     setDownloading(true)
     setMessage(null)
     try {
-      const probeUrl = passEndpoint.replace("platform=apple", "platform=json")
+      const probeUrl = claimRef.current
+        ? `${passEndpoint}?platform=json&claim=${encodeURIComponent(claimRef.current)}`
+        : `${passEndpoint}?platform=json`
       const response = await fetch(probeUrl)
       if (!response.ok) {
+        claimRef.current = null
         throw new Error("Pass not ready yet. Please ask staff to issue it again.")
       }
-      const url = passEndpoint.includes("ts=")
-        ? passEndpoint
-        : `${passEndpoint}${passEndpoint.includes("?") ? "&" : "?"}ts=${Date.now()}`
-      window.location.href = url
+      const data = (await response.json()) as { claim: string }
+      claimRef.current = data.claim
+      window.location.href =
+        `${passEndpoint}?platform=apple&claim=${encodeURIComponent(data.claim)}&ts=${Date.now()}`
       setMessage("If nothing happened, tap the button again or ensure the pass is staged.")
     } catch (err) {
       setMessage(err instanceof Error ? err.message : "Unable to download the pass right now.")